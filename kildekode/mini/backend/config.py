@@ -5,13 +5,31 @@
 DB_ROOT = "C:\\temp\\00imalink"  # Plass for lagrede data
 DB_PATH = f"{DB_ROOT}\\mini.db"  # Full sti til databasefilen
 LARGE_PATH = f"{DB_ROOT}\\large"  # Plass for lagring av store bilder
+THUMBNAIL_PACK_PATH = f"{DB_ROOT}\\thumbnails.pack"  # Pakkefil med alle miniatyrbilder, med indeks i .idx-filen ved siden av
+
+# Innstillinger for SQLite-tilkoblingene i database.py
+DB_SYNCHRONOUS = "NORMAL" # Trygt sammen med WAL, og mye raskere enn FULL ved import
+DB_MMAP_SIZE = 256 * 1024 * 1024 # Bytes av databasefilen som leses via minnemapping
+DB_CACHE_SIZE_KB = 64 * 1024 # Størrelse på SQLite sin side-cache per tilkobling
+DB_CACHED_STATEMENTS = 256 # Antall ferdig kompilerte SQL-setninger som gjenbrukes per tilkobling
+DB_BUSY_TIMEOUT = 10.0 # Sekunder en tilkobling venter på lås før den gir opp
 
 #DB_PATH = "C:\\temp\\00imalink\\mini.db" # Filen er nå plassert på en fast plass utenfor prosjektmappen
 THUMBNAIL_SIZE = (80, 80) # Bør være en optimal størrelse for lagring og visning
 LARGE_SIZE = (1600, 1600) # Størrelse for visning av bilder i fullskjerm
+PREVIEW_SIZES = (400, 800, 1600) # Lengste side for forhåndsvisninger som lages ved behov, f.eks. for srcset
+CREATE_PREVIEWS_ON_IMPORT = True # Lag forhåndsvisning i LARGE_SIZE ved import; ellers lages den første gang den vises
 COMMON_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 RAW_EXTENSIONS = {'cr2', 'nef', 'arw'}
 ALLOWED_EXTENSIONS = COMMON_EXTENSIONS.union(RAW_EXTENSIONS)
+DISCOVERY_WALKERS = 1 # Antall tråder som leter etter filer; flere hjelper på nettverksdisker og eksterne disker
+DISCOVERY_QUEUE_SIZE = 10_000 # Maks antall funne filer som venter på å bli behandlet
+IMPORT_BATCH_SIZE = 500 # Antall rader som skrives til databasen i hver transaksjon under import
+BLOOM_FILTER_THRESHOLD = 5_000_000 # Over dette antallet bilder brukes Bloom-filter i stedet for eksakt hash-sett ved import
+BLOOM_FILTER_ERROR_RATE = 0.001 # Andel falske treff i Bloom-filteret; treff sjekkes mot databasen
+NEAR_DUPLICATE_DISTANCE = 6 # Maks antall ulike bit i perseptuell hash for at to bilder regnes som nesten like
+GALLERY_CACHE_BYTES = 64 * 1024 * 1024 # Minne galleriet bruker til å holde nylig viste miniatyrbilder
+GALLERY_IO_THREADS = 16 # Tråder som leser database og filer for ASGI-utgaven av galleriet (gallery_asgi.py)
 
 if __name__ == "__main__":
     print(f"Konfigurasjon:\nDB_PATH: {DB_PATH}\nTHUMBNAIL_SIZE: {THUMBNAIL_SIZE}\nALLOWED_EXTENSIONS: {ALLOWED_EXTENSIONS}")
\ No newline at end of file
@@ -1,32 +1,137 @@
+import base64
+import datetime
+import json
+import os
+import re
 import sqlite3
+import threading
 from contextlib import contextmanager
-from typing import Optional, List, Iterator
+from typing import Optional, List, Iterator, Iterable, Tuple, Dict, Callable, Union
 
-from config import DB_PATH
-from models import SourceFile
+from config import (DB_PATH, IMPORT_BATCH_SIZE, DB_BUSY_TIMEOUT, DB_CACHED_STATEMENTS, DB_SYNCHRONOUS,
+                    DB_MMAP_SIZE, DB_CACHE_SIZE_KB)
+from models import SourceFile, ScanManifestEntry, LocationCluster, sourcefile_row_type
+from services import exif as exif_service
+from services.exif import ImageMetadata, METADATA_VERSION
+from services.thumbpack import get_thumbnail_pack
+
+# Callbacks notified after rows in sourcefiles are committed, see add_change_listener
+ChangeListener = Callable[[str, int, Optional[str]], None]
+_change_listeners: List[ChangeListener] = []
+
+# Default columns for listing queries: everything except the BLOBs
+LISTING_FIELDS = ('id', 'filename', 'image_hash')
+
+
+def add_change_listener(listener: ChangeListener):
+    """
+    Registers a callback that is called as listener(event, sourcefile_id, image_hash)
+    after a source file is changed through this module. event is "insert", "update"
+    or "delete". Used to keep in-memory indexes and caches in sync with the table.
+    """
+    if listener not in _change_listeners:
+        _change_listeners.append(listener)
+
+
+def remove_change_listener(listener: ChangeListener):
+    if listener in _change_listeners:
+        _change_listeners.remove(listener)
+
+
+def _notify_change(event: str, sourcefile_id: int, image_hash: Optional[str]):
+    for listener in list(_change_listeners):
+        listener(event, sourcefile_id, image_hash)
+
+
+# One connection per thread (and process), reused by all functions in this module
+_local = threading.local()
+
+
+def _connect() -> sqlite3.Connection:
+    """Opens a new connection and applies the PRAGMA settings from config."""
+    conn = sqlite3.connect(DB_PATH, timeout=DB_BUSY_TIMEOUT, cached_statements=DB_CACHED_STATEMENTS)
+    conn.row_factory = sqlite3.Row
+    # WAL lets readers (the gallery) work while the importer writes, and makes
+    # synchronous=NORMAL safe: commits no longer wait for an fsync of the database file.
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute(f'PRAGMA synchronous = {DB_SYNCHRONOUS}')
+    conn.execute(f'PRAGMA mmap_size = {int(DB_MMAP_SIZE)}')
+    conn.execute(f'PRAGMA cache_size = {-int(DB_CACHE_SIZE_KB)}')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    return conn
+
+
+def _get_thread_connection() -> sqlite3.Connection:
+    """Returns the calling thread's connection, opening it on first use."""
+    conn = getattr(_local, 'conn', None)
+    # A forked child process must not share the parent's connection, and a changed DB_PATH needs a new one
+    if conn is not None and (_local.pid != os.getpid() or _local.path != DB_PATH):
+        if _local.pid == os.getpid():
+            conn.close()
+        conn = None
+    if conn is None:
+        conn = _connect()
+        _local.conn = conn
+        _local.pid = os.getpid()
+        _local.path = DB_PATH
+        _local.depth = 0
+    return conn
+
+
+def close_db_connection():
+    """Closes the calling thread's connection. A new one is opened on the next database call."""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.pid == os.getpid():
+        conn.close()
+    _local.conn = None
 
 
 @contextmanager
 def _get_db_connection() -> Iterator[sqlite3.Connection]:
     """
-    Context manager for safe database connections.
-    Handles connection, commit, rollback, and closing.
+    Context manager for safe database access on the calling thread's persistent connection.
+    Handles commit and rollback; nested use commits only when the outermost block exits.
     """
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    conn = _get_thread_connection()
+    _local.depth += 1
     try:
         yield conn
-        conn.commit()
+        if _local.depth == 1:
+            conn.commit()
     except sqlite3.Error as e:
-        print(f"Database error: {e}")
-        conn.rollback()
+        if _local.depth == 1:
+            print(f"Database error: {e}")
+            conn.rollback()
+        raise
+    except BaseException:
+        if _local.depth == 1:
+            conn.rollback()
         raise
     finally:
-        conn.close()
+        _local.depth -= 1
+
+
+# Columns added after the first version of the sourcefiles table, with their definitions
+_SOURCEFILE_MIGRATIONS = {
+    'taken_at': 'TEXT',
+    'lat': 'REAL',
+    'lon': 'REAL',
+    'metadata_version': 'INTEGER NOT NULL DEFAULT 0',
+    'raw_filename': 'TEXT',
+    'camera': 'TEXT',
+}
+
+
+def _add_missing_columns(c: sqlite3.Cursor, table: str, columns: Dict[str, str]):
+    """Adds the given columns to an existing table if they are missing."""
+    existing = {row[1] for row in c.execute(f'PRAGMA table_info({table})')}
+    for name, definition in columns.items():
+        if name not in existing:
+            c.execute(f'ALTER TABLE {table} ADD COLUMN {name} {definition}')
 
 
 def init_db():
-    """Initializes the database and creates the sourcefiles table if it doesn't exist."""
+    """Initializes the database and creates the tables if they don't exist."""
     with _get_db_connection() as conn:
         c = conn.cursor()
         c.execute('''
@@ -35,42 +140,358 @@ def init_db():
                 filename TEXT NOT NULL,
                 image_hash TEXT,
                 thumbnail BLOB,
-                exif_data BLOB
+                exif_data BLOB,
+                raw_filename TEXT,
+                taken_at TEXT,
+                lat REAL,
+                lon REAL,
+                camera TEXT,
+                metadata_version INTEGER NOT NULL DEFAULT 0
             )
         ''')
+        _add_missing_columns(c, 'sourcefiles', _SOURCEFILE_MIGRATIONS)
         c.execute('''
             CREATE UNIQUE INDEX IF NOT EXISTS idx_image_hash ON sourcefiles(image_hash)
         ''')
+        c.execute('''
+            CREATE INDEX IF NOT EXISTS idx_taken_at ON sourcefiles(taken_at)
+        ''')
+        c.execute('''
+            CREATE INDEX IF NOT EXISTS idx_lat_lon ON sourcefiles(lat, lon)
+        ''')
+        c.execute('''
+            CREATE INDEX IF NOT EXISTS idx_camera_taken_at ON sourcefiles(camera, taken_at)
+        ''')
+        c.execute('''
+            CREATE INDEX IF NOT EXISTS idx_metadata_version ON sourcefiles(metadata_version)
+        ''')
+        # Size, modification time and fingerprint of every scanned file, used to skip unchanged files on rescan
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS scan_manifest (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                fingerprint TEXT NOT NULL,
+                image_hash TEXT
+            )
+        ''')
+        c.execute('''
+            CREATE INDEX IF NOT EXISTS idx_scan_manifest_hash ON scan_manifest(image_hash)
+        ''')
+        _create_filename_index(c)
+        _create_location_index(c)
+        _create_timeline(c)
+
+
+def _create_filename_index(c: sqlite3.Cursor):
+    """
+    Creates the full-text index of file names used by search_filenames. It is an FTS5
+    table with sourcefiles as external content, so only the index is stored, and it is
+    kept in sync by triggers. The trigram tokenizer indexes every three characters, so
+    any part of a path of three or more characters can be found, as with a substring
+    search. An index made with the earlier word tokenizer is replaced.
+    """
+    row = c.execute("SELECT sql FROM sqlite_master WHERE name = 'sourcefiles_fts'").fetchone()
+    exists = row is not None and 'trigram' in row[0]
+    if row is not None and not exists:
+        c.execute('DROP TABLE sourcefiles_fts')
+    c.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS sourcefiles_fts USING fts5(
+            filename, raw_filename,
+            content = 'sourcefiles', content_rowid = 'id',
+            tokenize = 'trigram'
+        )
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS sourcefiles_fts_insert AFTER INSERT ON sourcefiles BEGIN
+            INSERT INTO sourcefiles_fts (rowid, filename, raw_filename) VALUES (new.id, new.filename, new.raw_filename);
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS sourcefiles_fts_delete AFTER DELETE ON sourcefiles BEGIN
+            INSERT INTO sourcefiles_fts (sourcefiles_fts, rowid, filename, raw_filename)
+            VALUES ('delete', old.id, old.filename, old.raw_filename);
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS sourcefiles_fts_update AFTER UPDATE OF filename, raw_filename ON sourcefiles BEGIN
+            INSERT INTO sourcefiles_fts (sourcefiles_fts, rowid, filename, raw_filename)
+            VALUES ('delete', old.id, old.filename, old.raw_filename);
+            INSERT INTO sourcefiles_fts (rowid, filename, raw_filename) VALUES (new.id, new.filename, new.raw_filename);
+        END
+    ''')
+    if not exists:
+        # Index the rows of a database created before the index existed
+        c.execute("INSERT INTO sourcefiles_fts (sourcefiles_fts) VALUES ('rebuild')")
+
+
+def _create_location_index(c: sqlite3.Cursor):
+    """
+    Creates the R*Tree of photo positions used by cluster_locations. Each geotagged
+    row is a point (min = max) keyed by its ID. Triggers on the lat and lon columns
+    keep it in sync, so it is filled by imports, updates and the metadata backfill.
+    """
+    exists = c.execute("SELECT 1 FROM sqlite_master WHERE name = 'sourcefiles_rtree'").fetchone()
+    c.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS sourcefiles_rtree USING rtree(id, min_lat, max_lat, min_lon, max_lon)
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS sourcefiles_rtree_insert AFTER INSERT ON sourcefiles
+        WHEN new.lat IS NOT NULL AND new.lon IS NOT NULL BEGIN
+            INSERT INTO sourcefiles_rtree VALUES (new.id, new.lat, new.lat, new.lon, new.lon);
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS sourcefiles_rtree_delete AFTER DELETE ON sourcefiles
+        WHEN old.lat IS NOT NULL AND old.lon IS NOT NULL BEGIN
+            DELETE FROM sourcefiles_rtree WHERE id = old.id;
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS sourcefiles_rtree_update AFTER UPDATE OF lat, lon ON sourcefiles BEGIN
+            DELETE FROM sourcefiles_rtree WHERE id = old.id;
+            INSERT INTO sourcefiles_rtree
+            SELECT new.id, new.lat, new.lat, new.lon, new.lon WHERE new.lat IS NOT NULL AND new.lon IS NOT NULL;
+        END
+    ''')
+    if not exists:
+        # Index the rows of a database created before the index existed
+        c.execute('''
+            INSERT INTO sourcefiles_rtree
+            SELECT id, lat, lat, lon, lon FROM sourcefiles WHERE lat IS NOT NULL AND lon IS NOT NULL
+        ''')
+
+
+# Length of the taken_at prefix ('YYYY-MM-DD HH:MM:SS') that names a bucket of each timeline granularity
+_TIMELINE_GRANULARITIES = {'year': 4, 'month': 7, 'day': 10}
+
+# The (granularity, bucket) pairs a row is counted in, for the row named new or old in a trigger
+_TIMELINE_BUCKETS = '''
+    ('year', substr({row}.taken_at, 1, 4)), ('month', substr({row}.taken_at, 1, 7)), ('day', substr({row}.taken_at, 1, 10))
+'''
+
+
+def _create_timeline(c: sqlite3.Cursor):
+    """
+    Creates the timeline table used by timeline(): the number of photos taken in each
+    year, month and day. Triggers on the taken_at column add and subtract the changed
+    rows, so it stays in sync with imports, updates, deletes and the metadata backfill
+    without counting the whole table. Buckets are removed when their count reaches zero.
+    """
+    exists = c.execute("SELECT 1 FROM sqlite_master WHERE name = 'timeline'").fetchone()
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS timeline (
+            granularity TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (granularity, bucket)
+        ) WITHOUT ROWID
+    ''')
+    add = f'''
+        INSERT INTO timeline (granularity, bucket, count)
+        SELECT column1, column2, 1 FROM (VALUES {_TIMELINE_BUCKETS.format(row='new')}) WHERE new.taken_at IS NOT NULL
+        ON CONFLICT (granularity, bucket) DO UPDATE SET count = count + 1;
+    '''
+    subtract = f'''
+        UPDATE timeline SET count = count - 1
+        WHERE (granularity, bucket) IN (VALUES {_TIMELINE_BUCKETS.format(row='old')});
+        DELETE FROM timeline WHERE count = 0 AND (granularity, bucket) IN (VALUES {_TIMELINE_BUCKETS.format(row='old')});
+    '''
+    c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS timeline_insert AFTER INSERT ON sourcefiles
+        WHEN new.taken_at IS NOT NULL BEGIN {add} END
+    ''')
+    c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS timeline_delete AFTER DELETE ON sourcefiles
+        WHEN old.taken_at IS NOT NULL BEGIN {subtract} END
+    ''')
+    c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS timeline_update AFTER UPDATE OF taken_at ON sourcefiles
+        WHEN old.taken_at IS NOT new.taken_at BEGIN {subtract} {add} END
+    ''')
+    if not exists:
+        # Count the rows of a database created before the timeline existed
+        for granularity, length in _TIMELINE_GRANULARITIES.items():
+            c.execute('''
+                INSERT INTO timeline (granularity, bucket, count)
+                SELECT ?, substr(taken_at, 1, ?) AS bucket, COUNT(*) FROM sourcefiles
+                WHERE taken_at IS NOT NULL
+                GROUP BY bucket
+            ''', (granularity, length))
+
+
+def _store_thumbnails(items: List[Tuple[Optional[str], Optional[bytes]]]) -> List[Optional[bytes]]:
+    """
+    Writes thumbnails to the thumbnail pack before the rows that refer to them are committed.
+    Returns the value for each row's thumbnail column: None, unless the row has no image hash
+    to key the pack by, in which case the thumbnail stays in the table.
+    """
+    get_thumbnail_pack().put_many((h, thumbnail) for h, thumbnail in items if h and thumbnail)
+    return [None if h else thumbnail for h, thumbnail in items]
+
 
+def _load_thumbnail(image_hash: Optional[str], blob: Optional[bytes]) -> Optional[bytes]:
+    """The thumbnail of a row: from the table for rows not yet moved to the pack, otherwise from the pack."""
+    if blob or not image_hash:
+        return blob
+    view = get_thumbnail_pack().get(image_hash)
+    return bytes(view) if view is not None else None
 
-def add_sourcefile(filename: str, image_hash: str, thumbnail: Optional[bytes], exif_data: Optional[bytes]) -> int:
-    """Adds a new source file to the database and returns its ID."""
+
+_INSERT_SOURCEFILE = '''
+    INSERT INTO sourcefiles (filename, image_hash, thumbnail, exif_data, raw_filename, taken_at, lat, lon, camera, metadata_version)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+def add_sourcefile(filename: str, image_hash: str, thumbnail: Optional[bytes], exif_data: Optional[bytes],
+                   raw_filename: Optional[str] = None) -> int:
+    """
+    Adds a new source file to the database and returns its ID.
+    The indexed metadata columns are filled from exif_data, and the thumbnail is
+    stored in the thumbnail pack (see services.thumbpack).
+    raw_filename is the RAW file shot together with a JPEG, if any.
+    """
+    metadata = exif_service.parse_indexed_metadata(exif_data)
+    thumbnail = _store_thumbnails([(image_hash, thumbnail)])[0]
     with _get_db_connection() as conn:
         c = conn.cursor()
-        c.execute('''
-            INSERT INTO sourcefiles (filename, image_hash, thumbnail, exif_data)
-            VALUES (?, ?, ?, ?)
-        ''', (filename, image_hash, thumbnail, exif_data))
+        c.execute(_INSERT_SOURCEFILE, (filename, image_hash, thumbnail, exif_data, raw_filename, *metadata, METADATA_VERSION))
         last_id = c.lastrowid
         if last_id is None:
             raise sqlite3.Error("Could not retrieve last inserted ID.")
-        return last_id
+    _notify_change("insert", last_id, image_hash)
+    return last_id
+
+
+class BatchWriteError(Exception):
+    """
+    A batch of SourceFileBatchWriter rows could not be written. None of them were added.
+    rows holds the arguments the rows were queued with, so they can be added again.
+    """
+
+    def __init__(self, rows: List[tuple], cause: BaseException):
+        super().__init__(f"Could not write {len(rows)} source files to the database: {cause}")
+        self.rows = rows
+
+    @property
+    def filenames(self) -> List[str]:
+        return [row[0] for row in self.rows]
+
+
+class SourceFileBatchWriter:
+    """
+    Buffers new source files and inserts them in batches, one transaction
+    per batch, so the cost of a commit is shared by many rows.
+    Pending rows are written when the batch is full, on flush(), and when
+    the context manager exits without an error.
+
+    Usage:
+        with SourceFileBatchWriter(batch_size=500) as writer:
+            writer.add(filename, image_hash, thumbnail, exif_data)
+    """
+
+    def __init__(self, batch_size: int = IMPORT_BATCH_SIZE):
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        self.batch_size = batch_size
+        self.written_count = 0
+        self._rows: List[tuple] = []
+
+    def __enter__(self) -> "SourceFileBatchWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._rows)
+
+    def add(self, filename: str, image_hash: str, thumbnail: Optional[bytes], exif_data: Optional[bytes],
+            metadata: Optional[ImageMetadata] = None, raw_filename: Optional[str] = None) -> List[int]:
+        """
+        Queues a source file for insertion. metadata is parsed from exif_data unless
+        it is given, which lets the importer do the parsing in its worker processes.
+        raw_filename is the RAW file paired with a JPEG, as in add_sourcefile.
+        Returns the IDs of the rows written if this call filled the batch, otherwise an empty list.
+        """
+        if metadata is None:
+            metadata = exif_service.parse_indexed_metadata(exif_data)
+        self._rows.append((filename, image_hash, thumbnail, exif_data, metadata, raw_filename))
+        if len(self._rows) >= self.batch_size:
+            return self.flush()
+        return []
+
+    def flush(self) -> List[int]:
+        """
+        Writes all pending rows in a single transaction and returns their IDs in insertion order.
+        The rows stay queued until the transaction is committed. If it fails, they are taken
+        off the queue, so the next add() does not retry them, and raised with a BatchWriteError.
+        """
+        if not self._rows:
+            return []
+        rows = self._rows
+        try:
+            thumbnails = _store_thumbnails([(row[1], row[2]) for row in rows])
+            ids = []
+            with _get_db_connection() as conn:
+                c = conn.cursor()
+                for (filename, image_hash, _, exif_data, metadata, raw_filename), thumbnail in zip(rows, thumbnails):
+                    c.execute(_INSERT_SOURCEFILE, (filename, image_hash, thumbnail, exif_data, raw_filename,
+                                                   *metadata, METADATA_VERSION))
+                    # IDs are not always consecutive, e.g. once the largest rowid is taken
+                    ids.append(c.lastrowid)
+        except Exception as e:
+            self._rows = []
+            raise BatchWriteError(rows, e) from e
+        self._rows = []
+        self.written_count += len(rows)
+        for new_id, row in zip(ids, rows):
+            _notify_change("insert", new_id, row[1])
+        return ids
+
+
+def add_sourcefiles(rows: Iterable[Tuple[str, str, Optional[bytes], Optional[bytes]]], batch_size: int = IMPORT_BATCH_SIZE) -> List[int]:
+    """
+    Adds many source files, given as (filename, image_hash, thumbnail, exif_data) tuples,
+    in batched transactions and returns their IDs in the same order.
+    """
+    ids: List[int] = []
+    with SourceFileBatchWriter(batch_size=batch_size) as writer:
+        for row in rows:
+            ids.extend(writer.add(*row))
+        ids.extend(writer.flush())
+    return ids
+
+
+_SOURCEFILE_COLUMNS = 'id, filename, image_hash, thumbnail, exif_data, raw_filename, taken_at, lat, lon, camera'
+
+
+def _row_to_sourcefile(row: sqlite3.Row) -> SourceFile:
+    return SourceFile(
+        id=row['id'],
+        filename=row['filename'],
+        image_hash=row['image_hash'],
+        thumbnail=_load_thumbnail(row['image_hash'], row['thumbnail']),
+        exif_data=row['exif_data'],
+        raw_filename=row['raw_filename'],
+        taken_at=row['taken_at'],
+        lat=row['lat'],
+        lon=row['lon'],
+        camera=row['camera']
+    )
 
 
 def get_sourcefile_by_id(sourcefile_id: int) -> Optional[SourceFile]:
     """Retrieves a source file by its ID."""
     with _get_db_connection() as conn:
         c = conn.cursor()
-        c.execute('SELECT id, filename, image_hash, thumbnail, exif_data FROM sourcefiles WHERE id = ?', (sourcefile_id,))
+        c.execute(f'SELECT {_SOURCEFILE_COLUMNS} FROM sourcefiles WHERE id = ?', (sourcefile_id,))
         row = c.fetchone()
     if row:
-        return SourceFile(
-            id=row['id'],
-            filename=row['filename'],
-            image_hash=row['image_hash'],
-            thumbnail=row['thumbnail'],
-            exif_data=row['exif_data']
-        )
+        return _row_to_sourcefile(row)
     return None
 
 
@@ -78,24 +499,53 @@ def get_sourcefile_by_hash(image_hash: str) -> Optional[SourceFile]:
     """Retrieves a source file by its image hash."""
     with _get_db_connection() as conn:
         c = conn.cursor()
-        c.execute('SELECT id, filename, image_hash, thumbnail, exif_data FROM sourcefiles WHERE image_hash = ?', (image_hash,))
+        c.execute(f'SELECT {_SOURCEFILE_COLUMNS} FROM sourcefiles WHERE image_hash = ?', (image_hash,))
         row = c.fetchone()
     if row:
-        return SourceFile(
-            id=row['id'],
-            filename=row['filename'],
-            image_hash=row['image_hash'],
-            thumbnail=row['thumbnail'],
-            exif_data=row['exif_data']
-        )
+        return _row_to_sourcefile(row)
     return None
 
 
+def image_hash_exists(image_hash: str) -> bool:
+    """Checks whether a source file with the given image hash exists, without loading the row."""
+    with _get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute('SELECT 1 FROM sourcefiles WHERE image_hash = ?', (image_hash,))
+        return c.fetchone() is not None
+
+
+def iter_image_hashes() -> Iterator[str]:
+    """Yields the image hash of every source file. Only the hash index is read."""
+    # Read-only generators use the connection directly, so a suspended generator does not hold a transaction open
+    c = _get_thread_connection().execute('SELECT image_hash FROM sourcefiles WHERE image_hash IS NOT NULL')
+    for row in c:
+        yield row[0]
+
+
+def iter_sourcefile_hashes(min_id: int = 0) -> Iterator[Tuple[int, str]]:
+    """Yields (id, image_hash) for every source file with an ID above min_id, in ID order."""
+    c = _get_thread_connection().execute('''
+        SELECT id, image_hash FROM sourcefiles
+        WHERE id > ? AND image_hash IS NOT NULL
+        ORDER BY id
+    ''', (min_id,))
+    for row in c:
+        yield row[0], row[1]
+
+
+def count_sourcefiles() -> int:
+    """Returns the number of source files in the database."""
+    with _get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute('SELECT COUNT(*) FROM sourcefiles')
+        return c.fetchone()[0]
+
+
 def get_all_sourcefiles(limit: Optional[int] = None) -> List[SourceFile]:
     """Retrieves all source files from the database, newest first."""
     with _get_db_connection() as conn:
         c = conn.cursor()
-        query = 'SELECT id, filename, image_hash, thumbnail, exif_data FROM sourcefiles ORDER BY id DESC'
+        query = f'SELECT {_SOURCEFILE_COLUMNS} FROM sourcefiles ORDER BY id DESC'
         params = []
         if limit:
             query += ' LIMIT ?'
@@ -103,35 +553,539 @@ def get_all_sourcefiles(limit: Optional[int] = None) -> List[SourceFile]:
         
         c.execute(query, params)
         rows = c.fetchall()
-    return [
-        SourceFile(
-            id=row['id'],
-            filename=row['filename'],
-            image_hash=row['image_hash'],
-            thumbnail=row['thumbnail'],
-            exif_data=row['exif_data']
-        ) for row in rows
-    ]
+    return [_row_to_sourcefile(row) for row in rows]
+
+
+def list_sourcefiles(fields: Iterable[str] = LISTING_FIELDS, limit: Optional[int] = None) -> List[tuple]:
+    """
+    Lists source files, newest first, reading only the given columns.
+    Returns lightweight named tuples (see models.sourcefile_row_type) instead of SourceFile
+    objects, so the thumbnail and EXIF BLOBs are only read when they are asked for.
+    """
+    fields = tuple(fields)
+    row_type = sourcefile_row_type(fields)
+    # Field names are checked against SOURCEFILE_FIELDS by sourcefile_row_type
+    columns, to_values = _projection(fields)
+    with _get_db_connection() as conn:
+        c = conn.cursor()
+        query = f'SELECT {columns} FROM sourcefiles ORDER BY id DESC'
+        params = []
+        if limit:
+            query += ' LIMIT ?'
+            params.append(limit)
+        c.execute(query, params)
+        rows = c.fetchall()
+    return [row_type._make(to_values(tuple(row))) for row in rows]
+
+
+def _projection(fields: Tuple[str, ...]) -> Tuple[str, Callable[[tuple], tuple]]:
+    """
+    Returns the SQL column list for the given fields, and a function that turns a
+    result row into the field values. Thumbnails are looked up in the thumbnail pack,
+    so image_hash is selected as an extra last column when they are asked for.
+    """
+    if 'thumbnail' not in fields:
+        return ", ".join(fields), tuple
+    position = fields.index('thumbnail')
+
+    def to_values(row: tuple) -> tuple:
+        values = list(row[:len(fields)])
+        values[position] = _load_thumbnail(row[-1], values[position])
+        return tuple(values)
+
+    return ", ".join(fields + ('image_hash',)), to_values
+
+
+def get_thumbnail(sourcefile_id: int) -> Optional[Tuple[Optional[str], Union[memoryview, bytes]]]:
+    """
+    Returns (image_hash, thumbnail) for a source file without loading the rest of the row.
+    Thumbnails in the pack are returned as a memoryview of the mapped pack file, without copying.
+    """
+    return get_thumbnails([sourcefile_id]).get(sourcefile_id)
+
+
+def get_image_hashes(sourcefile_ids: Iterable[int]) -> Dict[int, Optional[str]]:
+    """Returns the image hash of each of the given source files that exists, keyed by ID, with a single query."""
+    sourcefile_ids = list(sourcefile_ids)
+    if not sourcefile_ids:
+        return {}
+    with _get_db_connection() as conn:
+        c = conn.cursor()
+        placeholders = ", ".join("?" * len(sourcefile_ids))
+        c.execute(f'SELECT id, image_hash FROM sourcefiles WHERE id IN ({placeholders})', sourcefile_ids)
+        return {row[0]: row[1] for row in c.fetchall()}
+
+
+def get_thumbnails(sourcefile_ids: Iterable[int]) -> Dict[int, Tuple[Optional[str], Union[memoryview, bytes]]]:
+    """
+    Returns (image_hash, thumbnail) for many source files with a single query, keyed by ID.
+    Rows without a thumbnail are left out.
+    """
+    sourcefile_ids = list(sourcefile_ids)
+    if not sourcefile_ids:
+        return {}
+    with _get_db_connection() as conn:
+        c = conn.cursor()
+        placeholders = ", ".join("?" * len(sourcefile_ids))
+        c.execute(f'SELECT id, image_hash, thumbnail FROM sourcefiles WHERE id IN ({placeholders})', sourcefile_ids)
+        rows = c.fetchall()
+    pack = get_thumbnail_pack()
+    thumbnails = {}
+    for sourcefile_id, image_hash, blob in rows:
+        thumbnail = blob if blob or not image_hash else pack.get(image_hash)
+        if thumbnail:
+            thumbnails[sourcefile_id] = (image_hash, thumbnail)
+    return thumbnails
+
+
+_SQLITE_INT_MIN, _SQLITE_INT_MAX = -2 ** 63, 2 ** 63 - 1
+
+
+def _encode_cursor(key: Tuple) -> str:
+    """Encodes the sort key of the last row on a page as an opaque, URL-safe token."""
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode().rstrip('=')
+
+
+def _decode_cursor(cursor: str) -> Tuple:
+    """Decodes a token from _encode_cursor. Raises ValueError for tokens that were not made by it."""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+    # Only values sqlite3 can bind: integers must fit in a signed 64-bit INTEGER
+    if not isinstance(key, list) or not all(
+            value is None or isinstance(value, (str, float))
+            or (type(value) is int and _SQLITE_INT_MIN <= value <= _SQLITE_INT_MAX) for value in key):
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return tuple(key)
+
+
+def list_sourcefiles_page(fields: Iterable[str] = LISTING_FIELDS, limit: int = 100,
+                          cursor: Optional[str] = None) -> Tuple[List[tuple], Optional[str]]:
+    """
+    Returns one page of source files, newest first, and the cursor for the next page
+    (None on the last page). Uses keyset pagination on the primary key, so the cost of
+    a page does not depend on how deep into the catalog it is.
+    Raises ValueError for an invalid cursor or a limit below 1.
+    """
+    if limit < 1:
+        raise ValueError("limit must be at least 1")
+    fields = tuple(fields)
+    row_type = sourcefile_row_type(fields)
+    # The ID is always selected, since it is the key of the next cursor
+    columns, to_values = _projection(fields)
+    query = f'SELECT id, {columns} FROM sourcefiles'
+    params: list = []
+    if cursor:
+        key = _decode_cursor(cursor)
+        if len(key) != 1 or not isinstance(key[0], int):
+            raise ValueError(f"Invalid cursor: {cursor!r}")
+        query += ' WHERE id < ?'
+        params.append(key[0])
+    query += ' ORDER BY id DESC LIMIT ?'
+    params.append(limit)
+    with _get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute(query, params)
+        rows = c.fetchall()
+    next_cursor = _encode_cursor((rows[-1][0],)) if len(rows) == limit else None
+    return [row_type._make(to_values(tuple(row)[1:])) for row in rows], next_cursor
+
+
+def iter_sourcefiles(fields: Iterable[str] = LISTING_FIELDS, batch_size: int = 500,
+                     cursor: Optional[str] = None) -> Iterator[tuple]:
+    """
+    Streams all source files, newest first, fetching batch_size rows at a time.
+    Memory use is constant regardless of the size of the catalog.
+    """
+    fields = tuple(fields)
+    while True:
+        rows, cursor = list_sourcefiles_page(fields, batch_size, cursor)
+        yield from rows
+        if cursor is None:
+            return
+
+
+# The trigram index can only look up text of at least this many characters
+_TRIGRAM = 3
+
+
+def _like_pattern(word: str) -> str:
+    """A LIKE pattern (with ESCAPE '\\') matching text that contains word."""
+    return '%' + re.sub(r'([\\%_])', r'\\\1', word) + '%'
+
+
+def _filename_search_sql(columns: str, text: str, limit: int) -> Optional[Tuple[str, list]]:
+    """
+    Builds the SQL for search_filenames. Every word of the search text must be part of
+    the path or the RAW file name, ignoring case, as in a substring search. Words of
+    three or more characters are looked up in the trigram index; shorter words cannot
+    be, and are checked with LIKE on the rows found, or, if all words are short, on
+    the rows newest first until limit matches are found.
+    """
+    words = text.split()
+    if not words:
+        return None
+    long_words = [word for word in words if len(word) >= _TRIGRAM]
+    params: list = []
+    where = []
+    for word in words:
+        if len(word) < _TRIGRAM:
+            where.append("(filename LIKE ? ESCAPE '\\' OR raw_filename LIKE ? ESCAPE '\\')")
+            params += [_like_pattern(word)] * 2
+    if not long_words:
+        sql = f"SELECT {columns} FROM sourcefiles WHERE {' AND '.join(where)} ORDER BY id DESC LIMIT ?"
+        return sql, params + [limit]
+    match = ' AND '.join('"' + word.replace('"', '""') + '"' for word in long_words)
+    sql = f'''
+        SELECT {columns} FROM sourcefiles WHERE id IN (
+            SELECT rowid FROM sourcefiles_fts WHERE {' AND '.join(['sourcefiles_fts MATCH ?'] + where)}
+            ORDER BY rowid DESC LIMIT ?
+        ) ORDER BY id DESC
+    '''
+    return sql, [match] + params + [limit]
+
+
+def search_filenames(query: str, limit: int = 100, fields: Iterable[str] = LISTING_FIELDS) -> List[tuple]:
+    """
+    Finds source files whose path or RAW file name contains every word of the search
+    text, ignoring case, newest first, using the full-text index. Returns rows of the
+    given fields, as list_sourcefiles. Raises ValueError for a limit below 1.
+    """
+    if limit < 1:
+        raise ValueError("limit must be at least 1")
+    fields = tuple(fields)
+    row_type = sourcefile_row_type(fields)
+    columns, to_values = _projection(fields)
+    search = _filename_search_sql(columns, query, limit)
+    if search is None:
+        return []
+    with _get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute(*search)
+        rows = c.fetchall()
+    return [row_type._make(to_values(tuple(row))) for row in rows]
+
+
+# Orderings supported by query(), with the columns of their keyset cursor
+_QUERY_ORDERS = {
+    '-id': ('id',),
+    'taken_at': ('taken_at', 'id'),
+    '-taken_at': ('taken_at', 'id'),
+}
+DateBound = Union[str, datetime.date, None]
+
+
+def _date_bound(value: DateBound) -> Optional[str]:
+    """A date or datetime as text comparable with the taken_at column ('YYYY-MM-DD HH:MM:SS')."""
+    if isinstance(value, datetime.datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return value
+
+
+def _compile_query(columns: str, date_range: Optional[Tuple[DateBound, DateBound]] = None,
+                   bbox: Optional[Tuple[float, float, float, float]] = None, camera: Optional[str] = None,
+                   order: str = '-id', cursor: Optional[str] = None, limit: int = 100) -> Tuple[str, list]:
+    """
+    Builds the SQL for query(). The index that drives the query is chosen here, in the
+    order camera (with taken_at), taken_at, position, and pinned with INDEXED BY, so the
+    plan does not depend on table statistics and a query that cannot use its index
+    fails instead of scanning the table.
+    """
+    if order not in _QUERY_ORDERS:
+        raise ValueError(f"order must be one of {sorted(_QUERY_ORDERS)}")
+    if limit < 1:
+        raise ValueError("limit must be at least 1")
+    where: List[str] = []
+    params: list = []
+    start, end = (_date_bound(bound) for bound in (date_range or (None, None)))
+    if camera is not None:
+        where.append('camera = ?')
+        params.append(camera)
+    if start is not None:
+        where.append('taken_at >= ?')
+        params.append(start)
+    if end is not None:
+        where.append('taken_at < ?')
+        params.append(end)
+    if bbox is not None:
+        min_lat, min_lon, max_lat, max_lon = bbox
+        if min_lat > max_lat:
+            raise ValueError("bbox must be (min_lat, min_lon, max_lat, max_lon)")
+        where.append('lat BETWEEN ? AND ?')
+        params += [min_lat, max_lat]
+        # A box with min_lon > max_lon crosses the 180th meridian
+        where.append('lon BETWEEN ? AND ?' if min_lon <= max_lon else '(lon >= ? OR lon <= ?)')
+        params += [min_lon, max_lon]
+
+    key_columns = _QUERY_ORDERS[order]
+    descending = order.startswith('-')
+    if 'taken_at' in key_columns and start is None and end is None:
+        # Photos without a capture time have no place in a date ordering
+        where.append('taken_at IS NOT NULL')
+    if cursor:
+        key = _decode_cursor(cursor)
+        if len(key) != len(key_columns):
+            raise ValueError(f"Invalid cursor for order {order!r}: {cursor!r}")
+        where.append(f"({', '.join(key_columns)}) {'<' if descending else '>'} ({', '.join('?' * len(key))})")
+        params += key
+
+    if camera is not None:
+        index = 'idx_camera_taken_at'
+    elif start is not None or end is not None:
+        index = 'idx_taken_at'
+    elif bbox is not None:
+        index = 'idx_lat_lon'
+    elif 'taken_at' in key_columns:
+        index = 'idx_taken_at'
+    else:
+        index = None
+    # The key columns are selected first, for the cursor of the next page
+    sql = f"SELECT {', '.join(key_columns)}, {columns} FROM sourcefiles"
+    if index:
+        sql += f' INDEXED BY {index}'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += ' ORDER BY ' + ', '.join(f"{column} {'DESC' if descending else 'ASC'}" for column in key_columns)
+    sql += ' LIMIT ?'
+    params.append(limit)
+    return sql, params
+
+
+def query(date_range: Optional[Tuple[DateBound, DateBound]] = None,
+          bbox: Optional[Tuple[float, float, float, float]] = None, camera: Optional[str] = None,
+          order: str = '-id', cursor: Optional[str] = None, limit: int = 100,
+          fields: Iterable[str] = LISTING_FIELDS) -> Tuple[List[tuple], Optional[str]]:
+    """
+    Finds source files by their indexed metadata and returns one page of rows with the
+    given fields, and the cursor for the next page (None on the last page).
+
+    date_range is (start, end) of taken_at, start inclusive and end exclusive; either
+    may be None. Dates, datetimes and 'YYYY-MM-DD[ HH:MM:SS]' strings are accepted.
+    bbox is (min_lat, min_lon, max_lat, max_lon). camera is matched exactly against
+    make and model as stored at import. order is '-id' (newest import first),
+    'taken_at' or '-taken_at'; the date orders leave out photos without a capture time.
+    Every filter is answered from an index, see _compile_query.
+    """
+    fields = tuple(fields)
+    row_type = sourcefile_row_type(fields)
+    columns, to_values = _projection(fields)
+    key_length = len(_QUERY_ORDERS.get(order, ()))
+    sql, params = _compile_query(columns, date_range, bbox, camera, order, cursor, limit)
+    with _get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute(sql, params)
+        rows = c.fetchall()
+    next_cursor = _encode_cursor(tuple(rows[-1])[:key_length]) if len(rows) == limit else None
+    return [row_type._make(to_values(tuple(row)[key_length:])) for row in rows], next_cursor
+
+
+def cluster_locations(bbox: Tuple[float, float, float, float], cell_size: float) -> List[LocationCluster]:
+    """
+    Groups the geotagged photos inside bbox (min_lat, min_lon, max_lat, max_lon) into
+    a grid of cells cell_size degrees wide and high, and returns one cluster per cell
+    that has photos, with their mean position and count. The photos are found with the
+    R*Tree and aggregated in SQLite, so the work grows with the number of photos in the
+    bbox but the result only with the number of cells, which the caller bounds with
+    cell_size. A box with min_lon > max_lon crosses the 180th meridian.
+    """
+    min_lat, min_lon, max_lat, max_lon = bbox
+    if min_lat > max_lat:
+        raise ValueError("bbox must be (min_lat, min_lon, max_lat, max_lon)")
+    if cell_size <= 0:
+        raise ValueError("cell_size must be positive")
+    lon_ranges = [(min_lon, max_lon)] if min_lon <= max_lon else [(min_lon, 180.0), (-180.0, max_lon)]
+    clusters = []
+    with _get_db_connection() as conn:
+        c = conn.cursor()
+        for west, east in lon_ranges:
+            # The R*Tree stores 32-bit floats, rounded outwards, so a point is a tiny box around
+            # it; its centre is matched against the bbox as well, to leave out photos just outside
+            c.execute('''
+                SELECT AVG(lat), AVG(lon), COUNT(*), MAX(id), MIN(lat), MIN(lon), MAX(lat), MAX(lon)
+                FROM (
+                    SELECT id, (min_lat + max_lat) / 2 AS lat, (min_lon + max_lon) / 2 AS lon
+                    FROM sourcefiles_rtree
+                    WHERE max_lat >= ? AND min_lat <= ? AND max_lon >= ? AND min_lon <= ?
+                )
+                WHERE lat BETWEEN ? AND ? AND lon BETWEEN ? AND ?
+                GROUP BY CAST((lat + 90) / ? AS INTEGER), CAST((lon + 180) / ? AS INTEGER)
+            ''', (min_lat, max_lat, west, east, min_lat, max_lat, west, east, cell_size, cell_size))
+            clusters += [LocationCluster(*row) for row in c.fetchall()]
+    return clusters
+
+
+def _bucket_start(bucket: str) -> str:
+    """The first day of a timeline bucket, as text comparable with taken_at: '2023-04' gives '2023-04-01'."""
+    return bucket + '0000-01-01'[len(bucket):]
+
+
+def timeline(granularity: str = 'month',
+             date_range: Optional[Tuple[DateBound, DateBound]] = None) -> List[Tuple[str, int]]:
+    """
+    Returns (bucket, count) for every year ('YYYY'), month ('YYYY-MM') or day
+    ('YYYY-MM-DD') with photos, in date order, read from the timeline table so the cost
+    grows with the number of buckets and not the number of photos. date_range is
+    (start, end) as in query(), and the buckets that overlap it are returned. Photos
+    without a capture time are not counted.
+    """
+    length = _TIMELINE_GRANULARITIES.get(granularity)
+    if length is None:
+        raise ValueError(f"granularity must be one of {list(_TIMELINE_GRANULARITIES)}")
+    start, end = (_date_bound(bound) for bound in (date_range or (None, None)))
+    where = ['granularity = ?']
+    params: list = [granularity]
+    if start is not None:
+        where.append('bucket >= ?')
+        params.append(start[:length])
+    if end is not None:
+        # The bucket the end falls in is left out if the range ends where it begins
+        last = end[:length]
+        where.append('bucket < ?' if end.removesuffix(' 00:00:00') <= _bucket_start(last) else 'bucket <= ?')
+        params.append(last)
+    with _get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute(f"SELECT bucket, count FROM timeline WHERE {' AND '.join(where)} ORDER BY bucket", params)
+        return [(row[0], row[1]) for row in c.fetchall()]
+
+
+def explain_query(**filters) -> List[str]:
+    """Returns the EXPLAIN QUERY PLAN lines for the query() with the given arguments."""
+    sql, params = _compile_query('id', **filters)
+    with _get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        return [row['detail'] for row in c.fetchall()]
 
 
 def update_sourcefile(sourcefile_id: int, filename: str, image_hash: str, thumbnail: Optional[bytes], exif_data: Optional[bytes]) -> bool:
-    """Updates an existing source file."""
+    """Updates an existing source file. The indexed metadata columns are refreshed from exif_data."""
+    metadata = exif_service.parse_indexed_metadata(exif_data)
     with _get_db_connection() as conn:
         c = conn.cursor()
+        c.execute('SELECT image_hash FROM sourcefiles WHERE id = ?', (sourcefile_id,))
+        row = c.fetchone()
+        if row is None:
+            return False
+        old_hash = row['image_hash']
+        thumbnail_column = _store_thumbnails([(image_hash, thumbnail)])[0]
         c.execute('''
             UPDATE sourcefiles
-            SET filename = ?, image_hash = ?, thumbnail = ?, exif_data = ?
+            SET filename = ?, image_hash = ?, thumbnail = ?, exif_data = ?,
+                taken_at = ?, lat = ?, lon = ?, camera = ?, metadata_version = ?
             WHERE id = ?
-        ''', (filename, image_hash, thumbnail, exif_data, sourcefile_id))
-        return c.rowcount > 0
+        ''', (filename, image_hash, thumbnail_column, exif_data, *metadata, METADATA_VERSION, sourcefile_id))
+    pack = get_thumbnail_pack()
+    if old_hash and old_hash != image_hash:
+        pack.remove(old_hash)
+    if image_hash and not thumbnail:
+        pack.remove(image_hash)
+    _notify_change("update", sourcefile_id, image_hash)
+    return True
 
 
 def delete_sourcefile(sourcefile_id: int) -> bool:
-    """Deletes a source file from the database."""
+    """
+    Deletes a source file from the database, and its thumbnail from the thumbnail pack.
+    Scan manifest entries with the same hash are removed as well, so the file is imported again on the next scan.
+    """
     with _get_db_connection() as conn:
         c = conn.cursor()
+        c.execute('SELECT image_hash FROM sourcefiles WHERE id = ?', (sourcefile_id,))
+        row = c.fetchone()
+        if row is None:
+            return False
+        image_hash = row['image_hash']
+        c.execute('DELETE FROM scan_manifest WHERE image_hash = ?', (image_hash,))
         c.execute('DELETE FROM sourcefiles WHERE id = ?', (sourcefile_id,))
-        return c.rowcount > 0
+    if image_hash:
+        get_thumbnail_pack().remove(image_hash)
+    _notify_change("delete", sourcefile_id, image_hash)
+    return True
+
+
+def get_thumbnail_blob_batch(after_id: int, limit: int) -> List[Tuple[int, str, bytes]]:
+    """
+    Returns (id, image_hash, thumbnail) for up to limit rows with an ID above after_id
+    whose thumbnail is still stored in the table, in ID order.
+    """
+    with _get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute('''
+            SELECT id, image_hash, thumbnail FROM sourcefiles
+            WHERE id > ? AND thumbnail IS NOT NULL AND image_hash IS NOT NULL
+            ORDER BY id
+            LIMIT ?
+        ''', (after_id, limit))
+        return [(row[0], row[1], row[2]) for row in c.fetchall()]
+
+
+def clear_thumbnail_blobs(sourcefile_ids: Iterable[int]):
+    """Removes the thumbnail BLOBs of the given rows, once they are stored in the thumbnail pack."""
+    with _get_db_connection() as conn:
+        conn.executemany('UPDATE sourcefiles SET thumbnail = NULL WHERE id = ?',
+                         ((sourcefile_id,) for sourcefile_id in sourcefile_ids))
+
+
+def vacuum():
+    """Rebuilds the database file to return the space of deleted data to the file system."""
+    _get_thread_connection().execute('VACUUM')
+
+
+def get_metadata_backfill_batch(after_id: int, limit: int) -> List[Tuple[int, Optional[bytes]]]:
+    """
+    Returns (id, exif_data) for up to limit rows with an ID above after_id whose
+    indexed metadata was filled by an older METADATA_VERSION, in ID order.
+    """
+    with _get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute('''
+            SELECT id, exif_data FROM sourcefiles
+            WHERE metadata_version < ? AND id > ?
+            ORDER BY id
+            LIMIT ?
+        ''', (METADATA_VERSION, after_id, limit))
+        return [(row[0], row[1]) for row in c]
+
+
+def set_indexed_metadata(updates: Iterable[Tuple[int, ImageMetadata]]):
+    """Stores the indexed metadata for (sourcefile_id, metadata) pairs in a single transaction."""
+    with _get_db_connection() as conn:
+        c = conn.cursor()
+        c.executemany('''
+            UPDATE sourcefiles
+            SET taken_at = ?, lat = ?, lon = ?, camera = ?, metadata_version = ?
+            WHERE id = ?
+        ''', ((*metadata, METADATA_VERSION, sourcefile_id) for sourcefile_id, metadata in updates))
+
+
+def get_scan_manifest(path_prefix: str) -> Dict[str, ScanManifestEntry]:
+    """Retrieves the scan manifest entries for all paths starting with path_prefix, keyed by path."""
+    with _get_db_connection() as conn:
+        c = conn.cursor()
+        # A range on the primary key instead of LIKE, so the lookup can use the index
+        c.execute('''
+            SELECT path, size, mtime_ns, fingerprint, image_hash FROM scan_manifest
+            WHERE path >= ? AND path < ?
+        ''', (path_prefix, path_prefix + '\U0010ffff'))
+        return {row['path']: ScanManifestEntry(*row) for row in c}
+
+
+def upsert_scan_manifest(entries: Iterable[ScanManifestEntry]):
+    """Inserts or replaces scan manifest entries in a single transaction."""
+    with _get_db_connection() as conn:
+        c = conn.cursor()
+        c.executemany('''
+            INSERT INTO scan_manifest (path, size, mtime_ns, fingerprint, image_hash)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(path) DO UPDATE SET
+                size = excluded.size,
+                mtime_ns = excluded.mtime_ns,
+                fingerprint = excluded.fingerprint,
+                image_hash = excluded.image_hash
+        ''', entries)
 
 
 if __name__ == "__main__":
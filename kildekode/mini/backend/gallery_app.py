@@ -1,37 +1,291 @@
+import hashlib
 import io
-from flask import Flask, render_template, Response, send_file
+from typing import Dict, List, Optional, Tuple
+
+from flask import Flask, render_template, Response, send_file, jsonify, request, url_for
 
 import database
-from services.filescanning import get_preview_path
+from config import NEAR_DUPLICATE_DISTANCE, GALLERY_CACHE_BYTES, PREVIEW_SIZES
+from services.cache import LRUCache
+from services import previews
+from services import similarity
 
 # Initialize the Flask app
 app = Flask(__name__)
 
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+PAGE_FIELDS = ('id', 'filename', 'image_hash', 'taken_at')
+MAX_BATCH_IDS = 1000
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600  # Seconds browsers may keep content-addressed responses
+MAP_CELLS_PER_TILE = 4  # Cluster grid cells across a 256 px map tile, so markers are about 64 px apart
+MAX_MAP_ZOOM = 22
+MAX_MAP_CELLS_ACROSS = 40  # Cells across the width or height of a view at most, whatever its zoom level
+
+# Thumbnails of recently served source files, keyed by (ID, image hash). The hash is
+# read from the row on every request, so a row changed or deleted by another process,
+# such as the importer, is never served from the cache; its old entry ages out.
+_thumbnail_cache = LRUCache(GALLERY_CACHE_BYTES)
+
+
+def _image_to_json(image) -> dict:
+    return {
+        "id": image.id,
+        "filename": image.filename,
+        "taken_timestamp": image.taken_timestamp,
+        "thumbnail_url": url_for('get_thumbnail', sourcefile_id=image.id, v=image.image_hash),
+        "large_url": url_for('get_large_image', image_hash=image.image_hash),
+        "large_srcset": ", ".join(f"{url_for('get_large_image', image_hash=image.image_hash, size=size)} {size}w"
+                                  for size in PREVIEW_SIZES),
+    }
+
+
+def _batch_etag(image_hashes) -> str:
+    """Version of a batch of thumbnails, derived from the image hashes in it."""
+    return hashlib.blake2b(",".join(h or "" for h in image_hashes).encode(), digest_size=12).hexdigest()
+
+
+def _thumbnails_url(images) -> Optional[str]:
+    """URL of the batch of thumbnails for a page of images, see get_thumbnail_batch."""
+    if not images:
+        return None
+    return url_for('get_thumbnail_batch', ids=",".join(str(image.id) for image in images),
+                   v=_batch_etag(image.image_hash for image in images))
+
+
+def _limit_arg() -> int:
+    """The limit query parameter, PAGE_SIZE if it is missing, clamped to 1..MAX_PAGE_SIZE."""
+    return min(max(request.args.get('limit', PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+
+
+def _cache_response(response: Response, etag: str, immutable: bool) -> Response:
+    """
+    Adds a strong ETag and answers conditional and range requests. Responses whose URL
+    carries the content version (?v=) are marked immutable, so browsers do not ask again;
+    other responses must be revalidated, which costs a 304 without a body when nothing changed.
+    """
+    response.set_etag(etag)
+    if immutable:
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    # Range requests are only answered when the length of the whole body is given
+    return response.make_conditional(request, accept_ranges=True, complete_length=response.calculate_content_length())
+
+
+def load_thumbnails(ids) -> Dict[int, Tuple[Optional[str], bytes]]:
+    """
+    Returns (image_hash, thumbnail) for the given IDs. The current image hashes are
+    read from the database, and the thumbnails come from the cache where possible;
+    the rest are read with one query and added to the cache.
+    """
+    found = {}
+    missing = []
+    for sourcefile_id, image_hash in database.get_image_hashes(ids).items():
+        thumbnail = _thumbnail_cache.get((sourcefile_id, image_hash)) if image_hash else None
+        if thumbnail is None:
+            missing.append(sourcefile_id)
+        else:
+            found[sourcefile_id] = (image_hash, thumbnail)
+    if missing:
+        for sourcefile_id, (image_hash, thumbnail) in database.get_thumbnails(missing).items():
+            # WSGI servers only accept bytes, so the view of the pack is copied once, here
+            thumbnail = bytes(thumbnail)
+            # Rows without a hash are rare leftovers of old imports, and have no key to check
+            if image_hash:
+                _thumbnail_cache.put((sourcefile_id, image_hash), thumbnail, len(thumbnail))
+            found[sourcefile_id] = (image_hash, thumbnail)
+    return found
+
+
+def preview_etag(image_hash: str, size: Optional[int]) -> str:
+    """Each size of a preview is a separate representation, so it gets its own ETag."""
+    return image_hash if size is None else f"{image_hash}-{size}"
+
+
+def thumbnail_etag(image_hash: Optional[str], thumbnail: bytes) -> str:
+    """The ETag of a thumbnail is its image hash, or a digest of the data for rows without one."""
+    return image_hash or hashlib.blake2b(thumbnail, digest_size=12).hexdigest()
+
+
+def parse_batch_ids(value: str) -> Tuple[int, ...]:
+    """Parses the ids parameter of get_thumbnail_batch. Raises ValueError if it is invalid or too long."""
+    ids = tuple(int(part) for part in value.split(','))
+    if len(ids) > MAX_BATCH_IDS:
+        raise ValueError(f"At most {MAX_BATCH_IDS} ids")
+    return ids
+
+
+def build_thumbnail_batch(ids: Tuple[int, ...]) -> Tuple[bytes, str, str]:
+    """
+    Concatenates the thumbnails for ids and returns the payload, the comma-separated
+    lengths and the ETag of the batch.
+    """
+    thumbnails = load_thumbnails(ids)
+    entries = [thumbnails.get(sourcefile_id, (None, b"")) for sourcefile_id in ids]
+    parts: List[bytes] = [thumbnail for _, thumbnail in entries]
+    return b"".join(parts), ",".join(str(len(part)) for part in parts), _batch_etag(h for h, _ in entries)
+
+
 @app.route('/')
 def index():
-    """Main gallery page. Fetches the first 100 images and renders the gallery."""
-    images = database.get_all_sourcefiles(limit=100)
-    return render_template('index.html', images=images)
+    """Main gallery page. Renders the first page of images; the rest is loaded by infinite scroll."""
+    # The thumbnails are fetched by the browser, so no BLOBs are read here
+    images, next_cursor = database.list_sourcefiles_page(fields=PAGE_FIELDS, limit=PAGE_SIZE)
+    return render_template('index.html', images=images, next_cursor=next_cursor,
+                           thumbnails_url=_thumbnails_url(images))
+
+@app.route('/api/images')
+def list_images():
+    """Returns the page of images after the given cursor as JSON, for infinite scroll."""
+    try:
+        images, next_cursor = database.list_sourcefiles_page(
+            fields=PAGE_FIELDS, limit=_limit_arg(), cursor=request.args.get('cursor'))
+    except ValueError:
+        return "Invalid cursor", 400
+    return jsonify({
+        "images": [_image_to_json(image) for image in images],
+        "next_cursor": next_cursor,
+        "thumbnails_url": _thumbnails_url(images),
+    })
+
+@app.route('/api/search')
+def search_images():
+    """Finds images by path and file name, see database.search_filenames. Matches are returned newest first."""
+    images = database.search_filenames(request.args.get('q', ''), limit=_limit_arg(), fields=PAGE_FIELDS)
+    return jsonify({
+        "images": [_image_to_json(image) for image in images],
+        "thumbnails_url": _thumbnails_url(images),
+    })
 
 @app.route('/thumbnail/<int:sourcefile_id>')
 def get_thumbnail(sourcefile_id: int):
-    """Serves a thumbnail image from the database."""
-    source_file = database.get_sourcefile_by_id(sourcefile_id)
-    if source_file and source_file.thumbnail:
-        return Response(source_file.thumbnail, mimetype='image/jpeg')
+    """Serves a thumbnail image from the thumbnail pack. The ETag is the image hash."""
+    entry = load_thumbnails([sourcefile_id]).get(sourcefile_id)
+    if entry:
+        image_hash, thumbnail = entry
+        etag = thumbnail_etag(image_hash, thumbnail)
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = Response(thumbnail, mimetype='image/jpeg')
+        return _cache_response(response, etag, immutable=request.args.get('v') == etag)
     # Return a 404 or a placeholder if not found
     return "Not Found", 404
 
+@app.route('/thumbnails')
+def get_thumbnail_batch():
+    """
+    Serves the thumbnails for a page of images in one response, so the gallery needs
+    one request per page instead of one per image. The body is the JPEG files one after
+    another, in the order of the ids parameter, and the X-Thumbnail-Lengths header lists
+    their lengths (0 for images without a thumbnail). Thumbnails are served from an in-memory cache.
+    """
+    try:
+        ids = parse_batch_ids(request.args.get('ids', ''))
+    except ValueError as e:
+        return f"Invalid ids: {e}", 400
+    payload, lengths, etag = build_thumbnail_batch(ids)
+    response = Response(payload, mimetype='application/octet-stream', headers={"X-Thumbnail-Lengths": lengths})
+    return _cache_response(response, etag, immutable=request.args.get('v') == etag)
+
 @app.route('/large/<image_hash>')
 def get_large_image(image_hash: str):
-    """Serves a large preview image from the filesystem."""
+    """
+    Serves a preview image from the filesystem, at LARGE_SIZE or at one of the
+    PREVIEW_SIZES given by the size parameter. Missing previews are rendered on
+    demand, see previews.ensure_preview. The URL contains the image hash, so the
+    response never changes and is marked immutable; send_file answers
+    If-None-Match with 304 and Range requests with 206.
+    """
+    size = request.args.get('size', type=int)
     try:
-        # Construct the path to the large preview image
-        path = get_preview_path(image_hash)
-        # Serve the file
-        return send_file(path, mimetype='image/jpeg')
+        path = previews.ensure_preview(image_hash, size)
+    except ValueError as e:
+        return str(e), 400
     except FileNotFoundError:
         return "Not Found", 404
+    response = send_file(path, mimetype='image/jpeg', etag=preview_etag(image_hash, size), conditional=True,
+                         max_age=IMMUTABLE_MAX_AGE)
+    response.cache_control.immutable = True
+    return response
+
+@app.route('/similar/<image_hash>')
+def get_similar_images(image_hash: str):
+    """Lists images whose perceptual hash is within max_distance bits of the given hash."""
+    max_distance = request.args.get('max_distance', NEAR_DUPLICATE_DISTANCE, type=int)
+    try:
+        matches = similarity.find_similar(image_hash, max_distance)
+    except ValueError:
+        return "Invalid image hash", 400
+    return jsonify([
+        {
+            "id": sourcefile_id,
+            "distance": distance,
+            "thumbnail_url": url_for('get_thumbnail', sourcefile_id=sourcefile_id),
+        } for sourcefile_id, distance in matches
+    ])
+
+@app.route('/api/map/clusters')
+def get_map_clusters():
+    """
+    Clustered markers of the geotagged images in a map view, for
+    bbox=min_lat,min_lon,max_lat,max_lon and a web map zoom level. The view is split
+    into a grid whose cells are a fixed fraction of a map tile, so the response has
+    about the same number of markers at every zoom level. The cells are made larger
+    for a bbox wider than the zoom level can show, so a response never has more than
+    about MAX_MAP_CELLS_ACROSS squared markers.
+    """
+    try:
+        bbox = tuple(float(value) for value in request.args.get('bbox', '').split(','))
+        if len(bbox) != 4:
+            raise ValueError("bbox must have four values")
+        min_lat, min_lon, max_lat, max_lon = bbox
+        zoom = min(max(request.args.get('zoom', 0, type=int), 0), MAX_MAP_ZOOM)
+        # A bbox with min_lon > max_lon crosses the 180th meridian
+        lon_span = max_lon - min_lon if min_lon <= max_lon else max_lon - min_lon + 360
+        cell_size = max(360.0 / (2 ** zoom) / MAP_CELLS_PER_TILE,
+                        lon_span / MAX_MAP_CELLS_ACROSS, (max_lat - min_lat) / MAX_MAP_CELLS_ACROSS)
+        clusters = database.cluster_locations(bbox, cell_size)
+    except ValueError as e:
+        return f"Invalid bbox: {e}", 400
+    return jsonify({
+        "cell_size": cell_size,
+        "clusters": [
+            {
+                "lat": cluster.lat,
+                "lon": cluster.lon,
+                "count": cluster.count,
+                "id": cluster.sourcefile_id,
+                "bbox": [cluster.min_lat, cluster.min_lon, cluster.max_lat, cluster.max_lon],
+                "thumbnail_url": url_for('get_thumbnail', sourcefile_id=cluster.sourcefile_id),
+            } for cluster in clusters
+        ],
+    })
+
+@app.route('/api/timeline')
+def get_timeline():
+    """
+    Photo counts per year, month or day (granularity=year|month|day), for a timeline
+    scrubber. start and end ('YYYY-MM-DD') limit the range; end is exclusive.
+    """
+    granularity = request.args.get('granularity', 'month')
+    try:
+        buckets = database.timeline(granularity, (request.args.get('start'), request.args.get('end')))
+    except ValueError as e:
+        return str(e), 400
+    return jsonify({
+        "granularity": granularity,
+        "buckets": [{"bucket": bucket, "count": count} for bucket, count in buckets],
+    })
+
+@app.route('/api/cache')
+def get_cache_stats():
+    """Hit and miss counts and memory use of the thumbnail cache."""
+    stats = _thumbnail_cache.stats()
+    return jsonify({**stats._asdict(), "hit_rate": stats.hit_rate})
 
 if __name__ == '__main__':
     print("Starting the gallery web app!")
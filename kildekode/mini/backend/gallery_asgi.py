@@ -0,0 +1,325 @@
+"""
+ASGI version of the gallery web app, for serving many image requests at once.
+
+The image routes (/thumbnail/<id>, /thumbnails and /large/<hash>) are handled here
+with asyncio, and their database and file reads run in a bounded thread pool, so a
+phone scrolling a large album does not tie up one worker per request. The other
+routes are passed on to the Flask app in gallery_app, so the URLs, the templates
+and the JSON are the same in both modes.
+
+Run with an ASGI server, for example: uvicorn gallery_asgi:app
+"""
+import asyncio
+import io
+import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from werkzeug.http import parse_etags, parse_range_header, quote_etag
+
+import gallery_app
+from config import GALLERY_IO_THREADS
+from services import previews
+
+_THUMBNAIL_ROUTE = re.compile(r'/thumbnail/(\d+)')
+_LARGE_ROUTE = re.compile(r'/large/([^/]+)')
+
+Headers = List[Tuple[bytes, bytes]]
+
+_executor: Optional[ThreadPoolExecutor] = None
+# Preview lookups in progress, so concurrent requests for a missing preview wait
+# on one render here instead of each holding a thread from the pool
+_preview_tasks: Dict[Tuple[str, Optional[int]], asyncio.Future] = {}
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=GALLERY_IO_THREADS, thread_name_prefix="gallery-io")
+    return _executor
+
+
+async def _run(func: Callable, *args):
+    """Runs a blocking call in the I/O thread pool. SQLite connections are per thread, see database.py."""
+    return await asyncio.get_running_loop().run_in_executor(_get_executor(), func, *args)
+
+
+def _header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope['headers']:
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+
+def _query_arg(scope, name: str) -> Optional[str]:
+    values = parse_qs(scope['query_string'].decode('latin-1')).get(name)
+    return values[0] if values else None
+
+
+def _int_arg(scope, name: str) -> Optional[int]:
+    """An integer query parameter, None if it is missing or not a number, like request.args.get(name, type=int)."""
+    try:
+        return int(_query_arg(scope, name))
+    except (TypeError, ValueError):
+        return None
+
+
+def _cache_headers(etag: str, immutable: bool) -> Headers:
+    """The same ETag and Cache-Control headers as gallery_app._cache_response."""
+    cache_control = f"public, max-age={gallery_app.IMMUTABLE_MAX_AGE}, immutable" if immutable else "no-cache"
+    return [(b'etag', quote_etag(etag).encode()), (b'cache-control', cache_control.encode())]
+
+
+def _not_modified(scope, etag: str) -> bool:
+    return parse_etags(_header(scope, b'if-none-match')).contains(etag)
+
+
+async def _send(send, status: int, headers: Headers, body: bytes = b'', head: bool = False):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': headers + [(b'content-length', str(len(body)).encode())]})
+    await send({'type': 'http.response.body', 'body': b'' if head else body})
+
+
+async def _send_text(send, status: int, text: str):
+    # Flask sends the strings views return as HTML
+    await _send(send, status, [(b'content-type', b'text/html; charset=utf-8')], text.encode())
+
+
+def _range_header(scope, etag: str) -> Optional[str]:
+    """The Range header, unless an If-Range header names another version than etag."""
+    if_range = _header(scope, b'if-range')
+    if if_range is not None and if_range.strip() != quote_etag(etag):
+        return None
+    return _header(scope, b'range')
+
+
+def _range_span(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    The (start, stop) of the part of a body of size bytes asked for by a Range header,
+    or None for the whole body. Raises ValueError when the range is invalid or outside
+    the body. As in werkzeug, empty bodies are always sent whole.
+    """
+    if not range_header or not size:
+        return None
+    byte_range = parse_range_header(range_header)
+    span = byte_range.range_for_length(size) if byte_range else None
+    if span is None:
+        raise ValueError(f"Range {range_header!r} does not fit the {size} bytes")
+    return span
+
+
+async def _send_part(scope, send, headers: Headers, size: int, span: Optional[Tuple[int, int]], data: Optional[bytes]):
+    """
+    Sends the whole body of size bytes when span is None, or the part at span as a 206.
+    data is None when the requested range was outside the body, which gets a 416.
+    """
+    if data is None:
+        await _send(send, 416, [(b'content-range', f"bytes */{size}".encode())])
+    elif span is None:
+        await _send(send, 200, headers, data, head=scope['method'] == 'HEAD')
+    else:
+        headers = headers + [(b'content-range', f"bytes {span[0]}-{span[1] - 1}/{size}".encode())]
+        await _send(send, 206, headers, data, head=scope['method'] == 'HEAD')
+
+
+async def _send_cached(scope, send, etag: str, immutable: bool, body: bytes, headers: Headers):
+    """
+    Sends body with cache headers, or a 304 without it when the client has the same version.
+    Range requests are answered like gallery_app._cache_response does.
+    """
+    headers = headers + [(b'accept-ranges', b'bytes')] + _cache_headers(etag, immutable)
+    if _not_modified(scope, etag):
+        await _send(send, 304, headers)
+        return
+    try:
+        span = _range_span(_range_header(scope, etag), len(body))
+    except ValueError:
+        await _send_part(scope, send, headers, len(body), None, None)
+        return
+    await _send_part(scope, send, headers, len(body), span, body if span is None else body[span[0]:span[1]])
+
+
+async def _thumbnail(scope, send, sourcefile_id: int):
+    entry = (await _run(gallery_app.load_thumbnails, [sourcefile_id])).get(sourcefile_id)
+    if not entry:
+        await _send_text(send, 404, "Not Found")
+        return
+    image_hash, thumbnail = entry
+    etag = gallery_app.thumbnail_etag(image_hash, thumbnail)
+    await _send_cached(scope, send, etag, _query_arg(scope, 'v') == etag, thumbnail,
+                       [(b'content-type', b'image/jpeg')])
+
+
+async def _thumbnail_batch(scope, send):
+    try:
+        ids = gallery_app.parse_batch_ids(_query_arg(scope, 'ids') or '')
+    except ValueError as e:
+        await _send_text(send, 400, f"Invalid ids: {e}")
+        return
+    payload, lengths, etag = await _run(gallery_app.build_thumbnail_batch, ids)
+    await _send_cached(scope, send, etag, _query_arg(scope, 'v') == etag, payload,
+                       [(b'content-type', b'application/octet-stream'),
+                        (b'x-thumbnail-lengths', lengths.encode())])
+
+
+def _read_range(path: str, range_header: Optional[str]) -> Tuple[int, Optional[Tuple[int, int]], Optional[bytes]]:
+    """
+    Reads a file, or the part of it asked for by a Range header. Returns the file size,
+    the (start, stop) of the part or None for the whole file, and the data, which is
+    None when the range is outside the file. Raises FileNotFoundError.
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        try:
+            span = _range_span(range_header, size)
+        except ValueError:
+            return size, None, None
+        if span is None:
+            return size, None, f.read()
+        f.seek(span[0])
+        return size, span, f.read(span[1] - span[0])
+
+
+async def _ensure_preview(image_hash: str, size: Optional[int]) -> str:
+    key = (image_hash, size)
+    task = _preview_tasks.get(key)
+    if task is None:
+        task = _preview_tasks[key] = asyncio.ensure_future(_run(previews.ensure_preview, image_hash, size))
+        task.add_done_callback(lambda _: _preview_tasks.pop(key, None))
+    # A client that disconnects must not cancel the render the others are waiting for
+    return await asyncio.shield(task)
+
+
+async def _large_image(scope, send, image_hash: str):
+    # The URL contains the image hash, so the response never changes, as in gallery_app.get_large_image
+    size = _int_arg(scope, 'size')
+    try:
+        previews.preview_size(size)
+    except ValueError as e:
+        await _send_text(send, 400, str(e))
+        return
+    etag = gallery_app.preview_etag(image_hash, size)
+    headers = [(b'content-type', b'image/jpeg'), (b'accept-ranges', b'bytes')] + _cache_headers(etag, True)
+    if _not_modified(scope, etag):
+        await _send(send, 304, headers)
+        return
+    try:
+        path = await _ensure_preview(image_hash, size)
+        file_size, span, data = await _run(_read_range, path, _range_header(scope, etag))
+    except FileNotFoundError:
+        await _send_text(send, 404, "Not Found")
+        return
+    await _send_part(scope, send, headers, file_size, span, data)
+
+
+def _wsgi_environ(scope, body: bytes) -> dict:
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'],
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for key, value in scope['headers']:
+        name = key.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[name] = value
+            continue
+        name = 'HTTP_' + name
+        if name in environ:
+            # Repeated headers are joined into one; cookies have their own separator (RFC 6265)
+            value = f"{environ[name]}{'; ' if name == 'HTTP_COOKIE' else ','}{value}"
+        environ[name] = value
+    return environ
+
+
+def _call_flask(environ: dict) -> Tuple[int, Headers, bytes]:
+    response_start = {}
+
+    def start_response(status: str, headers, exc_info=None):
+        response_start['status'] = int(status.split(' ', 1)[0])
+        response_start['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+
+    result = gallery_app.app.wsgi_app(environ, start_response)
+    try:
+        body = b''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return response_start['status'], response_start['headers'], body
+
+
+async def _flask(scope, receive, send):
+    """Passes a request on to the Flask app, which runs in the I/O thread pool."""
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    status, headers, body = await _run(_call_flask, _wsgi_environ(scope, b''.join(chunks)))
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _lifespan(receive, send):
+    global _executor
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            _get_executor()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if _executor is not None:
+                _executor.shutdown(wait=True)
+                _executor = None
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    """The ASGI application."""
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+    path = scope['path']
+    if scope['method'] in ('GET', 'HEAD'):
+        match = _THUMBNAIL_ROUTE.fullmatch(path)
+        if match:
+            await _thumbnail(scope, send, int(match.group(1)))
+            return
+        if path == '/thumbnails':
+            await _thumbnail_batch(scope, send)
+            return
+        match = _LARGE_ROUTE.fullmatch(path)
+        if match:
+            await _large_image(scope, send, match.group(1))
+            return
+    await _flask(scope, receive, send)
+
+
+if __name__ == '__main__':
+    try:
+        import uvicorn
+    except ImportError:
+        sys.exit("The ASGI gallery needs an ASGI server: pip install uvicorn")
+    print("Starting the gallery web app (ASGI)!")
+    print("Open your browser and go to: http://127.0.0.1:8000")
+    uvicorn.run(app, host='127.0.0.1', port=8000)
@@ -1,6 +1,8 @@
 import logging
+from collections import namedtuple
+from functools import lru_cache
 from pydantic import BaseModel, Field
-from typing import Optional, Tuple
+from typing import NamedTuple, Optional, Tuple
 
 from services import exif as exif_service
 
@@ -10,22 +12,97 @@ class SourceFile(BaseModel):
     image_hash: Optional[str] = None
     thumbnail: Optional[bytes] = Field(default=None, repr=False)
     exif_data: Optional[bytes] = Field(default=None, repr=False)
+    # The RAW file of a RAW+JPEG pair; filename is then the JPEG
+    raw_filename: Optional[str] = None
+    # Indexed copies of EXIF values, filled at import (see exif_service.parse_indexed_metadata)
+    taken_at: Optional[str] = None
+    lat: Optional[float] = None
+    lon: Optional[float] = None
+    camera: Optional[str] = None
 
     @property
     def taken_timestamp(self) -> Optional[str]:
-        """Delegates timestamp parsing to the exif_service."""
+        """The time the photo was taken, from the indexed column or parsed from the EXIF data."""
+        if self.taken_at:
+            return self.taken_at
         if self.exif_data:
-            return exif_service.parse_taken_timestamp(self.exif_data)
+            return exif_service.exif_timestamp_to_iso(exif_service.parse_taken_timestamp(self.exif_data))
         return None
 
     @property
     def gps_coordinates(self) -> Optional[Tuple[float, float]]:
-        """Delegates GPS parsing to the exif_service."""
+        """The GPS position, from the indexed columns or parsed from the EXIF data."""
+        if self.lat is not None and self.lon is not None:
+            return self.lat, self.lon
         if self.exif_data:
             return exif_service.parse_gps_coordinates(self.exif_data)
         return None
 
 
+SOURCEFILE_FIELDS = ('id', 'filename', 'image_hash', 'thumbnail', 'exif_data', 'raw_filename', 'taken_at', 'lat', 'lon', 'camera')
+
+
+class SourceFileRowMixin:
+    """The SourceFile properties for lightweight rows; they return None if the needed fields were not selected."""
+    __slots__ = ()
+
+    @property
+    def taken_timestamp(self) -> Optional[str]:
+        taken_at = getattr(self, 'taken_at', None)
+        if taken_at:
+            return taken_at
+        exif_data = getattr(self, 'exif_data', None)
+        if exif_data:
+            return exif_service.exif_timestamp_to_iso(exif_service.parse_taken_timestamp(exif_data))
+        return None
+
+    @property
+    def gps_coordinates(self) -> Optional[Tuple[float, float]]:
+        lat, lon = getattr(self, 'lat', None), getattr(self, 'lon', None)
+        if lat is not None and lon is not None:
+            return lat, lon
+        exif_data = getattr(self, 'exif_data', None)
+        if exif_data:
+            return exif_service.parse_gps_coordinates(exif_data)
+        return None
+
+
+@lru_cache(maxsize=None)
+def sourcefile_row_type(fields: Tuple[str, ...]) -> type:
+    """
+    Returns an immutable named-tuple type holding only the given SourceFile fields.
+    Used by listing queries that do not need every column, in particular the BLOBs.
+    """
+    unknown = set(fields) - set(SOURCEFILE_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown SourceFile fields: {sorted(unknown)}")
+    base = namedtuple('SourceFileRow', fields)
+    return type('SourceFileRow', (base, SourceFileRowMixin), {'__slots__': ()})
+
+
+class ScanManifestEntry(NamedTuple):
+    """What the importer knew about a file the last time it was scanned."""
+    path: str
+    size: int
+    mtime_ns: int
+    fingerprint: str
+    image_hash: Optional[str]
+
+
+class LocationCluster(NamedTuple):
+    """Geotagged photos in one grid cell of a map, see database.cluster_locations."""
+    lat: float
+    lon: float
+    count: int
+    # The newest photo in the cell, to show as the marker
+    sourcefile_id: int
+    # The box around the photos, for zooming in on the cluster
+    min_lat: float
+    min_lon: float
+    max_lat: float
+    max_lon: float
+
+
 if __name__ == "__main__":
     import database
 
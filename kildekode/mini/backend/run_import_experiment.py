@@ -32,7 +32,7 @@ def run():
         return
 
     try:
-        import_photos(photo_directory_to_scan)
+        import_photos(photo_directory_to_scan, workers=os.cpu_count() or 1)
         logging.info("--- Experiment Finished Successfully ---")
     except Exception as e:
         logging.error(f"An unexpected error occurred during the experiment: {e}", exc_info=True)
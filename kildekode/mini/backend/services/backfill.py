@@ -0,0 +1,92 @@
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+# Allow running as "python services/backfill.py" from the backend directory
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if backend_dir not in sys.path:
+    sys.path.insert(0, backend_dir)
+
+import database
+from services import exif as exif_service
+from services.thumbpack import get_thumbnail_pack
+
+
+def backfill_indexed_metadata(workers: int = os.cpu_count() or 1, batch_size: int = 1000) -> int:
+    """
+    Fills the indexed metadata columns (taken_at, lat, lon, camera) for rows stored before the
+    current exif_service.METADATA_VERSION, by parsing their stored EXIF data.
+    The parsing runs in a process pool; the updates are written in one transaction per batch.
+    The backfill can be interrupted and run again; it continues with the rows not yet updated.
+    Returns the number of rows updated.
+    """
+    database.init_db()
+    logging.info(f"Starting metadata backfill (version {exif_service.METADATA_VERSION}, workers: {workers})")
+
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    updated_count = 0
+    after_id = 0
+    try:
+        while True:
+            batch = database.get_metadata_backfill_batch(after_id, batch_size)
+            if not batch:
+                break
+            ids = [sourcefile_id for sourcefile_id, _ in batch]
+            exif_blobs = [exif_data for _, exif_data in batch]
+            if pool:
+                metadata = list(pool.map(exif_service.parse_indexed_metadata, exif_blobs,
+                                         chunksize=max(1, len(batch) // (workers * 4))))
+            else:
+                metadata = [exif_service.parse_indexed_metadata(exif_data) for exif_data in exif_blobs]
+            database.set_indexed_metadata(zip(ids, metadata))
+
+            updated_count += len(batch)
+            after_id = ids[-1]
+            logging.info(f"Backfilled metadata for {updated_count} rows (up to ID {after_id})")
+    finally:
+        if pool:
+            pool.shutdown()
+
+    logging.info(f"Metadata backfill finished. Updated {updated_count} rows.")
+    return updated_count
+
+
+def move_thumbnails_to_pack(batch_size: int = 1000, vacuum: bool = True) -> int:
+    """
+    Moves thumbnails stored as BLOBs in the sourcefiles table into the thumbnail pack.
+    Each batch is written to the pack and synced to disk before its BLOBs are cleared,
+    so the migration can be interrupted and run again. With vacuum set, the database
+    file is rebuilt afterwards to give the freed space back.
+    Returns the number of thumbnails moved.
+    """
+    database.init_db()
+    pack = get_thumbnail_pack()
+    moved_count = 0
+    after_id = 0
+    while True:
+        batch = database.get_thumbnail_blob_batch(after_id, batch_size)
+        if not batch:
+            break
+        pack.put_many((image_hash, thumbnail) for _, image_hash, thumbnail in batch)
+        pack.sync()
+        database.clear_thumbnail_blobs(sourcefile_id for sourcefile_id, _, _ in batch)
+
+        moved_count += len(batch)
+        after_id = batch[-1][0]
+        logging.info(f"Moved {moved_count} thumbnails to the thumbnail pack (up to ID {after_id})")
+    pack.save_index()
+
+    if moved_count and vacuum:
+        logging.info("Vacuuming the database")
+        database.vacuum()
+    logging.info(f"Thumbnail migration finished. Moved {moved_count} thumbnails.")
+    return moved_count
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    backfill_indexed_metadata()
+    move_thumbnails_to_pack()
+    if '--compact' in sys.argv:
+        get_thumbnail_pack().compact()
@@ -0,0 +1,143 @@
+import logging
+import os
+import queue
+import threading
+from itertools import groupby
+from typing import AbstractSet, Iterator, List, Tuple
+
+from config import DISCOVERY_WALKERS, DISCOVERY_QUEUE_SIZE
+
+_DONE = object()
+_PUT_TIMEOUT = 0.1  # Seconds between checks for a consumer that has stopped reading
+
+
+def has_extension(name: str, extensions: AbstractSet[str]) -> bool:
+    """Checks a file name against a set of lower-case extensions without the dot, as in config."""
+    return os.path.splitext(name)[1][1:].lower() in extensions
+
+
+def _stem(entry: os.DirEntry) -> str:
+    return os.path.splitext(entry.name)[0].lower()
+
+
+class _Discovery:
+    """
+    Walks a directory tree with os.scandir in one or more threads and puts the matching
+    files in a bounded queue. The stat result of each file is fetched by the walker, so
+    it is cached on the DirEntry before the consumer sees it.
+    """
+
+    def __init__(self, source_dir: str, extensions: AbstractSet[str], walkers: int, queue_size: int, grouped: bool):
+        self.extensions = extensions
+        # Put the files of a directory that share a name apart from the extension in the queue as one tuple
+        self.grouped = grouped
+        self.walkers = max(1, walkers)
+        self.files: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.dirs: queue.Queue = queue.Queue()
+        self.dirs.put(source_dir)
+        # Directories queued or being scanned; discovery is done when this reaches zero
+        self.pending_dirs = 1
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def _put(self, item) -> bool:
+        while not self.stopped.is_set():
+            try:
+                self.files.put(item, timeout=_PUT_TIMEOUT)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _scan(self, path: str) -> List[str]:
+        """Queues the matching files in a directory and returns its subdirectories, both in name order."""
+        try:
+            with os.scandir(path) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError as e:
+            logging.warning(f"Could not read directory {path}: {e}")
+            return []
+        subdirs = []
+        files = []
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif has_extension(entry.name, self.extensions) and entry.is_file():
+                    entry.stat()
+                    files.append(entry)
+            except OSError as e:
+                logging.warning(f"Could not read {entry.path}: {e}")
+        if self.grouped:
+            files.sort(key=_stem)
+            items = [tuple(group) for _, group in groupby(files, key=_stem)]
+        else:
+            items = files
+        for item in items:
+            if not self._put(item):
+                break
+        return subdirs
+
+    def _walk_serial(self):
+        # Depth first in name order, the same order as a sorted os.walk
+        stack = [self.dirs.get()]
+        while stack and not self.stopped.is_set():
+            stack.extend(reversed(self._scan(stack.pop())))
+        self._put(_DONE)
+
+    def _walk_shared(self):
+        while not self.stopped.is_set():
+            try:
+                path = self.dirs.get(timeout=_PUT_TIMEOUT)
+            except queue.Empty:
+                continue
+            if path is _DONE:
+                return
+            subdirs = self._scan(path)
+            with self.lock:
+                self.pending_dirs += len(subdirs) - 1
+                finished = self.pending_dirs == 0
+            for subdir in subdirs:
+                self.dirs.put(subdir)
+            if finished:
+                for _ in range(self.walkers):
+                    self.dirs.put(_DONE)
+                self._put(_DONE)
+                return
+
+    def __iter__(self) -> Iterator[os.DirEntry]:
+        target = self._walk_serial if self.walkers == 1 else self._walk_shared
+        threads = [threading.Thread(target=target, name=f"discovery-{i}", daemon=True) for i in range(self.walkers)]
+        for thread in threads:
+            thread.start()
+        try:
+            while True:
+                item = self.files.get()
+                if item is _DONE:
+                    return
+                yield item
+        finally:
+            self.stopped.set()
+
+
+def iter_files(source_dir: str, extensions: AbstractSet[str], walkers: int = DISCOVERY_WALKERS,
+               queue_size: int = DISCOVERY_QUEUE_SIZE) -> Iterator[os.DirEntry]:
+    """
+    Yields a DirEntry for every file below source_dir with one of the given extensions.
+
+    The tree is walked in background threads while the caller processes the files,
+    with at most queue_size files found but not yet consumed. With one walker the files
+    come in a stable depth-first name order. More walkers scan several directories at
+    once, which helps on network shares and external disks with high latency, but then
+    the order depends on timing. As with os.walk, symbolic links to directories are not followed.
+    """
+    return iter(_Discovery(source_dir, extensions, walkers, queue_size, grouped=False))
+
+
+def iter_file_groups(source_dir: str, extensions: AbstractSet[str], walkers: int = DISCOVERY_WALKERS,
+                     queue_size: int = DISCOVERY_QUEUE_SIZE) -> Iterator[Tuple[os.DirEntry, ...]]:
+    """
+    Like iter_files, but yields the files of a directory that have the same name apart
+    from the extension together, such as IMG_0001.CR2 and IMG_0001.JPG.
+    """
+    return iter(_Discovery(source_dir, extensions, walkers, queue_size, grouped=True))
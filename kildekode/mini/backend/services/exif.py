@@ -1,8 +1,25 @@
+import bisect
+import itertools
 import logging
+import re
+import struct
 import piexif
-from typing import Optional, Tuple, List
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple, List
 from PIL import Image
 
+# Bump when ImageMetadata gets new fields, so existing rows are picked up by the backfill
+METADATA_VERSION = 2
+
+_EXIF_TIMESTAMP = re.compile(r'^(\d{4}):(\d{2}):(\d{2}) (\d{2}):(\d{2}):(\d{2})')
+
+
+class ImageMetadata(NamedTuple):
+    """EXIF values stored in their own indexed database columns."""
+    taken_at: Optional[str] = None  # 'YYYY-MM-DD HH:MM:SS', sortable as text
+    lat: Optional[float] = None
+    lon: Optional[float] = None
+    camera: Optional[str] = None  # Make and model, e.g. 'Canon EOS 5D Mark IV'
+
 
 def get_raw_exif_from_image(image_path: str) -> Optional[bytes]:
     """
@@ -16,16 +33,257 @@ def get_raw_exif_from_image(image_path: str) -> Optional[bytes]:
         return None
 
 
+def exif_timestamp_to_iso(timestamp: Optional[str]) -> Optional[str]:
+    """
+    Converts an EXIF timestamp ('YYYY:MM:DD HH:MM:SS') to 'YYYY-MM-DD HH:MM:SS'.
+    Returns None for missing or placeholder values such as '0000:00:00 00:00:00'.
+    """
+    if not timestamp:
+        return None
+    match = _EXIF_TIMESTAMP.match(timestamp)
+    if not match or match.group(1) == '0000' or match.group(2) == '00' or match.group(3) == '00':
+        return None
+    year, month, day, hour, minute, second = match.groups()
+    return f"{year}-{month}-{day} {hour}:{minute}:{second}"
+
+
+# TIFF field types and their sizes in bytes
+_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8, 13: 4}
+_ASCII, _SHORT, _LONG, _RATIONAL, _SRATIONAL = 2, 3, 4, 5, 10
+
+# Tags whose value is the offset of another IFD
+_EXIF_POINTER = 0x8769
+_GPS_POINTER = 0x8825
+_INTEROP_POINTER = 0xA005
+_IFD_POINTERS = {_EXIF_POINTER: "Exif", _GPS_POINTER: "GPS", _INTEROP_POINTER: "Interop"}
+# Pointers to structures the reader does not follow; data after them cannot be moved safely
+_UNSUPPORTED_POINTERS = {0x014A}  # SubIFDs
+_THUMBNAIL_OFFSET = 0x0201
+_THUMBNAIL_LENGTH = 0x0202
+# Tags whose values are offsets of image data, which extract_exif does not copy:
+# StripOffsets, TileOffsets, SubIFDs and JPEGInterchangeFormat
+_DATA_POINTERS = {0x0111, 0x0144, 0x014A, _THUMBNAIL_OFFSET}
+
+_MAKE = 0x010F
+_MODEL = 0x0110
+_DATE_TIME_ORIGINAL = 0x9003
+_MAKER_NOTE = 0x927C
+_USER_COMMENT = 0x9286
+_GPS_LATITUDE_REF, _GPS_LATITUDE, _GPS_LONGITUDE_REF, _GPS_LONGITUDE = 1, 2, 3, 4
+
+_REMOVABLE_TAGS = {"MakerNote": ("Exif", _MAKER_NOTE), "UserComment": ("Exif", _USER_COMMENT)}
+_EXIF_HEADER = b"Exif\x00\x00"
+
+
+class _IfdEntry(NamedTuple):
+    tag: int
+    type: int
+    count: int
+    position: int  # Offset of the 12-byte entry
+    data_offset: int  # Offset of the value, inline in the entry if it fits in 4 bytes
+    size: int
+
+    @property
+    def is_inline(self) -> bool:
+        return self.size <= 4
+
+
+class _Ifd(NamedTuple):
+    name: str
+    offset: int
+    entries: List[_IfdEntry]
+    next_offset: Optional[int]  # None for sub-IFDs, whose next pointer is not used (and not always written)
+
+    @property
+    def end(self) -> int:
+        return self.offset + 2 + 12 * len(self.entries) + (4 if self.next_offset is not None else 0)
+
+
+class TiffReader:
+    """
+    Reads EXIF/TIFF structures directly from the bytes through a memoryview.
+    Works both on EXIF blocks and on TIFF-based files such as RAW images.
+    Only the IFDs that are asked for are walked, and only the requested values are decoded.
+    Offsets are relative to the TIFF header, as in the file format.
+    """
+
+    def __init__(self, exif_data: bytes):
+        # The header is checked on a copy, so nothing holds a view of the data if it is invalid
+        head = bytes(exif_data[:14])
+        self.has_header = head[:6] == _EXIF_HEADER
+        if self.has_header:
+            head = head[6:]
+        if head[:2] == b"II":
+            self.endian = "<"
+        elif head[:2] == b"MM":
+            self.endian = ">"
+        else:
+            raise ValueError("Not TIFF data")
+        if len(head) < 8 or struct.unpack_from(self.endian + "H", head, 2)[0] != 42:
+            raise ValueError("Bad TIFF header")
+        self.first_ifd_offset = struct.unpack_from(self.endian + "I", head, 4)[0]
+        self._u16 = struct.Struct(self.endian + "H")
+        self._u32 = struct.Struct(self.endian + "I")
+        self._entry = struct.Struct(self.endian + "HHI")
+        self._view = memoryview(exif_data)
+        self.data = self._view[6:] if self.has_header else self._view
+
+    def release(self):
+        """Releases the memoryview, which is needed before a memory-mapped file can be closed."""
+        self.data.release()
+        self._view.release()
+
+    def u16(self, offset: int) -> int:
+        return self._u16.unpack_from(self.data, offset)[0]
+
+    def u32(self, offset: int) -> int:
+        return self._u32.unpack_from(self.data, offset)[0]
+
+    def read_ifd(self, name: str, offset: int, chained: Optional[bool] = None) -> _Ifd:
+        """
+        Reads the IFD at offset. Chained IFDs (IFD0, IFD1, ...) end with the offset of the
+        next one; by default only "0th" and "1st" are treated as chained.
+        """
+        if chained is None:
+            chained = name in ("0th", "1st")
+        count = self.u16(offset)
+        if offset + 2 + 12 * count + (4 if chained else 0) > len(self.data):
+            raise ValueError(f"IFD {name} runs past the end of the data")
+        entries = []
+        for i in range(count):
+            position = offset + 2 + 12 * i
+            tag, field_type, value_count = self._entry.unpack_from(self.data, position)
+            size = _TYPE_SIZES.get(field_type, 1) * value_count
+            data_offset = position + 8 if size <= 4 else self.u32(position + 8)
+            if data_offset + size > len(self.data):
+                raise ValueError(f"Value of tag {tag:#06x} runs past the end of the data")
+            entries.append(_IfdEntry(tag, field_type, value_count, position, data_offset, size))
+        return _Ifd(name, offset, entries, self.u32(offset + 2 + 12 * count) if chained else None)
+
+    def read_ifds(self, names: Iterable[str]) -> Dict[str, _Ifd]:
+        """Reads IFD0 ("0th") and those of "Exif", "GPS", "Interop" and "1st" that are asked for and present."""
+        names = set(names)
+        ifds = {"0th": self.read_ifd("0th", self.first_ifd_offset)}
+        pending = [ifds["0th"]]
+        while pending:
+            ifd = pending.pop()
+            for entry in ifd.entries:
+                child = _IFD_POINTERS.get(entry.tag)
+                if child and child in names and child not in ifds and entry.type in (_LONG, 13):
+                    ifds[child] = self.read_ifd(child, self.u32(entry.data_offset))
+                    pending.append(ifds[child])
+        if "1st" in names and ifds["0th"].next_offset:
+            ifds["1st"] = self.read_ifd("1st", ifds["0th"].next_offset)
+        return ifds
+
+    def value(self, entry: _IfdEntry):
+        """Decodes the value of an entry: str for ASCII, int or tuple of ints/rationals, or bytes."""
+        raw = self.data[entry.data_offset:entry.data_offset + entry.size]
+        if entry.type == _ASCII:
+            return bytes(raw).split(b"\x00", 1)[0].decode("utf-8", errors="replace")
+        if entry.type in (_SHORT, _LONG):
+            values = struct.unpack_from(f"{self.endian}{entry.count}{'H' if entry.type == _SHORT else 'I'}", raw)
+            return values[0] if entry.count == 1 else values
+        if entry.type in (_RATIONAL, _SRATIONAL):
+            values = struct.unpack_from(f"{self.endian}{2 * entry.count}{'I' if entry.type == _RATIONAL else 'i'}", raw)
+            return tuple(zip(values[0::2], values[1::2]))
+        return bytes(raw)
+
+
+def read_exif_tags(exif_data: bytes, wanted: Dict[str, Iterable[int]]) -> Dict[str, Dict[int, object]]:
+    """
+    Reads only the requested tags, e.g. {"Exif": [0x9003], "GPS": [1, 2]}, without
+    parsing the rest of the EXIF data. IFD names are those used by piexif.
+    Raises ValueError if the data is not valid EXIF.
+    """
+    try:
+        reader = TiffReader(exif_data)
+        ifds = reader.read_ifds(wanted)
+        result: Dict[str, Dict[int, object]] = {}
+        for name, tags in wanted.items():
+            ifd = ifds.get(name)
+            tags = set(tags)
+            result[name] = {entry.tag: reader.value(entry) for entry in ifd.entries if entry.tag in tags} if ifd else {}
+        return result
+    except struct.error as e:
+        raise ValueError(f"Truncated EXIF data: {e}") from e
+
+
+def _timestamp_from_tags(tags: Dict[str, Dict[int, object]]) -> Optional[str]:
+    value = tags["Exif"].get(_DATE_TIME_ORIGINAL)
+    return value if isinstance(value, str) and value else None
+
+
+def _coordinates_from_tags(tags: Dict[str, Dict[int, object]]) -> Optional[Tuple[float, float]]:
+    gps = tags["GPS"]
+    lat_tuple = gps.get(_GPS_LATITUDE)
+    lat_ref = gps.get(_GPS_LATITUDE_REF)
+    lon_tuple = gps.get(_GPS_LONGITUDE)
+    lon_ref = gps.get(_GPS_LONGITUDE_REF)
+
+    if all((lat_tuple, lat_ref, lon_tuple, lon_ref)):
+        def convert_to_decimal(coord_tuple: tuple) -> float:
+            d = coord_tuple[0][0] / coord_tuple[0][1]
+            m = coord_tuple[1][0] / coord_tuple[1][1]
+            s = coord_tuple[2][0] / coord_tuple[2][1]
+            return d + (m / 60.0) + (s / 3600.0)
+
+        latitude = convert_to_decimal(lat_tuple)
+        if lat_ref == 'S':
+            latitude = -latitude
+
+        longitude = convert_to_decimal(lon_tuple)
+        if lon_ref == 'W':
+            longitude = -longitude
+
+        return latitude, longitude
+    return None
+
+
+def _camera_from_tags(tags: Dict[str, Dict[int, object]]) -> Optional[str]:
+    """
+    Joins make and model, leaving out the make when the model already starts with
+    its first word: 'Canon' + 'Canon EOS R5' and 'NIKON CORPORATION' + 'NIKON D750'.
+    """
+    make, model = (tags["0th"].get(tag) for tag in (_MAKE, _MODEL))
+    make = make.strip(' \x00') if isinstance(make, str) else ''
+    model = model.strip(' \x00') if isinstance(model, str) else ''
+    if make and model.lower().startswith(make.split()[0].lower()):
+        return model
+    return ' '.join(part for part in (make, model) if part) or None
+
+
+_CAMERA_TAGS = {"0th": (_MAKE, _MODEL)}
+_TIMESTAMP_TAGS = {"Exif": (_DATE_TIME_ORIGINAL,)}
+_GPS_TAGS = {"GPS": (_GPS_LATITUDE_REF, _GPS_LATITUDE, _GPS_LONGITUDE_REF, _GPS_LONGITUDE)}
+
+
+def parse_indexed_metadata(exif_data: Optional[bytes]) -> ImageMetadata:
+    """Extracts the values stored in indexed columns (taken time, GPS position and camera) from EXIF data."""
+    if not exif_data:
+        return ImageMetadata()
+    try:
+        tags = read_exif_tags(exif_data, {**_CAMERA_TAGS, **_TIMESTAMP_TAGS, **_GPS_TAGS})
+    except ValueError as e:
+        logging.warning(f"Could not parse metadata from EXIF: {e}")
+        return ImageMetadata()
+    taken_at = exif_timestamp_to_iso(_timestamp_from_tags(tags))
+    try:
+        coordinates = _coordinates_from_tags(tags)
+    except (IndexError, TypeError, ZeroDivisionError) as e:
+        logging.warning(f"Could not parse GPS from EXIF: {e}")
+        coordinates = None
+    lat, lon = coordinates if coordinates else (None, None)
+    return ImageMetadata(taken_at, lat, lon, _camera_from_tags(tags))
+
+
 def parse_taken_timestamp(exif_data: bytes) -> Optional[str]:
     """Extracts the photo's creation timestamp from EXIF data."""
     if not exif_data:
         return None
     try:
-        exif_dict = piexif.load(exif_data)
-        date_bytes = exif_dict.get("Exif", {}).get(piexif.ExifIFD.DateTimeOriginal)
-        if date_bytes:
-            return date_bytes.decode("utf-8")
-    except (piexif.InvalidImageDataError, ValueError, KeyError) as e:
+        return _timestamp_from_tags(read_exif_tags(exif_data, _TIMESTAMP_TAGS))
+    except ValueError as e:
         logging.warning(f"Could not parse timestamp from EXIF: {e}")
     return None
 
@@ -35,43 +293,184 @@ def parse_gps_coordinates(exif_data: bytes) -> Optional[Tuple[float, float]]:
     if not exif_data:
         return None
     try:
-        exif_dict = piexif.load(exif_data)
-        gps = exif_dict.get("GPS")
-        if gps:
-            lat_tuple = gps.get(piexif.GPSIFD.GPSLatitude)
-            lat_ref = gps.get(piexif.GPSIFD.GPSLatitudeRef)
-            lon_tuple = gps.get(piexif.GPSIFD.GPSLongitude)
-            lon_ref = gps.get(piexif.GPSIFD.GPSLongitudeRef)
-
-            if all((lat_tuple, lat_ref, lon_tuple, lon_ref)):
-                def convert_to_decimal(coord_tuple: tuple) -> float:
-                    d = coord_tuple[0][0] / coord_tuple[0][1]
-                    m = coord_tuple[1][0] / coord_tuple[1][1]
-                    s = coord_tuple[2][0] / coord_tuple[2][1]
-                    return d + (m / 60.0) + (s / 3600.0)
-
-                latitude = convert_to_decimal(lat_tuple)
-                if lat_ref.decode() == 'S':
-                    latitude = -latitude
-
-                longitude = convert_to_decimal(lon_tuple)
-                if lon_ref.decode() == 'W':
-                    longitude = -longitude
-
-                return latitude, longitude
-    except (piexif.InvalidImageDataError, ValueError, KeyError, ZeroDivisionError) as e:
+        return _coordinates_from_tags(read_exif_tags(exif_data, _GPS_TAGS))
+    except (ValueError, IndexError, TypeError, ZeroDivisionError) as e:
         logging.warning(f"Could not parse GPS from EXIF: {e}")
     return None
 
 
+def _strip_tags(exif_data: bytes, tags_to_remove: List[str]) -> bytes:
+    """
+    Removes tags by cutting their bytes out of the EXIF data and rewriting the offsets
+    that point past the cuts. Everything else is copied as it is.
+    Raises ValueError if the data has a layout this cannot handle safely.
+    """
+    reader = TiffReader(exif_data)
+    ifds = reader.read_ifds(("Exif", "GPS", "Interop", "1st"))
+    data = reader.data
+
+    removed_entries = {(ifd_name, tag) for name, (ifd_name, tag) in _REMOVABLE_TAGS.items() if name in tags_to_remove}
+    remove_thumbnail = "thumbnail" in tags_to_remove and "1st" in ifds
+
+    removed: List[Tuple[int, int]] = []
+    kept: List[Tuple[int, int]] = [(0, 8)]
+    for ifd in ifds.values():
+        if ifd.name == "1st" and remove_thumbnail:
+            removed.append((ifd.offset, ifd.end))
+            for entry in ifd.entries:
+                if not entry.is_inline:
+                    removed.append((entry.data_offset, entry.data_offset + entry.size))
+            values = {entry.tag: reader.value(entry) for entry in ifd.entries
+                      if entry.tag in (_THUMBNAIL_OFFSET, _THUMBNAIL_LENGTH)}
+            if _THUMBNAIL_OFFSET in values and values.get(_THUMBNAIL_LENGTH):
+                start = values[_THUMBNAIL_OFFSET]
+                removed.append((start, min(start + values[_THUMBNAIL_LENGTH], len(data))))
+            continue
+        dropped = 0
+        for entry in ifd.entries:
+            if entry.tag in _UNSUPPORTED_POINTERS:
+                raise ValueError(f"Unsupported pointer tag {entry.tag:#06x}")
+            if (ifd.name, entry.tag) in removed_entries:
+                dropped += 1
+                if not entry.is_inline:
+                    removed.append((entry.data_offset, entry.data_offset + entry.size))
+            elif not entry.is_inline:
+                kept.append((entry.data_offset, entry.data_offset + entry.size))
+        # The remaining entries move up, so the IFD shrinks from its end
+        if dropped:
+            removed.append((ifd.end - 12 * dropped, ifd.end))
+        kept.append((ifd.offset, ifd.end - 12 * dropped))
+        if ifd.name == "1st":
+            thumbnail = {entry.tag: reader.value(entry) for entry in ifd.entries}
+            if _THUMBNAIL_OFFSET in thumbnail and thumbnail.get(_THUMBNAIL_LENGTH):
+                kept.append((thumbnail[_THUMBNAIL_OFFSET], thumbnail[_THUMBNAIL_OFFSET] + thumbnail[_THUMBNAIL_LENGTH]))
+
+    if not removed:
+        return exif_data
+
+    # Merge the removed ranges and keep the total shift even, as TIFF offsets should be word aligned
+    removed.sort()
+    merged: List[List[int]] = []
+    for start, end in removed:
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    for cut in merged:
+        if (cut[1] - cut[0]) % 2:
+            cut[1] -= 1
+    merged = [cut for cut in merged if cut[1] > cut[0]]
+    for kept_start, kept_end in kept:
+        for start, end in merged:
+            if start < kept_end and kept_start < end:
+                raise ValueError("Removed data overlaps data that is kept")
+
+    cut_ends = [end for _, end in merged]
+    cut_totals = list(itertools.accumulate(end - start for start, end in merged))
+
+    def shift(offset: int) -> int:
+        index = bisect.bisect_right(cut_ends, offset)
+        return offset - (cut_totals[index - 1] if index else 0)
+
+    out = bytearray()
+    position = 0
+    for start, end in merged:
+        out += data[position:start]
+        position = end
+    out += data[position:]
+
+    pack_u16 = struct.Struct(reader.endian + "H").pack_into
+    pack_u32 = struct.Struct(reader.endian + "I").pack_into
+    pack_u32(out, 4, shift(reader.first_ifd_offset))
+    for ifd in ifds.values():
+        if ifd.name == "1st" and remove_thumbnail:
+            continue
+        entries = [entry for entry in ifd.entries if (ifd.name, entry.tag) not in removed_entries]
+        new_offset = shift(ifd.offset)
+        pack_u16(out, new_offset, len(entries))
+        for i, entry in enumerate(entries):
+            position = new_offset + 2 + 12 * i
+            out[position:position + 12] = data[entry.position:entry.position + 12]
+            if not entry.is_inline:
+                pack_u32(out, position + 8, shift(entry.data_offset))
+            elif entry.tag in _IFD_POINTERS or (ifd.name == "1st" and entry.tag == _THUMBNAIL_OFFSET):
+                pack_u32(out, position + 8, shift(reader.u32(entry.data_offset)))
+        if ifd.next_offset is not None:
+            next_offset = 0 if ifd.name == "0th" and remove_thumbnail else ifd.next_offset
+            pack_u32(out, new_offset + 2 + 12 * len(entries), shift(next_offset) if next_offset else 0)
+
+    return (_EXIF_HEADER + out) if reader.has_header else bytes(out)
+
+
+def extract_exif(reader: TiffReader, ifd0_tags: Optional[Iterable[int]] = None) -> bytes:
+    """
+    Builds a standalone EXIF block, with the Exif header, from IFD0 and the Exif, Interop
+    and GPS IFDs read by reader, such as those of a RAW file. The entries are copied with
+    their types and values as they are; with ifd0_tags only those IFD0 tags are kept.
+    The 1st IFD, and tags pointing at image data, are left out.
+    Raises ValueError or struct.error if the IFDs cannot be read.
+    """
+    ifds = reader.read_ifds(("Exif", "Interop", "GPS"))
+    ifd0_tags = set(ifd0_tags) if ifd0_tags is not None else None
+    pointers = {"0th": {_EXIF_POINTER: "Exif", _GPS_POINTER: "GPS"}, "Exif": {_INTEROP_POINTER: "Interop"}}
+
+    def copied(name: str, entry: _IfdEntry) -> bool:
+        if entry.tag in _IFD_POINTERS:
+            return pointers.get(name, {}).get(entry.tag) in ifds
+        if entry.tag in _DATA_POINTERS:
+            return False
+        return name != "0th" or ifd0_tags is None or entry.tag in ifd0_tags
+
+    # Each IFD is followed by its values, in the order piexif writes them
+    names = [name for name in ("0th", "Exif", "Interop", "GPS") if name in ifds]
+    entries = {name: sorted((entry for entry in ifds[name].entries if copied(name, entry)), key=lambda e: e.tag)
+               for name in names}
+    ifd_offsets: Dict[str, int] = {}
+    value_offsets: Dict[Tuple[str, int], int] = {}
+    end = 8
+    for name in names:
+        ifd_offsets[name] = end
+        end += 2 + 12 * len(entries[name]) + 4
+        for entry in entries[name]:
+            if not entry.is_inline and entry.tag not in _IFD_POINTERS:
+                value_offsets[(name, entry.tag)] = end
+                end += entry.size + entry.size % 2
+
+    out = bytearray(end)
+    data = reader.data
+    out[:2] = b"II" if reader.endian == "<" else b"MM"
+    struct.pack_into(reader.endian + "HI", out, 2, 42, 8)
+    for name in names:
+        struct.pack_into(reader.endian + "H", out, ifd_offsets[name], len(entries[name]))
+        for i, entry in enumerate(entries[name]):
+            position = ifd_offsets[name] + 2 + 12 * i
+            out[position:position + 8] = data[entry.position:entry.position + 8]
+            if entry.tag in _IFD_POINTERS:
+                struct.pack_into(reader.endian + "I", out, position + 8, ifd_offsets[pointers[name][entry.tag]])
+            elif entry.is_inline:
+                out[position + 8:position + 12] = data[entry.position + 8:entry.position + 12]
+            else:
+                value_offset = value_offsets[(name, entry.tag)]
+                struct.pack_into(reader.endian + "I", out, position + 8, value_offset)
+                out[value_offset:value_offset + entry.size] = data[entry.data_offset:entry.data_offset + entry.size]
+        # The next IFD offset stays 0: there is no 1st IFD
+    return _EXIF_HEADER + bytes(out)
+
+
 def clean_exif_data(exif_data: bytes, tags_to_remove: List[str]) -> bytes:
     """
     Removes a list of specified tags from EXIF data to reduce size.
     Recognized tags: "thumbnail", "MakerNote", "UserComment".
     Returns the modified EXIF data as bytes.
+    The tags are cut out of the original bytes; a full piexif load and dump is only
+    used for unusual layouts that cannot be edited in place.
     """
     if not exif_data:
         return exif_data
+    try:
+        return _strip_tags(exif_data, tags_to_remove)
+    except (ValueError, struct.error) as e:
+        logging.debug(f"Falling back to piexif to clean EXIF data: {e}")
     try:
         exif_dict = piexif.load(exif_data)
 
@@ -88,4 +487,4 @@ def clean_exif_data(exif_data: bytes, tags_to_remove: List[str]) -> bytes:
         return piexif.dump(exif_dict)
     except Exception as e:
         logging.warning(f"Could not clean EXIF data: {e}")
-        return exif_data  # Return original data on error
\ No newline at end of file
+        return exif_data  # Return original data on error
@@ -1,118 +1,475 @@
 import os
 import logging
 import io
-from typing import Tuple
+import hashlib
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import BinaryIO, Deque, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
 from PIL import Image
 import imagehash
 
 import database
+from models import ScanManifestEntry
 from services import exif as exif_service
-from config import THUMBNAIL_SIZE, LARGE_PATH, LARGE_SIZE
+from services import hashset
+from services import similarity
+from services import discovery
+from services import raw
+from services.thumbpack import get_thumbnail_pack
+from config import (THUMBNAIL_SIZE, LARGE_PATH, LARGE_SIZE, IMPORT_BATCH_SIZE, NEAR_DUPLICATE_DISTANCE,
+                    ALLOWED_EXTENSIONS, RAW_EXTENSIONS, DISCOVERY_WALKERS, CREATE_PREVIEWS_ON_IMPORT)
 
-def get_preview_path(image_hash: str) -> str:
+TAGS_TO_REMOVE = ["thumbnail", "MakerNote", "UserComment"]
+FINGERPRINT_CHUNK = 64 * 1024  # Bytes read from each end of a file for the scan manifest fingerprint
+
+def get_preview_path(image_hash: str, size: Optional[int] = None) -> str:
     """
     Constructs a nested file path from an image hash to avoid having
     too many files in a single directory.
     Example: 'f068999999996868' -> 'C:/temp/00imalink/large/f0/68/f068999999996868.jpg'
+    Other sizes than LARGE_SIZE get the longest side in the name: 'f068999999996868_800.jpg'.
     """
     dir1 = image_hash[0:2]
     dir2 = image_hash[2:4]
-    filename = f"{image_hash}.jpg"
+    if size is None or size == max(LARGE_SIZE):
+        filename = f"{image_hash}.jpg"
+    else:
+        filename = f"{image_hash}_{size}.jpg"
     return os.path.join(LARGE_PATH, dir1, dir2, filename)
 
-def create_preview_image(source_path: str, target_path: str, size: Tuple[int, int]):
+def _encode_jpeg(img: Image.Image, quality: int, optimize: bool = False) -> bytes:
+    """Encodes an image as JPEG bytes, converting to RGB first if needed."""
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=quality, optimize=optimize)
+    return buf.getvalue()
+
+def _load_reduced(img: Image.Image, size: Tuple[int, int]) -> Image.Image:
     """
-    Creates a downscaled version of an image, ensuring the target directory exists.
+    Loads an opened image scaled down to fit within size.
+    For JPEG files draft() lets the decoder scale by 1/2, 1/4 or 1/8 in the
+    DCT domain, so large originals are never decoded at full resolution.
+    """
+    img.draft('RGB', size)
+    # thumbnail() does not load images that are already small enough
+    img.load()
+    img.thumbnail(size, reducing_gap=None)
+    return img
+
+def _image_stream(f: BinaryIO, image_path: str) -> Tuple[BinaryIO, Optional[raw.RawPreview]]:
+    """
+    Returns the stream to decode for an image file: the file itself, or for RAW files
+    the largest embedded JPEG preview, which is returned with it.
+    """
+    if discovery.has_extension(image_path, RAW_EXTENSIONS):
+        raw_preview = raw.extract_preview(f)
+        return io.BytesIO(raw_preview.jpeg), raw_preview
+    return f, None
+
+def _open_stream(stream: BinaryIO, raw_preview: Optional[raw.RawPreview]) -> Tuple[Image.Image, Optional[bytes]]:
+    """Opens a stream from _image_stream from the start, and returns the image with its raw EXIF data."""
+    stream.seek(0)
+    img = Image.open(stream)
+    return img, raw_preview.exif_data if raw_preview else img.info.get('exif')
+
+def open_image(f: BinaryIO, image_path: str) -> Tuple[Image.Image, Optional[bytes]]:
+    """
+    Opens an image file and returns it with its raw EXIF data. For RAW files
+    this is the largest embedded JPEG preview and the EXIF data of the RAW file.
+    """
+    return _open_stream(*_image_stream(f, image_path))
+
+def create_preview_bytes(source_path: str, size: Tuple[int, int]) -> bytes | None:
+    """Creates a downscaled JPEG version of an image and returns it as bytes."""
+    try:
+        with open(source_path, 'rb') as f:
+            img, _ = open_image(f, source_path)
+            return _encode_jpeg(_load_reduced(img, size), quality=85, optimize=True)
+    except Exception as e:
+        logging.error(f"Failed to create preview for {source_path}: {e}")
+        return None
+
+def save_preview_image(preview_bytes: bytes, target_path: str):
+    """
+    Writes an encoded preview image, ensuring the target directory exists.
+    The file is written under a temporary name and renamed, so a preview that is
+    being served is never seen half written.
     """
     try:
         target_dir = os.path.dirname(target_path)
         os.makedirs(target_dir, exist_ok=True)
-
-        with Image.open(source_path) as img:
-            img.thumbnail(size)
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            img.save(target_path, "JPEG", quality=85, optimize=True)
+        tmp_path = f"{target_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(preview_bytes)
+        os.replace(tmp_path, target_path)
         logging.info(f"Successfully created preview: {os.path.basename(target_path)}")
     except Exception as e:
-        logging.error(f"Failed to create preview for {source_path}: {e}")
+        logging.error(f"Failed to save preview {target_path}: {e}")
+
+def create_preview_image(source_path: str, target_path: str, size: Tuple[int, int]):
+    """
+    Creates a downscaled version of an image, ensuring the target directory exists.
+    """
+    preview_bytes = create_preview_bytes(source_path, size)
+    if preview_bytes:
+        save_preview_image(preview_bytes, target_path)
 
-def import_photos(source_dir: str):
+def _fingerprint(f: BinaryIO) -> str:
+    """Hashes the size and the first and last FINGERPRINT_CHUNK bytes of an open file."""
+    size = os.fstat(f.fileno()).st_size
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    digest.update(f.read(FINGERPRINT_CHUNK))
+    if size > 2 * FINGERPRINT_CHUNK:
+        f.seek(-FINGERPRINT_CHUNK, os.SEEK_END)
+        digest.update(f.read(FINGERPRINT_CHUNK))
+    elif size > FINGERPRINT_CHUNK:
+        digest.update(f.read())
+    f.seek(0)
+    return digest.hexdigest()
+
+def file_fingerprint(path: str) -> str:
+    """
+    Returns a cheap content fingerprint of a file, used by the scan manifest to
+    tell whether a file with a new modification time has really changed.
+    """
+    with open(path, 'rb') as f:
+        return _fingerprint(f)
+
+def _create_thumbnail_and_hash(img: Image.Image) -> Tuple[bytes, str]:
+    """
+    Creates the thumbnail of an opened image and the perceptual hash of the encoded
+    thumbnail. Duplicates are found by exact hash, so these are made exactly as by
+    earlier versions of the importer, with thumbnail()'s own draft decode and the
+    hash of the JPEG as stored; otherwise a re-import would add the same files again.
+    """
+    img.thumbnail(THUMBNAIL_SIZE)
+    thumbnail_bytes = _encode_jpeg(img, quality=90)
+    with Image.open(io.BytesIO(thumbnail_bytes)) as thumb_image:
+        return thumbnail_bytes, str(imagehash.phash(thumb_image))
+
+
+class ProcessedImage(NamedTuple):
+    """Result of the CPU-bound part of the import for a single file."""
+    image_hash: str
+    thumbnail: bytes
+    preview: Optional[bytes]
+    exif_data: Optional[bytes]
+    fingerprint: str
+    metadata: exif_service.ImageMetadata
+
+
+def process_image(image_path: str, encode_preview: bool = True, known_hashes=None) -> Optional[ProcessedImage]:
+    """
+    Runs the CPU-bound work for one file: preview, thumbnail, perceptual hash,
+    EXIF cleaning and parsing of the indexed metadata.
+    The file is opened once, and its fingerprint for the scan manifest is taken
+    from the same handle. The thumbnail and hash are made first, see
+    _create_thumbnail_and_hash, and the preview from a second decode at reduced scale.
+    For RAW files the largest embedded JPEG preview is used instead of the
+    sensor data, so they cost about the same as a JPEG; it is found once and
+    decoded from memory both times.
+    No preview is made without encode_preview, or if the hash is in known_hashes,
+    the images already imported, since the file is then skipped as a duplicate.
+    This is executed in worker processes when importing in parallel, so it
+    must not touch the database or write to the preview directory.
+    """
+    try:
+        with open(image_path, 'rb') as f:
+            fingerprint = _fingerprint(f)
+
+            # 1. Open the image and take the raw EXIF data from it
+            stream, raw_preview = _image_stream(f, image_path)
+            img, raw_exif = _open_stream(stream, raw_preview)
+
+            # 2. Thumbnail and perceptual hash
+            thumbnail_bytes, hash_str = _create_thumbnail_and_hash(img)
+
+            # 3. Preview, decoded at (close to) preview size, unless the file is a duplicate
+            preview_bytes = None
+            if encode_preview and (known_hashes is None or hash_str not in known_hashes):
+                preview = _load_reduced(_open_stream(stream, raw_preview)[0], LARGE_SIZE)
+                preview_bytes = _encode_jpeg(preview, quality=85, optimize=True)
+    except Exception as e:
+        logging.error(f"Failed to process image {image_path}: {e}")
+        return None
+
+    # 4. Clean the EXIF data and extract the values stored in indexed columns
+    cleaned_exif = exif_service.clean_exif_data(raw_exif, TAGS_TO_REMOVE)
+    metadata = exif_service.parse_indexed_metadata(cleaned_exif)
+
+    return ProcessedImage(hash_str, thumbnail_bytes, preview_bytes, cleaned_exif, fingerprint, metadata)
+
+
+# The image hashes in the database when the import started, in each worker process
+_worker_known_hashes = None
+
+
+def _init_worker(log_level: int, known_hashes):
+    """
+    Configures logging in worker processes, which do not inherit it on spawn-based
+    platforms, and stores the known image hashes for _process_in_worker.
+    """
+    global _worker_known_hashes
+    logging.basicConfig(level=log_level, format='%(asctime)s - %(levelname)s - %(message)s')
+    _worker_known_hashes = known_hashes
+
+
+def _process_in_worker(image_path: str, encode_preview: bool) -> Optional[ProcessedImage]:
+    return process_image(image_path, encode_preview, _worker_known_hashes)
+
+
+def _process_files(paths: Iterable[str], workers: int, encode_preview: bool = True,
+                   known_hashes=None) -> Iterator[Tuple[str, Future]]:
+    """
+    Yields (path, future) pairs in the same order as `paths`.
+    With more than one worker the files are processed in a process pool, keeping
+    a bounded number of files in flight so finished previews do not pile up in memory.
+    No previews are made for files whose hash is in known_hashes. Worker processes get
+    a compact copy of it as it was when the pool started, so they still make previews
+    for copies of files first found by the same import; a serial import sees every hash.
+    """
+    if workers <= 1:
+        for path in paths:
+            future: Future = Future()
+            try:
+                future.set_result(process_image(path, encode_preview, known_hashes))
+            except Exception as e:
+                future.set_exception(e)
+            yield path, future
+        return
+
+    max_in_flight = workers * 4
+    frozen_hashes = known_hashes.frozen() if known_hashes is not None else None
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(logging.getLogger().getEffectiveLevel(), frozen_hashes)) as pool:
+        in_flight: Deque[Tuple[str, Future]] = deque()
+        for path in paths:
+            in_flight.append((path, pool.submit(_process_in_worker, path, encode_preview)))
+            if len(in_flight) >= max_in_flight:
+                yield in_flight.popleft()
+        while in_flight:
+            yield in_flight.popleft()
+
+
+def _find_image_files(source_dir: str, walkers: int = DISCOVERY_WALKERS) -> Iterator[Tuple[os.DirEntry, Optional[str]]]:
+    """
+    Yields (file, raw_path) for the image files below source_dir as they are found.
+    A RAW file with a JPEG (or other image) of the same name in the same directory is
+    not imported on its own; the pair is imported once from the JPEG, with the path of
+    the RAW file as raw_path.
+    """
+    for group in discovery.iter_file_groups(source_dir, ALLOWED_EXTENSIONS, walkers=walkers):
+        raws = [entry for entry in group if discovery.has_extension(entry.name, RAW_EXTENSIONS)]
+        others = [entry for entry in group if not discovery.has_extension(entry.name, RAW_EXTENSIONS)]
+        if raws and others:
+            others.sort(key=lambda entry: not discovery.has_extension(entry.name, {'jpg', 'jpeg'}))
+            yield others[0], raws[0].path
+            group = others[1:] + raws[1:]
+        for entry in group:
+            yield entry, None
+
+
+class _RescanFilter:
+    """
+    Drops files that have not changed since they were last scanned, according to the scan manifest.
+    A file is unchanged if its size and modification time match. If only the modification
+    time differs, the file fingerprint decides, and the manifest entry is refreshed.
+    """
+
+    def __init__(self, manifest: Dict[str, ScanManifestEntry]):
+        self.manifest = manifest
+        self.unchanged_count = 0
+        # Manifest entries with a new modification time but the same content
+        self.refreshed: List[ScanManifestEntry] = []
+        # (size, mtime_ns, raw_path) of the files passed on for processing
+        self.file_stats: Dict[str, Tuple[int, int, Optional[str]]] = {}
+
+    def __call__(self, files: Iterable[Tuple[os.DirEntry, Optional[str]]]) -> Iterator[str]:
+        for dir_entry, raw_path in files:
+            path = dir_entry.path
+            st = dir_entry.stat()
+            entry = self.manifest.get(path)
+            if entry and entry.size == st.st_size:
+                if entry.mtime_ns == st.st_mtime_ns:
+                    self.unchanged_count += 1
+                    continue
+                if file_fingerprint(path) == entry.fingerprint:
+                    self.unchanged_count += 1
+                    self.refreshed.append(entry._replace(mtime_ns=st.st_mtime_ns))
+                    continue
+            self.file_stats[path] = (st.st_size, st.st_mtime_ns, raw_path)
+            yield path
+
+
+def _is_duplicate(image_hash: str, known_hashes, pending_hashes: Set[str]) -> bool:
+    """
+    Checks a hash against the in-memory hash set. Hits in a Bloom filter may be
+    false positives and are confirmed against the pending rows and the database.
+    """
+    if image_hash not in known_hashes:
+        return False
+    return known_hashes.exact or image_hash in pending_hashes or database.image_hash_exists(image_hash)
+
+
+def _log_written(ids: List[int]):
+    if ids:
+        logging.info(f"Added {len(ids)} files to the database with IDs {ids[0]}-{ids[-1]}")
+
+
+def import_photos(source_dir: str, workers: int = 1, batch_size: int = IMPORT_BATCH_SIZE, full_rescan: bool = False,
+                  bloom_filter: Optional[bool] = None, walkers: int = DISCOVERY_WALKERS,
+                  create_previews: bool = CREATE_PREVIEWS_ON_IMPORT, near_duplicates: Optional[bool] = None):
     """
     Scans a directory for images, generates thumbnails and previews,
     and saves metadata to the database.
+
+    With workers > 1 the image processing runs in a process pool, while duplicate
+    detection and database writes stay in this process and are done in the order
+    the files were found, so the result is the same as for a serial import.
+    New rows are inserted in transactions of batch_size rows.
+
+    Files that are unchanged since an earlier import are skipped using the scan
+    manifest, unless full_rescan is set.
+
+    Duplicates are found with an in-memory set of the hashes in the database,
+    see hashset.load_image_hash_set for the bloom_filter option.
+
+    The directory tree is walked by `walkers` background threads while files are
+    processed, so a large tree does not have to be listed before the import starts.
+
+    RAW files are imported from their embedded JPEG preview. A RAW file next to a
+    JPEG with the same name is stored as the raw_filename of the JPEG's row.
+
+    Without create_previews no preview files are written; they are then rendered
+    the first time they are shown, see services.previews.
+
+    Near-duplicates of images in the library are imported and reported, using the
+    similarity index. The index holds every hash in memory, so by default it is only
+    used when the exact hash set is; with near_duplicates set it is used either way.
     """
-    logging.info(f"Starting photo import from directory: {source_dir}")
+    logging.info(f"Starting photo import from directory: {source_dir} (workers: {workers})")
     database.init_db()
 
-    tags_to_remove = ["thumbnail", "MakerNote", "UserComment"]
-    logging.info(f"The following EXIF tags will be removed: {tags_to_remove}")
+    logging.info(f"The following EXIF tags will be removed: {TAGS_TO_REMOVE}")
+
+    rescan_filter = _RescanFilter({} if full_rescan else database.get_scan_manifest(source_dir))
+    # Manifest entries are written after the rows they describe, so an interrupted
+    # import never marks a file as done before it is in the database.
+    manifest_updates: List[ScanManifestEntry] = []
+    # Entries of the files queued in the batch writer, moved to manifest_updates when
+    # their batch is committed and dropped if it fails, so the files are tried again
+    queued_manifest: List[ScanManifestEntry] = []
+
+    def batch_written(ids: List[int]):
+        _log_written(ids)
+        manifest_updates.extend(queued_manifest)
+        queued_manifest.clear()
+        write_manifest()
+
+    def write_manifest():
+        database.upsert_scan_manifest(rescan_filter.refreshed + manifest_updates)
+        rescan_filter.refreshed.clear()
+        manifest_updates.clear()
+
+    # All hashes in the database, kept in memory and updated as files are added
+    known_hashes = hashset.load_image_hash_set(bloom_filter)
+    # Hashes of files queued in the batch writer but not yet committed
+    pending_hashes: Set[str] = set()
+    if near_duplicates is None:
+        near_duplicates = known_hashes.exact
+    if not near_duplicates:
+        logging.info("Near-duplicate detection is off for this import")
+
+    def batch_failed(error: database.BatchWriteError):
+        # The files were not added, so they are neither duplicates of later files nor done
+        logging.error(f"{error}. Files not imported: {', '.join(error.filenames)}")
+        for image_hash in pending_hashes:
+            known_hashes.discard(image_hash)
+        pending_hashes.clear()
+        queued_manifest.clear()
 
     processed_files_count = 0
     duplicates_found_count = 0
-    for root, _, files in os.walk(source_dir):
-        for file in files:
-            if file.lower().endswith((".jpg", ".jpeg")):
-                processed_files_count += 1
-                full_path = os.path.join(root, file)
-                logging.info(f"Processing: {full_path}")
-
-                try:
-                    # 1. Create thumbnail
-                    thumbnail_bytes = create_thumbnail(full_path)
-                    if not thumbnail_bytes:
-                        continue
-
-                    # 2. Calculate perceptual hash from thumbnail
-                    thumb_image = Image.open(io.BytesIO(thumbnail_bytes))
-                    hash_val = imagehash.phash(thumb_image)
-                    hash_str = str(hash_val)
-
-                    # 3. Check for duplicates using the hash
-                    existing_file = database.get_sourcefile_by_hash(hash_str)
-                    if existing_file:
-                        logging.warning(f'Duplicate found for "{os.path.basename(full_path)}". Existing file is "{existing_file.filename}". Skipping.')
-                        duplicates_found_count += 1
-                        continue
-
-                    # 4. Create and save preview image using config values
-                    preview_path = get_preview_path(hash_str)
-                    create_preview_image(full_path, preview_path, LARGE_SIZE)
-
-                    # 5. Get raw EXIF data
-                    raw_exif = exif_service.get_raw_exif_from_image(full_path)
-
-                    # 6. Clean the EXIF data
-                    cleaned_exif = exif_service.clean_exif_data(raw_exif, tags_to_remove)
-
-                    # 7. Add to database
-                    new_id = database.add_sourcefile(
-                        filename=full_path,
-                        image_hash=hash_str,
-                        thumbnail=thumbnail_bytes,
-                        exif_data=cleaned_exif
-                    )
-                    logging.info(f'Successfully added "{os.path.basename(full_path)}" with new ID: {new_id}')
-
-                except Exception as e:
-                    logging.error(f"Failed to import {full_path}: {e}", exc_info=True)
-
-    if processed_files_count == 0:
-        logging.warning(f"No .jpg or .jpeg files found in '{source_dir}'.")
-
-    logging.info(f"Photo import process finished. Processed {processed_files_count} files. Found and skipped {duplicates_found_count} duplicates.")
+    near_duplicates_count = 0
+    with database.SourceFileBatchWriter(batch_size=batch_size) as writer:
+        files = rescan_filter(_find_image_files(source_dir, walkers))
+        for full_path, future in _process_files(files, workers, create_previews, known_hashes):
+            processed_files_count += 1
+            size, mtime_ns, raw_path = rescan_filter.file_stats.pop(full_path)
+            logging.info(f"Processing: {full_path}")
+
+            try:
+                processed = future.result()
+                if not processed:
+                    continue
+                manifest_entry = ScanManifestEntry(full_path, size, mtime_ns, processed.fingerprint, processed.image_hash)
+
+                # Check for duplicates using the hash
+                if _is_duplicate(processed.image_hash, known_hashes, pending_hashes):
+                    logging.warning(f'Duplicate found for "{os.path.basename(full_path)}". Skipping.')
+                    duplicates_found_count += 1
+                    # Nothing more to do for the file, so it can be skipped on the next scan
+                    manifest_updates.append(manifest_entry)
+                    continue
+
+                # Near-duplicates (re-encoded, resized or lightly edited copies) are imported but reported
+                if near_duplicates:
+                    similar = [str(sourcefile_id) for sourcefile_id, _ in similarity.find_similar(processed.image_hash, NEAR_DUPLICATE_DISTANCE)]
+                    # Files still waiting in the batch writer are not in the index yet
+                    similar += [f"hash {h}" for h in pending_hashes
+                                if similarity.hamming_distance(h, processed.image_hash) <= NEAR_DUPLICATE_DISTANCE]
+                    if similar:
+                        near_duplicates_count += 1
+                        logging.warning(f'"{os.path.basename(full_path)}" is similar to existing images ({", ".join(similar)}). Importing anyway.')
+
+                # Save the preview image
+                if processed.preview is not None:
+                    save_preview_image(processed.preview, get_preview_path(processed.image_hash))
+
+                # Queue for the database; rows are written in batched transactions
+                known_hashes.add(processed.image_hash)
+                pending_hashes.add(processed.image_hash)
+                written_ids = writer.add(
+                    filename=full_path,
+                    image_hash=processed.image_hash,
+                    thumbnail=processed.thumbnail,
+                    exif_data=processed.exif_data,
+                    metadata=processed.metadata,
+                    raw_filename=raw_path
+                )
+                # The row is queued, or in the batch just written
+                queued_manifest.append(manifest_entry)
+                if written_ids:
+                    batch_written(written_ids)
+                    pending_hashes.clear()
+                logging.info(f'Queued "{os.path.basename(full_path)}" for the database')
+
+            except database.BatchWriteError as e:
+                batch_failed(e)
+            except Exception as e:
+                logging.error(f"Failed to import {full_path}: {e}", exc_info=True)
+
+        try:
+            batch_written(writer.flush())
+        except database.BatchWriteError as e:
+            batch_failed(e)
+            write_manifest()
+    # Lets the next process load the thumbnail offsets instead of scanning the pack
+    get_thumbnail_pack().save_index()
+
+    if processed_files_count == 0 and rescan_filter.unchanged_count == 0:
+        logging.warning(f"No image files ({', '.join(sorted(ALLOWED_EXTENSIONS))}) found in '{source_dir}'.")
+
+    logging.info(f"Photo import process finished. Processed {processed_files_count} files. Skipped {rescan_filter.unchanged_count} unchanged files. Found and skipped {duplicates_found_count} duplicates. Found {near_duplicates_count} near-duplicates.")
 
 def create_thumbnail(image_path: str) -> bytes | None:
     """Creates a thumbnail for a given image and returns it as bytes."""
     try:
         with Image.open(image_path) as img:
             img.thumbnail(THUMBNAIL_SIZE)
-            buf = io.BytesIO()
-            # Convert to RGB if it's not, to ensure it can be saved as JPEG
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            img.save(buf, format="JPEG", quality=90)
-            return buf.getvalue()
+            return _encode_jpeg(img, quality=90)
     except Exception as e:
         logging.error(f"Failed to create thumbnail for {image_path}: {e}")
         return None
@@ -126,6 +483,6 @@ if __name__ == '__main__':
     logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
     if os.path.isdir(photo_directory_to_scan):
-        import_photos(photo_directory_to_scan)
+        import_photos(photo_directory_to_scan, workers=os.cpu_count() or 1)
     else:
         logging.error(f"Directory not found: '{photo_directory_to_scan}'. Please update the variable in import_service.py")
\ No newline at end of file
@@ -0,0 +1,116 @@
+import hashlib
+import logging
+import math
+from array import array
+from bisect import bisect_left
+from typing import Iterable, Optional
+
+import database
+from config import BLOOM_FILTER_THRESHOLD, BLOOM_FILTER_ERROR_RATE
+
+
+class ImageHashSet:
+    """
+    Exact in-memory set of image hashes, used for duplicate detection during import.
+    The 64-bit perceptual hashes are stored as integers instead of hex strings to save memory.
+    """
+    exact = True
+
+    def __init__(self, hashes: Iterable[str] = ()):
+        self._hashes = {int(h, 16) for h in hashes}
+
+    def add(self, image_hash: str):
+        self._hashes.add(int(image_hash, 16))
+
+    def discard(self, image_hash: str):
+        self._hashes.discard(int(image_hash, 16))
+
+    def __contains__(self, image_hash: str) -> bool:
+        return int(image_hash, 16) in self._hashes
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def frozen(self) -> "FrozenImageHashSet":
+        return FrozenImageHashSet(self._hashes)
+
+
+class FrozenImageHashSet:
+    """
+    Read-only copy of an ImageHashSet as a sorted array, 8 bytes per hash instead of
+    the 60 or so of a set, compact enough to send to each worker process of an import.
+    """
+    exact = True
+
+    def __init__(self, hashes: Iterable[int]):
+        self._hashes = array('Q', sorted(hashes))
+
+    def __contains__(self, image_hash: str) -> bool:
+        key = int(image_hash, 16)
+        i = bisect_left(self._hashes, key)
+        return i < len(self._hashes) and self._hashes[i] == key
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+
+class BloomImageHashSet:
+    """
+    Bloom filter variant of ImageHashSet for libraries too large to hold every hash in memory.
+    Membership tests can give false positives (at about error_rate) but never false negatives,
+    so a hit must be confirmed against the database before a file is treated as a duplicate.
+    """
+    exact = False
+
+    def __init__(self, capacity: int, error_rate: float = BLOOM_FILTER_ERROR_RATE, hashes: Iterable[str] = ()):
+        capacity = max(capacity, 1)
+        self.size_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size_bits / capacity * math.log(2)))
+        self._bits = bytearray((self.size_bits + 7) // 8)
+        self._count = 0
+        for h in hashes:
+            self.add(h)
+
+    def _positions(self, image_hash: str) -> Iterable[int]:
+        # Perceptual hashes are not uniformly distributed, so they are hashed again
+        # and the bit positions derived by double hashing.
+        digest = hashlib.blake2b(image_hash.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size_bits for i in range(self.hash_count))
+
+    def add(self, image_hash: str):
+        for pos in self._positions(image_hash):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+        self._count += 1
+
+    def discard(self, image_hash: str):
+        """Bits cannot be cleared from a Bloom filter; the hash stays as a possible false positive."""
+
+    def __contains__(self, image_hash: str) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(image_hash))
+
+    def __len__(self) -> int:
+        return self._count
+
+    def frozen(self) -> "BloomImageHashSet":
+        """The filter is already compact, so it is sent to worker processes as it is."""
+        return self
+
+
+def load_image_hash_set(bloom_filter: Optional[bool] = None):
+    """
+    Loads all image hashes in the database into an ImageHashSet, or into a
+    BloomImageHashSet if bloom_filter is set. By default the Bloom filter is
+    used when the library has more than BLOOM_FILTER_THRESHOLD images.
+    """
+    count = database.count_sourcefiles()
+    if bloom_filter is None:
+        bloom_filter = count > BLOOM_FILTER_THRESHOLD
+    if bloom_filter:
+        # Leave room for the images added by the import
+        hash_set = BloomImageHashSet(capacity=count * 2 + 10000, hashes=database.iter_image_hashes())
+    else:
+        hash_set = ImageHashSet(database.iter_image_hashes())
+    logging.info(f"Loaded {len(hash_set)} image hashes into {type(hash_set).__name__}")
+    return hash_set
@@ -0,0 +1,89 @@
+import logging
+import os
+import threading
+from concurrent.futures import Future
+from typing import Dict, Iterator, Optional, Tuple
+
+import database
+from config import LARGE_SIZE, PREVIEW_SIZES
+from services.filescanning import create_preview_bytes, get_preview_path, save_preview_image
+
+# LARGE_SIZE, written at import, is always available besides the configured sizes
+_SIZES = sorted(set(PREVIEW_SIZES) | {max(LARGE_SIZE)})
+
+# Renders in progress, keyed by (image_hash, size), shared by concurrent requests
+_in_flight: Dict[Tuple[str, int], Future] = {}
+_in_flight_lock = threading.Lock()
+
+
+def preview_size(size: Optional[int]) -> int:
+    """
+    Returns the longest side of a preview, that of LARGE_SIZE if size is None.
+    Raises ValueError for sizes that are not configured.
+    """
+    if size is None:
+        return max(LARGE_SIZE)
+    if size not in _SIZES:
+        raise ValueError(f"Preview size must be one of {_SIZES}")
+    return size
+
+
+def _sources(image_hash: str, size: int) -> Iterator[str]:
+    """
+    Yields the files a preview can be rendered from: the cached previews larger than
+    size, smallest first since they are the cheapest to decode, then the original.
+    """
+    for larger in _SIZES:
+        if larger > size:
+            path = get_preview_path(image_hash, larger)
+            if os.path.exists(path):
+                yield path
+    sourcefile = database.get_sourcefile_by_hash(image_hash)
+    if sourcefile and os.path.exists(sourcefile.filename):
+        yield sourcefile.filename
+
+
+def _render(image_hash: str, size: int, path: str) -> str:
+    if os.path.exists(path):
+        # Finished by another process, or by a render that ended just before this one started
+        return path
+    for source in _sources(image_hash, size):
+        preview = create_preview_bytes(source, (size, size))
+        if preview:
+            save_preview_image(preview, path)
+            if os.path.exists(path):
+                logging.info(f"Rendered {size} px preview of {image_hash} from {source}")
+                return path
+    raise FileNotFoundError(f"No preview or original to render a {size} px preview of {image_hash} from")
+
+
+def ensure_preview(image_hash: str, size: Optional[int] = None) -> str:
+    """
+    Returns the path of the preview of an image at the given size (the longest side,
+    one of PREVIEW_SIZES, or LARGE_SIZE if not given), rendering it if it is missing.
+
+    Previews are rendered from the next larger cached size, or else from the original
+    file, and stored in the get_preview_path layout. Concurrent calls for the same
+    preview share a single render. Raises ValueError for an unsupported size and
+    FileNotFoundError if there is nothing to render from.
+    """
+    size = preview_size(size)
+    path = get_preview_path(image_hash, size)
+    if os.path.exists(path):
+        return path
+    key = (image_hash, size)
+    with _in_flight_lock:
+        future = _in_flight.get(key)
+        rendering = future is None
+        if rendering:
+            future = _in_flight[key] = Future()
+    if not rendering:
+        return future.result()
+    try:
+        future.set_result(_render(image_hash, size, path))
+    except Exception as e:
+        future.set_exception(e)
+    finally:
+        with _in_flight_lock:
+            del _in_flight[key]
+    return future.result()
@@ -0,0 +1,126 @@
+import logging
+import mmap
+import struct
+from typing import BinaryIO, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+import piexif
+
+from services import exif as exif_service
+from services.exif import TiffReader
+
+# TIFF tags describing image data
+_COMPRESSION = 0x0103
+_STRIP_OFFSETS = 0x0111
+_STRIP_BYTE_COUNTS = 0x0117
+_SUB_IFDS = 0x014A
+_JPEG_OFFSET = 0x0201
+_JPEG_LENGTH = 0x0202
+_OLD_JPEG, _JPEG = 6, 7
+
+# JPEG start-of-frame markers that PIL can decode: baseline, extended and progressive.
+# Lossless JPEG (SOF3), used for the raw sensor data in CR2 files, is not an image preview.
+_DISPLAYABLE_SOF = {0xC0, 0xC1, 0xC2}
+_OTHER_SOF = {0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+_MAX_IFDS = 64  # Guards against offset loops in damaged files
+
+# Descriptive IFD0 tags copied to the EXIF of the preview; the rest describe the RAW data itself.
+# The Exif and GPS IFDs are copied whole.
+_DESCRIPTIVE_TAGS = {
+    piexif.ImageIFD.ImageDescription, piexif.ImageIFD.Make, piexif.ImageIFD.Model,
+    piexif.ImageIFD.Orientation, piexif.ImageIFD.Software, piexif.ImageIFD.DateTime,
+    piexif.ImageIFD.Artist, piexif.ImageIFD.Copyright,
+}
+
+
+class RawPreview(NamedTuple):
+    """The largest JPEG preview embedded in a RAW file, with the EXIF data of the RAW file."""
+    jpeg: bytes
+    exif_data: Optional[bytes]
+
+
+def _is_displayable_jpeg(data, start: int, length: int) -> bool:
+    """Checks the markers of an embedded JPEG up to its start-of-frame."""
+    end = start + length
+    if data[start:start + 2] != b"\xff\xd8":
+        return False
+    position = start + 2
+    while position + 4 <= end:
+        if data[position] != 0xFF:
+            return False
+        marker = data[position + 1]
+        if marker in _DISPLAYABLE_SOF:
+            return True
+        if marker in _OTHER_SOF or marker == 0xDA:
+            return False
+        position += 2 + struct.unpack_from(">H", data, position + 2)[0]
+    return False
+
+
+def _iter_ifds(reader: TiffReader) -> Iterator:
+    """Yields IFD0, the IFDs chained after it and their SubIFDs, visiting each offset once."""
+    seen: Set[int] = set()
+    pending = [reader.first_ifd_offset]
+    while pending and len(seen) < _MAX_IFDS:
+        offset = pending.pop(0)
+        if not offset or offset in seen:
+            continue
+        seen.add(offset)
+        ifd = reader.read_ifd(f"IFD@{offset}", offset, chained=True)
+        yield ifd
+        pending.append(ifd.next_offset)
+        for entry in ifd.entries:
+            if entry.tag == _SUB_IFDS:
+                value = reader.value(entry)
+                pending.extend(value if isinstance(value, tuple) else (value,))
+
+
+def _jpeg_candidates(reader: TiffReader) -> List[Tuple[int, int]]:
+    """Returns (offset, length) of every JPEG stream referenced by the IFDs."""
+    candidates = []
+    for ifd in _iter_ifds(reader):
+        values = {entry.tag: reader.value(entry) for entry in ifd.entries
+                  if entry.tag in (_COMPRESSION, _STRIP_OFFSETS, _STRIP_BYTE_COUNTS, _JPEG_OFFSET, _JPEG_LENGTH)}
+        if values.get(_JPEG_OFFSET) and values.get(_JPEG_LENGTH):
+            candidates.append((values[_JPEG_OFFSET], values[_JPEG_LENGTH]))
+        strip_offset, strip_length = values.get(_STRIP_OFFSETS), values.get(_STRIP_BYTE_COUNTS)
+        # A JPEG stored as a single strip, like the full-size preview in IFD0 of CR2 files
+        if values.get(_COMPRESSION) in (_OLD_JPEG, _JPEG) and isinstance(strip_offset, int) and isinstance(strip_length, int):
+            candidates.append((strip_offset, strip_length))
+    return candidates
+
+
+def _exif_from_tiff(reader: TiffReader) -> Optional[bytes]:
+    """
+    Builds an EXIF block for the preview from the IFD0, Exif and GPS tags of the RAW file,
+    copied by the reader that found the preview. The thumbnail IFD and the tags describing
+    the RAW image data are left out.
+    """
+    try:
+        return exif_service.extract_exif(reader, _DESCRIPTIVE_TAGS)
+    except (ValueError, struct.error) as e:
+        logging.warning(f"Could not read EXIF data from RAW file: {e}")
+        return None
+
+
+def extract_preview(f: BinaryIO) -> RawPreview:
+    """
+    Finds the largest embedded JPEG preview in a TIFF-based RAW file (CR2, NEF, ARW)
+    without decoding the sensor data. The file is memory-mapped, so only the IFDs and
+    the chosen preview are read from disk, and the same reader finds the preview and
+    copies the EXIF data.
+    Raises ValueError if the file has no usable preview.
+    """
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        reader = TiffReader(data)
+        try:
+            candidates = [(offset, length) for offset, length in _jpeg_candidates(reader)
+                          if offset + length <= len(data) and _is_displayable_jpeg(data, offset, length)]
+            if not candidates:
+                raise ValueError("No embedded JPEG preview found")
+            exif_data = _exif_from_tiff(reader)
+        except struct.error as e:
+            raise ValueError(f"Damaged RAW file: {e}") from e
+        finally:
+            reader.release()
+        offset, length = max(candidates, key=lambda candidate: candidate[1])
+        return RawPreview(data[offset:offset + length], exif_data)
@@ -0,0 +1,136 @@
+import itertools
+import logging
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, List, Optional, Set, Tuple
+
+import database
+
+CHUNK_BITS = 16
+CHUNK_COUNT = 64 // CHUNK_BITS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+REFRESH_INTERVAL = 1.0  # Seconds between checks for rows added by other processes
+
+
+@lru_cache(maxsize=None)
+def _flip_masks(radius: int) -> Tuple[int, ...]:
+    """All CHUNK_BITS-bit masks with at most radius bits set."""
+    masks = []
+    for r in range(radius + 1):
+        for bits in itertools.combinations(range(CHUNK_BITS), r):
+            masks.append(sum(1 << b for b in bits))
+    return tuple(masks)
+
+
+def hamming_distance(hash_a: str, hash_b: str) -> int:
+    """Number of differing bits between two hex-encoded hashes."""
+    return (int(hash_a, 16) ^ int(hash_b, 16)).bit_count()
+
+
+def _chunks(value: int) -> List[int]:
+    return [(value >> (i * CHUNK_BITS)) & CHUNK_MASK for i in range(CHUNK_COUNT)]
+
+
+class PhashIndex:
+    """
+    Hamming-distance index over 64-bit perceptual hashes, using multi-index hashing.
+
+    Each hash is split into four 16-bit chunks, and every chunk has its own table
+    from chunk value to sourcefile IDs. If two hashes differ in at most d bits, at
+    least one chunk differs in at most d // 4 bits, so a search only has to look up
+    the chunk values within that radius and check the few candidates it finds.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._hashes: Dict[int, int] = {}
+        self._tables: List[Dict[int, Set[int]]] = [{} for _ in range(CHUNK_COUNT)]
+        self._max_id = 0
+        self._last_refresh = 0.0
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def add(self, sourcefile_id: int, image_hash: str):
+        value = int(image_hash, 16)
+        with self._lock:
+            self.remove(sourcefile_id)
+            self._hashes[sourcefile_id] = value
+            for table, chunk in zip(self._tables, _chunks(value)):
+                table.setdefault(chunk, set()).add(sourcefile_id)
+            self._max_id = max(self._max_id, sourcefile_id)
+
+    def remove(self, sourcefile_id: int):
+        with self._lock:
+            value = self._hashes.pop(sourcefile_id, None)
+            if value is None:
+                return
+            for table, chunk in zip(self._tables, _chunks(value)):
+                ids = table[chunk]
+                ids.discard(sourcefile_id)
+                if not ids:
+                    del table[chunk]
+
+    def find_similar(self, image_hash: str, max_distance: int) -> List[Tuple[int, int]]:
+        """
+        Returns (sourcefile_id, distance) for every indexed hash within max_distance bits
+        of image_hash, closest first.
+        """
+        value = int(image_hash, 16)
+        masks = _flip_masks(max_distance // CHUNK_COUNT)
+        found: Dict[int, int] = {}
+        with self._lock:
+            for table, chunk in zip(self._tables, _chunks(value)):
+                for mask in masks:
+                    for sourcefile_id in table.get(chunk ^ mask, ()):
+                        if sourcefile_id not in found:
+                            distance = (self._hashes[sourcefile_id] ^ value).bit_count()
+                            if distance <= max_distance:
+                                found[sourcefile_id] = distance
+        return sorted(found.items(), key=lambda item: (item[1], item[0]))
+
+    def load(self):
+        """Adds the hashes of all rows newer than the ones already indexed."""
+        with self._lock:
+            for sourcefile_id, image_hash in database.iter_sourcefile_hashes(self._max_id):
+                self.add(sourcefile_id, image_hash)
+            self._last_refresh = time.monotonic()
+
+    def refresh(self):
+        """
+        Picks up rows inserted by other processes, such as a running import.
+        Changes made in this process are applied through the database change listener.
+        """
+        if time.monotonic() - self._last_refresh >= REFRESH_INTERVAL:
+            self.load()
+
+    def on_database_change(self, event: str, sourcefile_id: int, image_hash: Optional[str]):
+        if event == "delete" or not image_hash:
+            self.remove(sourcefile_id)
+        else:
+            self.add(sourcefile_id, image_hash)
+
+
+_index: Optional[PhashIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_phash_index() -> PhashIndex:
+    """Returns the shared PhashIndex, loading it from the database on first use."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            index = PhashIndex()
+            index.load()
+            database.add_change_listener(index.on_database_change)
+            logging.info(f"Loaded {len(index)} hashes into the similarity index")
+            _index = index
+    return _index
+
+
+def find_similar(image_hash: str, max_distance: int) -> List[Tuple[int, int]]:
+    """Finds source files whose perceptual hash is within max_distance bits of image_hash."""
+    index = get_phash_index()
+    index.refresh()
+    return index.find_similar(image_hash, max_distance)
@@ -0,0 +1,343 @@
+import logging
+import mmap
+import os
+import struct
+import threading
+from array import array
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from config import THUMBNAIL_PACK_PATH
+
+# Pack file: a header, then records of (key, length, data) appended one after another.
+# The key is the 64-bit perceptual hash. A record with length TOMBSTONE removes the key.
+_PACK_HEADER = struct.Struct('<4sHxxQ')  # magic, format version, pack id
+_PACK_MAGIC = b'IMTP'
+_RECORD_HEADER = struct.Struct('<QI')
+_TOMBSTONE = 0xFFFFFFFF
+
+# Index file: a header, then the sorted keys, their record offsets and their lengths as arrays
+_INDEX_HEADER = struct.Struct('<4sHxxQQQ')  # magic, format version, pack id, pack bytes covered, entry count
+_INDEX_MAGIC = b'IMTI'
+_FORMAT_VERSION = 1
+
+
+def _key(image_hash: str) -> int:
+    return int(image_hash, 16)
+
+
+@contextmanager
+def _writer_lock(path: str) -> Iterator[None]:
+    """
+    Holds an exclusive lock on the lock file of a pack, shared by all processes that
+    write to it. Appends and compaction take it, so a record found incomplete while
+    holding it was cut short by a crash and is not still being written.
+    """
+    with open(path, 'a+b') as f:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class ThumbnailPack:
+    """
+    Append-only store of thumbnails keyed by image hash, read through mmap.
+
+    Thumbnails are appended to a single pack file, and get() returns a memoryview
+    into the mapped file, so serving a thumbnail copies nothing. The offsets are held
+    in sorted arrays (20 bytes per thumbnail) loaded from a compact index file, plus a
+    dict for records appended since the index was saved. Records written by another
+    process, such as a running import, are picked up when a lookup misses.
+
+    Replacing or removing a thumbnail appends a new record, so the file only grows
+    until compact() rewrites it with the live records.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.index_path = path + '.idx'
+        self.lock_path = path + '.lock'
+        self._lock = threading.RLock()
+        self._open()
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        if not os.path.exists(self.path) or os.path.getsize(self.path) < _PACK_HEADER.size:
+            with _writer_lock(self.lock_path):
+                if not os.path.exists(self.path) or os.path.getsize(self.path) < _PACK_HEADER.size:
+                    self._write_new_pack(self.path, [])
+        with open(self.path, 'rb') as f:
+            magic, version, self._pack_id = _PACK_HEADER.unpack(f.read(_PACK_HEADER.size))
+            if magic != _PACK_MAGIC or version != _FORMAT_VERSION:
+                raise ValueError(f"{self.path} is not a thumbnail pack")
+            self._inode = os.fstat(f.fileno()).st_ino
+        self._keys = array('Q')
+        self._offsets = array('Q')
+        self._lengths = array('I')
+        # Records after the ones in the index; None marks a removed key
+        self._recent: Dict[int, Optional[Tuple[int, int]]] = {}
+        self._scanned_end = _PACK_HEADER.size
+        self._map: Optional[mmap.mmap] = None
+        self._load_index()
+        self._scan()
+
+    @staticmethod
+    def _write_new_pack(path: str, records: Iterable[Tuple[int, bytes]]) -> Tuple[int, array, array, array]:
+        """Writes a new pack with the given records and returns its id and the index arrays."""
+        pack_id = int.from_bytes(os.urandom(8), 'little')
+        keys, offsets, lengths = array('Q'), array('Q'), array('I')
+        with open(path, 'wb') as f:
+            f.write(_PACK_HEADER.pack(_PACK_MAGIC, _FORMAT_VERSION, pack_id))
+            for key, data in records:
+                offsets.append(f.tell() + _RECORD_HEADER.size)
+                f.write(_RECORD_HEADER.pack(key, len(data)))
+                f.write(data)
+                keys.append(key)
+                lengths.append(len(data))
+            f.flush()
+            os.fsync(f.fileno())
+        return pack_id, keys, offsets, lengths
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'rb') as f:
+                magic, version, pack_id, covered, count = _INDEX_HEADER.unpack(f.read(_INDEX_HEADER.size))
+                if magic != _INDEX_MAGIC or version != _FORMAT_VERSION or pack_id != self._pack_id:
+                    return
+                if covered > os.path.getsize(self.path):
+                    return
+                keys, offsets, lengths = array('Q'), array('Q'), array('I')
+                keys.fromfile(f, count)
+                offsets.fromfile(f, count)
+                lengths.fromfile(f, count)
+        except (OSError, EOFError, struct.error) as e:
+            if not isinstance(e, FileNotFoundError):
+                logging.warning(f"Could not read thumbnail index {self.index_path}, rebuilding it: {e}")
+            return
+        self._keys, self._offsets, self._lengths = keys, offsets, lengths
+        self._scanned_end = covered
+
+    def _scan(self):
+        """
+        Indexes the records appended since the last scan. Only the record headers are
+        read, through the mapping, so opening a pack without an index does not load it.
+        """
+        size = os.path.getsize(self.path)
+        if size <= self._scanned_end:
+            return
+        mapped = self._mapped(size)
+        position = self._scanned_end
+        while position + _RECORD_HEADER.size <= size:
+            key, length = _RECORD_HEADER.unpack_from(mapped, position)
+            if length == _TOMBSTONE:
+                self._recent[key] = None
+                position += _RECORD_HEADER.size
+                continue
+            if position + _RECORD_HEADER.size + length > size:
+                # A record still being written, or cut short by a crash
+                break
+            self._recent[key] = (position + _RECORD_HEADER.size, length)
+            position += _RECORD_HEADER.size + length
+        self._scanned_end = position
+
+    def _mapped(self, end: int) -> mmap.mmap:
+        """Returns a mapping of the pack that covers at least end bytes."""
+        if self._map is None or len(self._map) < end:
+            with open(self.path, 'rb') as f:
+                # Views handed out keep the previous mapping alive until they are released
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    def _find(self, key: int) -> Optional[Tuple[int, int]]:
+        if key in self._recent:
+            return self._recent[key]
+        i = bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            return self._offsets[i], self._lengths[i]
+        return None
+
+    def _refresh(self):
+        """Picks up records appended by other processes, and a pack replaced by compaction."""
+        try:
+            inode = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            inode = None
+        if inode != self._inode:
+            self._open()
+        else:
+            self._scan()
+
+    def get(self, image_hash: str) -> Optional[memoryview]:
+        """Returns the thumbnail for an image hash as a read-only view of the pack, or None."""
+        key = _key(image_hash)
+        with self._lock:
+            location = self._find(key)
+            if location is None:
+                self._refresh()
+                location = self._find(key)
+            if location is None:
+                return None
+            offset, length = location
+            return memoryview(self._mapped(offset + length))[offset:offset + length]
+
+    def __contains__(self, image_hash: str) -> bool:
+        with self._lock:
+            return self._find(_key(image_hash)) is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            removed = sum(1 for key, location in self._recent.items() if location is None and self._in_index(key))
+            added = sum(1 for key, location in self._recent.items() if location is not None and not self._in_index(key))
+            return len(self._keys) + added - removed
+
+    def _in_index(self, key: int) -> bool:
+        i = bisect_left(self._keys, key)
+        return i < len(self._keys) and self._keys[i] == key
+
+    def _append(self, records: Iterable[Tuple[int, Optional[bytes]]]):
+        """Appends records in a single write; data None writes a tombstone."""
+        records = list(records)
+        chunks = []
+        for key, data in records:
+            if data is None:
+                chunks.append(_RECORD_HEADER.pack(key, _TOMBSTONE))
+            else:
+                chunks += (_RECORD_HEADER.pack(key, len(data)), bytes(data))
+        if not chunks:
+            return
+        with self._lock, _writer_lock(self.lock_path):
+            # Records appended by others must be indexed first, so ours are not read as theirs
+            self._refresh()
+            if os.path.getsize(self.path) != self._scanned_end:
+                # Other writers hold the lock while appending, so a record that does not
+                # fit in the file was cut short by a crash; drop it before appending after it
+                logging.warning(f"Dropping incomplete record at the end of thumbnail pack {self.path}")
+                with open(self.path, 'r+b') as f:
+                    f.truncate(self._scanned_end)
+            with open(self.path, 'ab', buffering=0) as f:
+                f.write(b''.join(chunks))
+            # The records are where the scan ended, so they are indexed without reading them back
+            position = self._scanned_end
+            for key, data in records:
+                if data is None:
+                    self._recent[key] = None
+                    position += _RECORD_HEADER.size
+                else:
+                    self._recent[key] = (position + _RECORD_HEADER.size, len(data))
+                    position += _RECORD_HEADER.size + len(data)
+            self._scanned_end = position
+
+    def put(self, image_hash: str, data: bytes):
+        """Stores the thumbnail for an image hash, replacing any earlier one."""
+        self._append([(_key(image_hash), data)])
+
+    def put_many(self, items: Iterable[Tuple[str, bytes]]):
+        """Stores many thumbnails with a single append."""
+        self._append((_key(image_hash), data) for image_hash, data in items)
+
+    def remove(self, image_hash: str):
+        key = _key(image_hash)
+        with self._lock:
+            if self._find(key) is not None:
+                self._append([(key, None)])
+
+    def sync(self):
+        """Flushes appended thumbnails to disk."""
+        with open(self.path, 'rb+') as f:
+            os.fsync(f.fileno())
+
+    def _live_entries(self) -> Tuple[array, array, array]:
+        """The index arrays merged with the recent records, sorted by key."""
+        merged = {key: (offset, length) for key, offset, length in zip(self._keys, self._offsets, self._lengths)}
+        for key, location in self._recent.items():
+            if location is None:
+                merged.pop(key, None)
+            else:
+                merged[key] = location
+        keys = array('Q', sorted(merged))
+        offsets = array('Q', (merged[key][0] for key in keys))
+        lengths = array('I', (merged[key][1] for key in keys))
+        return keys, offsets, lengths
+
+    def _write_index(self, keys: array, offsets: array, lengths: array, covered: int):
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(_INDEX_HEADER.pack(_INDEX_MAGIC, _FORMAT_VERSION, self._pack_id, covered, len(keys)))
+            keys.tofile(f)
+            offsets.tofile(f)
+            lengths.tofile(f)
+        os.replace(tmp_path, self.index_path)
+
+    def save_index(self):
+        """
+        Writes the index file, so the next process to open the pack only has to
+        scan the records appended after this point.
+        """
+        with self._lock:
+            self._scan()
+            self._keys, self._offsets, self._lengths = self._live_entries()
+            self._recent.clear()
+            self._write_index(self._keys, self._offsets, self._lengths, self._scanned_end)
+
+    def compact(self) -> int:
+        """
+        Rewrites the pack with only the live thumbnails, in their current order, and
+        returns the number of bytes reclaimed. Processes that have the old pack open
+        switch to the new one on their next lookup miss; on Windows the old file cannot
+        be replaced while it is mapped, so run this while the gallery is stopped.
+        """
+        with self._lock, _writer_lock(self.lock_path):
+            self._refresh()
+            old_size = os.path.getsize(self.path)
+            keys, offsets, lengths = self._live_entries()
+            order = sorted(range(len(keys)), key=offsets.__getitem__)
+            mapped = self._mapped(self._scanned_end)
+            tmp_path = self.path + '.compact'
+            pack_id, new_keys, new_offsets, new_lengths = self._write_new_pack(
+                tmp_path, ((keys[i], mapped[offsets[i]:offsets[i] + lengths[i]]) for i in order))
+            self._map = None
+            os.replace(tmp_path, self.path)
+            self._pack_id = pack_id
+            self._open_compacted(new_keys, new_offsets, new_lengths)
+            reclaimed = old_size - os.path.getsize(self.path)
+        logging.info(f"Compacted thumbnail pack {self.path}: {len(keys)} thumbnails, reclaimed {reclaimed} bytes")
+        return reclaimed
+
+    def _open_compacted(self, keys: array, offsets: array, lengths: array):
+        # The records were written in offset order; the index needs them sorted by key
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        sorted_keys = array('Q', (keys[i] for i in order))
+        sorted_offsets = array('Q', (offsets[i] for i in order))
+        sorted_lengths = array('I', (lengths[i] for i in order))
+        self._write_index(sorted_keys, sorted_offsets, sorted_lengths, os.path.getsize(self.path))
+        self._open()
+
+
+_pack: Optional[ThumbnailPack] = None
+_pack_lock = threading.Lock()
+
+
+def get_thumbnail_pack() -> ThumbnailPack:
+    """Returns the shared ThumbnailPack at THUMBNAIL_PACK_PATH, opening it on first use."""
+    global _pack
+    with _pack_lock:
+        if _pack is None:
+            _pack = ThumbnailPack(THUMBNAIL_PACK_PATH)
+    return _pack
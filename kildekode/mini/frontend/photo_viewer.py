@@ -3,13 +3,135 @@ from tkinter import ttk, messagebox
 from PIL import Image, ImageTk
 import io
 import os
+import queue
+import threading
+from collections import OrderedDict
+from typing import Callable, Iterable, List, Optional, Set
 import piexif  # For on-the-fly EXIF parsing
 
 # Use our modern data access layer
 import database
+from config import THUMBNAIL_SIZE
 from models import SourceFile
 
 THUMBNAIL_DISPLAY_SIZE = (120, 120)
+CELL_SIZE = (THUMBNAIL_DISPLAY_SIZE[0] + 20, THUMBNAIL_DISPLAY_SIZE[1] + 40)  # Thumbnail with padding and file name
+OVERSCAN_ROWS = 2  # Rows above and below the visible area that also get widgets
+RESIZE_DEBOUNCE_MS = 100  # The grid is laid out again when the window has stopped changing size for this long
+ROW_FIELDS = ('id', 'filename')
+ROW_PAGE_SIZE = 5000  # Rows fetched from the database per page while the viewer starts
+THUMBNAIL_BATCH_SIZE = 50  # Thumbnails fetched with one query and decoded together
+PHOTO_CACHE_SIZE = 2000  # PhotoImage objects kept for rows that have scrolled out of view
+POLL_MS = 30  # How often the Tk main loop picks up results from the loader thread
+MAX_RESULTS_PER_POLL = 200  # Results handled per poll, so a burst does not block the main loop
+SEARCH_DEBOUNCE_MS = 200  # The search runs when typing has paused for this long
+SEARCH_LIMIT = 10_000  # Maximum number of search results shown
+
+
+class _ThumbnailLoader(threading.Thread):
+    """
+    Loads the photo rows page by page and decodes thumbnails on a worker thread, and
+    hands the results to the Tk main loop through a queue. PhotoImage objects must be
+    created on the main thread, so the loader returns PIL images.
+
+    Thumbnails are loaded for the IDs in the latest request(), in the order given, and
+    those requests go before the remaining row pages, so the visible rows come first.
+    """
+
+    def __init__(self):
+        super().__init__(name="thumbnail-loader", daemon=True)
+        self.results: queue.Queue = queue.Queue()
+        self._condition = threading.Condition()
+        self._wanted: List[int] = []
+        self._loading: Set[int] = set()
+        self._stopped = False
+
+    def request(self, sourcefile_ids: Iterable[int]):
+        """Replaces the thumbnails waiting to be loaded; IDs being loaded already are left out."""
+        with self._condition:
+            self._wanted = [i for i in sourcefile_ids if i not in self._loading]
+            self._condition.notify()
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+    def _next_batch(self, rows_done: bool) -> Optional[List[int]]:
+        """Waits for work and returns the next IDs to load, or an empty list for the next row page."""
+        with self._condition:
+            while not self._wanted and rows_done and not self._stopped:
+                self._condition.wait()
+            if self._stopped:
+                return None
+            batch = self._wanted[:THUMBNAIL_BATCH_SIZE]
+            del self._wanted[:THUMBNAIL_BATCH_SIZE]
+            self._loading = set(batch)
+            return batch
+
+    def _load_thumbnails(self, batch: List[int]):
+        thumbnails = database.get_thumbnails(batch)
+        for sourcefile_id in batch:
+            image = None
+            if sourcefile_id in thumbnails:
+                try:
+                    image = Image.open(io.BytesIO(thumbnails[sourcefile_id][1]))
+                    image.load()
+                except Exception as e:
+                    print(f"Could not load thumbnail for ID {sourcefile_id}: {e}")
+            # None tells the viewer there is no thumbnail, so it is not asked for again
+            self.results.put(("thumbnail", (sourcefile_id, image)))
+
+    def run(self):
+        cursor = None
+        rows_done = False
+        while True:
+            batch = self._next_batch(rows_done)
+            if batch is None:
+                return
+            if batch:
+                self._load_thumbnails(batch)
+                continue
+            rows, cursor = database.list_sourcefiles_page(fields=ROW_FIELDS, limit=ROW_PAGE_SIZE, cursor=cursor)
+            rows_done = cursor is None
+            self.results.put(("rows", (rows, rows_done)))
+
+
+class _GridCell:
+    """The widgets for one position in the grid, reused for other photos as the grid scrolls."""
+
+    def __init__(self, canvas: tk.Canvas, on_click: Callable[[int], None]):
+        self.canvas = canvas
+        self.index: Optional[int] = None
+        self.sourcefile_id: Optional[int] = None
+        self.image: Optional[ImageTk.PhotoImage] = None
+        self.frame = ttk.Frame(canvas)
+        self.button = ttk.Button(self.frame, command=lambda: on_click(self.index))
+        self.button.pack(padx=5, pady=5)
+        self.label = ttk.Label(self.frame)
+        self.label.pack(padx=5)
+        self.window = canvas.create_window(0, 0, window=self.frame, anchor="nw",
+                                           width=CELL_SIZE[0], height=CELL_SIZE[1], state="hidden")
+
+    def show(self, index: int, row, image: ImageTk.PhotoImage, x: int, y: int):
+        if index != self.index:
+            self.index = index
+            self.sourcefile_id = row.id
+            self.label.configure(text=os.path.basename(row.filename)[:20])
+        self.set_image(image)
+        self.canvas.coords(self.window, x, y)
+        self.canvas.itemconfigure(self.window, state="normal")
+
+    def set_image(self, image: ImageTk.PhotoImage):
+        if image is not self.image:
+            self.image = image
+            self.button.configure(image=image)
+
+    def hide(self):
+        self.index = None
+        self.sourcefile_id = None
+        self.canvas.itemconfigure(self.window, state="hidden")
+
 
 class PhotoViewer(tk.Tk):
     def __init__(self):
@@ -17,99 +139,178 @@ class PhotoViewer(tk.Tk):
         self.title("Photo Viewer")
         self.geometry("1000x700")
 
-        # This list will hold dictionaries containing the PhotoImage and the SourceFile object
-        self.all_photos = self.load_photos()
+        # Lightweight rows with id and filename, filled in by the loader thread
+        self.all_photos = []
         self.filtered_photos = self.all_photos
+        # PhotoImages by source file ID, least recently shown first; None for rows without a thumbnail
+        self.photo_images: "OrderedDict[int, Optional[ImageTk.PhotoImage]]" = OrderedDict()
+        self.placeholder = ImageTk.PhotoImage(Image.new("RGB", THUMBNAIL_SIZE, "#d9d9d9"))
 
         # Top frame: search
         top_frame = ttk.Frame(self)
         top_frame.pack(fill="x", padx=5, pady=5)
 
         ttk.Label(top_frame, text="Søk (filnavn):").pack(side="left")
+        self.status_var = tk.StringVar(value="Laster bilder...")
+        ttk.Label(top_frame, textvariable=self.status_var).pack(side="right")
         self.search_var = tk.StringVar()
         search_entry = ttk.Entry(top_frame, textvariable=self.search_var)
         search_entry.pack(side="left", fill="x", expand=True, padx=5)
-        search_entry.bind("<KeyRelease>", lambda e: self.apply_filter())
+        search_entry.bind("<KeyRelease>", self.on_search_changed)
 
-        # Canvas with scrollbar for thumbnails
-        self.canvas = tk.Canvas(self)
+        # Canvas with scrollbar for thumbnails. Only the visible rows have widgets,
+        # which are moved and given new photos as the grid scrolls.
+        self.canvas = tk.Canvas(self, highlightthickness=0, yscrollincrement=CELL_SIZE[1] // 4)
         self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.canvas.yview)
-        self.frame = ttk.Frame(self.canvas)
-
-        self.frame.bind(
-            "<Configure>",
-            lambda e: self.canvas.configure(scrollregion=self.canvas.bbox("all"))
-        )
-        self.canvas.create_window((0, 0), window=self.frame, anchor="nw")
-        self.canvas.configure(yscrollcommand=self.scrollbar.set)
+        self.canvas.configure(yscrollcommand=self.on_canvas_scrolled)
+        self.cells: List[_GridCell] = []
+        self.columns = 1
+        self.resize_job: Optional[str] = None
+        self.search_job: Optional[str] = None
+        self.empty_text = self.canvas.create_text(10, 10, anchor="nw", text="Ingen bilder funnet.", state="hidden")
 
         self.canvas.pack(side="left", fill="both", expand=True)
         self.scrollbar.pack(side="right", fill="y")
 
-        self.bind("<Configure>", self.refresh_grid)
+        self.canvas.bind("<Configure>", self.refresh_grid)
+        self.bind_all("<MouseWheel>", self.on_mousewheel)
+        self.bind_all("<Button-4>", self.on_mousewheel)
+        self.bind_all("<Button-5>", self.on_mousewheel)
+
+        # The window opens at once; rows and thumbnails arrive from the loader thread
+        self.loader = _ThumbnailLoader()
+        self.loader.start()
+        self.after(POLL_MS, self.process_loader_results)
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
 
         self.display_thumbnails()
 
-    def load_photos(self):
-        """
-        Loads photos using the new data access layer.
-        """
-        print("Loading photos from database...")
-        source_files = database.get_all_sourcefiles()
-        photos = []
-        for sf in source_files:
-            if not sf.thumbnail:
-                continue
+    def process_loader_results(self):
+        """Picks up rows and decoded thumbnails from the loader thread."""
+        rows_added = False
+        for _ in range(MAX_RESULTS_PER_POLL):
             try:
-                img = Image.open(io.BytesIO(sf.thumbnail))
-                tk_img = ImageTk.PhotoImage(img)
-                photos.append({
-                    "tk_image": tk_img,
-                    "source_file": sf  # Store the entire SourceFile object
-                })
-            except Exception as e:
-                print(f"Could not load thumbnail for {sf.filename}: {e}")
-        print(f"Loaded {len(photos)} photos.")
-        return photos
+                kind, value = self.loader.results.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "rows":
+                rows, rows_done = value
+                self.all_photos.extend(rows)
+                self.status_var.set(f"{len(self.all_photos)} bilder" + ("" if rows_done else " (laster...)"))
+                rows_added = True
+            else:
+                self.add_photo_image(*value)
+        if rows_added and not self.search_var.get().strip():
+            self.display_thumbnails()
+        self.after(POLL_MS, self.process_loader_results)
+
+    def add_photo_image(self, sourcefile_id: int, image: Optional[Image.Image]):
+        self.photo_images[sourcefile_id] = ImageTk.PhotoImage(image) if image is not None else None
+        self.photo_images.move_to_end(sourcefile_id)
+        # Rows shown in the grid were just marked as recently used, so only off-screen images are dropped
+        while len(self.photo_images) > max(PHOTO_CACHE_SIZE, len(self.cells)):
+            self.photo_images.popitem(last=False)
+        for cell in self.cells:
+            if cell.sourcefile_id == sourcefile_id:
+                cell.set_image(self.photo_images[sourcefile_id] or self.placeholder)
+
+    def on_close(self):
+        self.loader.stop()
+        self.destroy()
 
     def display_thumbnails(self):
-        for widget in self.frame.winfo_children():
-            widget.destroy()
+        """Lays out the grid for the current photo list and window width."""
+        self.resize_job = None
+        self.columns = max(1, self.canvas.winfo_width() // CELL_SIZE[0])
+        rows = -(-len(self.filtered_photos) // self.columns)
+        self.canvas.configure(scrollregion=(0, 0, self.columns * CELL_SIZE[0], rows * CELL_SIZE[1]))
+        self.canvas.itemconfigure(self.empty_text, state="hidden" if self.filtered_photos else "normal")
+        # The photo list may have changed, so every cell gets its photo again
+        for cell in self.cells:
+            cell.index = None
+        self.update_visible_cells()
 
-        if not self.filtered_photos:
-            ttk.Label(self.frame, text="Ingen bilder funnet.").pack()
-            return
+    def update_visible_cells(self):
+        """Shows the photos in the visible rows plus OVERSCAN_ROWS, reusing the cells of rows that scrolled out."""
+        top = self.canvas.canvasy(0)
+        first_row = max(0, int(top // CELL_SIZE[1]) - OVERSCAN_ROWS)
+        last_row = int((top + self.canvas.winfo_height()) // CELL_SIZE[1]) + OVERSCAN_ROWS
+        visible = range(first_row * self.columns, min(len(self.filtered_photos), (last_row + 1) * self.columns))
 
-        cols = max(1, self.winfo_width() // (THUMBNAIL_DISPLAY_SIZE[0] + 20))
-        for i, photo_data in enumerate(self.filtered_photos):
-            row, col = divmod(i, cols)
-            sf = photo_data["source_file"]
+        shown = {cell.index: cell for cell in self.cells if cell.index in visible}
+        free = [cell for cell in self.cells if cell.index not in shown]
+        missing = []
+        for i in visible:
+            cell = shown.get(i)
+            if cell is None:
+                if free:
+                    cell = free.pop()
+                else:
+                    cell = _GridCell(self.canvas, self.on_cell_clicked)
+                    self.cells.append(cell)
+            photo = self.filtered_photos[i]
+            if photo.id in self.photo_images:
+                self.photo_images.move_to_end(photo.id)
+                image = self.photo_images[photo.id] or self.placeholder
+            else:
+                missing.append(i)
+                image = self.placeholder
+            row, col = divmod(i, self.columns)
+            cell.show(i, photo, image, col * CELL_SIZE[0], row * CELL_SIZE[1])
+        for cell in free:
+            cell.hide()
 
-            btn = ttk.Button(
-                self.frame,
-                image=photo_data["tk_image"],
-                command=lambda p=sf: self.show_exif(p)
-            )
-            btn.grid(row=row * 2, column=col, padx=5, pady=5)
+        # Rows inside the window first, then the overscan rows
+        in_view = range(int(top // CELL_SIZE[1]) * self.columns,
+                        int((top + self.canvas.winfo_height()) // CELL_SIZE[1] + 1) * self.columns)
+        missing.sort(key=lambda i: i not in in_view)
+        self.loader.request(self.filtered_photos[i].id for i in missing)
 
-            lbl = ttk.Label(self.frame, text=os.path.basename(sf.filename)[:20])
-            lbl.grid(row=row * 2 + 1, column=col, padx=5, pady=0)
+    def on_canvas_scrolled(self, first, last):
+        self.scrollbar.set(first, last)
+        self.update_visible_cells()
+
+    def on_mousewheel(self, event):
+        # Bound for all widgets, so the wheel works over the cells, but not in other windows
+        if not isinstance(event.widget, tk.Misc) or event.widget.winfo_toplevel() is not self:
+            return
+        if event.num == 4 or event.delta > 0:
+            self.canvas.yview_scroll(-1, "units")
+        else:
+            self.canvas.yview_scroll(1, "units")
+
+    def on_cell_clicked(self, index: Optional[int]):
+        if index is not None:
+            self.show_exif(self.filtered_photos[index])
 
     def refresh_grid(self, event=None):
-        self.display_thumbnails()
+        # A window resize sends many events; lay out the grid once it has settled
+        if self.resize_job is not None:
+            self.after_cancel(self.resize_job)
+        self.resize_job = self.after(RESIZE_DEBOUNCE_MS, self.display_thumbnails)
+
+    def on_search_changed(self, event=None):
+        if self.search_job is not None:
+            self.after_cancel(self.search_job)
+        self.search_job = self.after(SEARCH_DEBOUNCE_MS, self.apply_filter)
 
     def apply_filter(self):
-        term = self.search_var.get().lower()
+        """Shows the photos matching the search text, using the full-text index of file names."""
+        self.search_job = None
+        term = self.search_var.get().strip()
         if not term:
             self.filtered_photos = self.all_photos
         else:
-            self.filtered_photos = [
-                p for p in self.all_photos
-                if term in p["source_file"].filename.lower()
-            ]
+            self.filtered_photos = database.search_filenames(term, limit=SEARCH_LIMIT, fields=ROW_FIELDS)
+        self.canvas.yview_moveto(0)
         self.display_thumbnails()
 
-    def show_exif(self, source_file: SourceFile):
+    def show_exif(self, row):
+        source_file: Optional[SourceFile] = database.get_sourcefile_by_id(row.id)
+        if source_file is None:
+            messagebox.showerror("Feil", f"Fant ikke bildet i databasen:\n{row.filename}")
+            return
+
         exif_win = tk.Toplevel(self)
         exif_win.title(source_file.filename)
         exif_win.geometry("600x450")
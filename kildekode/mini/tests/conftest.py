@@ -0,0 +1,41 @@
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+import database  # noqa: E402
+from services import thumbpack  # noqa: E402
+
+
+@contextmanager
+def _temporary_database():
+    """Points the database and the thumbnail pack at a new temporary directory, and restores them afterwards."""
+    with tempfile.TemporaryDirectory() as tmp:
+        saved = database.DB_PATH, thumbpack.THUMBNAIL_PACK_PATH, thumbpack._pack
+        database.DB_PATH = os.path.join(tmp, 'test.db')
+        thumbpack.THUMBNAIL_PACK_PATH = os.path.join(tmp, 'thumbnails.pack')
+        thumbpack._pack = None
+        database.init_db()
+        try:
+            yield tmp
+        finally:
+            database.close_db_connection()
+            database.DB_PATH, thumbpack.THUMBNAIL_PACK_PATH, thumbpack._pack = saved
+
+
+@pytest.fixture
+def temp_database():
+    """A new empty database for each test. Yields its directory."""
+    with _temporary_database() as tmp:
+        yield tmp
+
+
+@pytest.fixture(scope='class')
+def class_temp_database():
+    """A new empty database shared by the tests of a class. Yields its directory."""
+    with _temporary_database() as tmp:
+        yield tmp
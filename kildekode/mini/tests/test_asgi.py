@@ -0,0 +1,116 @@
+import asyncio
+import os
+import sys
+import unittest
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+import database  # noqa: E402
+import gallery_app  # noqa: E402
+import gallery_asgi  # noqa: E402
+from services import filescanning  # noqa: E402
+
+# Headers that both modes must send alike
+COMPARED_HEADERS = ('content-type', 'etag', 'accept-ranges', 'content-range', 'x-thumbnail-lengths')
+
+
+def _asgi_get(url: str, headers: dict, method: str = 'GET'):
+    """Sends one request to the ASGI app and returns (status, headers, body)."""
+    path, _, query = url.partition('?')
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query.encode(),
+             'headers': [(name.lower().encode(), value.encode()) for name, value in headers.items()]}
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(gallery_asgi.app(scope, receive, send))
+    start, *body = messages
+    return (start['status'], {name.decode(): value.decode() for name, value in start['headers']},
+            b''.join(message['body'] for message in body))
+
+
+def _cache_control(value):
+    return {directive.strip() for directive in value.split(',')} if value else set()
+
+
+@pytest.mark.usefixtures('temp_database')
+class AsgiAppTest(unittest.TestCase):
+    def setUp(self):
+        self.ids = database.add_sourcefiles(
+            (f"/photos/{i}.jpg", f"{i:016x}", b'\xff\xd8thumbnail %d\xff\xd9' % i, None) for i in range(3))
+        self.saved_large_path = filescanning.LARGE_PATH
+        filescanning.LARGE_PATH = os.path.join(os.path.dirname(database.DB_PATH), 'large')
+        self.preview_hash = f"{1:016x}"
+        filescanning.save_preview_image(b'\xff\xd8' + bytes(range(256)) * 4 + b'\xff\xd9',
+                                        filescanning.get_preview_path(self.preview_hash))
+        self.flask = gallery_app.app.test_client()
+
+    def tearDown(self):
+        filescanning.LARGE_PATH = self.saved_large_path
+        if gallery_asgi._executor is not None:
+            gallery_asgi._executor.shutdown(wait=True)
+            gallery_asgi._executor = None
+
+    def assertSameResponse(self, url: str, headers: dict = None, method: str = 'GET'):
+        headers = headers or {}
+        with self.subTest(url=url, headers=headers, method=method):
+            flask_response = self.flask.open(url, method=method, headers=headers)
+            status, asgi_headers, body = _asgi_get(url, headers, method)
+            self.assertEqual(status, flask_response.status_code)
+            if status not in (304, 416):
+                self.assertEqual(body, flask_response.get_data())
+            for name in COMPARED_HEADERS if status not in (304, 416) else ('etag', 'content-range'):
+                self.assertEqual(asgi_headers.get(name), flask_response.headers.get(name), name)
+            if status != 416:
+                self.assertEqual(_cache_control(asgi_headers.get('cache-control')),
+                                 _cache_control(flask_response.headers.get('cache-control')))
+            return status
+
+    def test_thumbnail(self):
+        url = f'/thumbnail/{self.ids[0]}'
+        etag = f'"{0:016x}"'
+        self.assertEqual(self.assertSameResponse(url), 200)
+        self.assertSameResponse(f'{url}?v={0:016x}')
+        self.assertSameResponse(url, method='HEAD')
+        self.assertEqual(self.assertSameResponse(url, {'If-None-Match': etag}), 304)
+        self.assertEqual(self.assertSameResponse(url, {'Range': 'bytes=2-5'}), 206)
+        self.assertEqual(self.assertSameResponse(url, {'Range': 'bytes=-4'}), 206)
+        self.assertEqual(self.assertSameResponse(url, {'Range': 'bytes=1000-'}), 416)
+        self.assertEqual(self.assertSameResponse(url, {'Range': 'lines=1-2'}), 416)
+        self.assertEqual(self.assertSameResponse(url, {'Range': 'bytes=2-5', 'If-Range': etag}), 206)
+        self.assertEqual(self.assertSameResponse(url, {'Range': 'bytes=2-5', 'If-Range': '"old"'}), 200)
+        self.assertEqual(self.assertSameResponse('/thumbnail/999'), 404)
+
+    def test_thumbnail_batch(self):
+        ids = ','.join(str(i) for i in [*self.ids, 999])
+        url = f'/thumbnails?ids={ids}'
+        self.assertEqual(self.assertSameResponse(url), 200)
+        etag = _asgi_get(url, {})[1]['etag']
+        self.assertEqual(self.assertSameResponse(url, {'If-None-Match': etag}), 304)
+        self.assertEqual(self.assertSameResponse(url, {'Range': 'bytes=0-9'}), 206)
+        self.assertEqual(self.assertSameResponse(url, {'Range': 'bytes=0-9'}, method='HEAD'), 206)
+        self.assertEqual(self.assertSameResponse('/thumbnails?ids=1,x'), 400)
+
+    def test_large_image(self):
+        url = f'/large/{self.preview_hash}'
+        self.assertEqual(self.assertSameResponse(url), 200)
+        self.assertEqual(self.assertSameResponse(url, {'If-None-Match': f'"{self.preview_hash}"'}), 304)
+        self.assertEqual(self.assertSameResponse(url, {'Range': 'bytes=100-199'}), 206)
+        self.assertEqual(self.assertSameResponse(url, {'Range': 'bytes=5000-'}), 416)
+        self.assertEqual(self.assertSameResponse(url, {'Range': 'bytes=0-9', 'If-Range': '"old"'}), 200)
+        self.assertEqual(self.assertSameResponse(f'{url}?size=123'), 400)
+        self.assertEqual(self.assertSameResponse(f'/large/{999:016x}'), 404)
+
+    def test_other_routes_are_passed_to_flask(self):
+        self.assertEqual(self.assertSameResponse('/api/images?limit=2'), 200)
+        self.assertEqual(self.assertSameResponse('/api/images?cursor=x'), 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import os
+import subprocess
+import sys
+import unittest
+
+import pytest
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend')
+sys.path.insert(0, BACKEND_DIR)
+
+import database  # noqa: E402
+from services import thumbpack  # noqa: E402
+from services.thumbpack import ThumbnailPack  # noqa: E402
+
+# Runs services/backfill.py as a script, with config pointing at the test database.
+# The backend directory is taken off sys.path again, so the script has to find it by itself.
+_RUN_SCRIPT = '''
+import runpy, sys
+backend_dir, db_path, pack_path = sys.argv[1:4]
+sys.path.insert(0, backend_dir)
+import config
+config.DB_PATH, config.THUMBNAIL_PACK_PATH = db_path, pack_path
+sys.path.remove(backend_dir)
+script = backend_dir + '/services/backfill.py'
+sys.argv = [script, '--compact']
+runpy.run_path(script, run_name='__main__')
+'''
+
+
+@pytest.mark.usefixtures('temp_database')
+class BackfillScriptTest(unittest.TestCase):
+    def test_script_backfills_metadata_and_moves_thumbnails(self):
+        import piexif
+
+        exif = piexif.dump({"Exif": {piexif.ExifIFD.DateTimeOriginal: "2021:06:01 12:00:00"}})
+        ids = database.add_sourcefiles((f"/photos/{i}.jpg", f"{i:016x}", None, exif) for i in range(3))
+        with database._get_db_connection() as conn:
+            # Rows as an older version left them: no indexed metadata, thumbnails as BLOBs
+            conn.execute('UPDATE sourcefiles SET metadata_version = 0, taken_at = NULL')
+            conn.executemany('UPDATE sourcefiles SET thumbnail = ? WHERE id = ?',
+                             ((b'thumbnail %d' % i, sourcefile_id) for i, sourcefile_id in enumerate(ids)))
+        database.close_db_connection()
+
+        subprocess.run([sys.executable, '-c', _RUN_SCRIPT, BACKEND_DIR, database.DB_PATH, thumbpack.THUMBNAIL_PACK_PATH],
+                       check=True, capture_output=True, timeout=120)
+
+        rows = database.list_sourcefiles(fields=('id', 'taken_at'))
+        self.assertEqual({row.taken_at for row in rows}, {'2021-06-01 12:00:00'})
+        self.assertEqual(database.get_thumbnail_blob_batch(0, 10), [])
+        pack = ThumbnailPack(thumbpack.THUMBNAIL_PACK_PATH)
+        for i in range(3):
+            self.assertEqual(bytes(pack.get(f"{i:016x}")), b'thumbnail %d' % i)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import hashlib
+import os
+import sys
+import unittest
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+import database  # noqa: E402
+
+
+def _all_ids():
+    with database._get_db_connection() as conn:
+        return [row[0] for row in conn.execute('SELECT id FROM sourcefiles ORDER BY id')]
+
+
+@pytest.mark.usefixtures('temp_database')
+class SourceFileBatchWriterTest(unittest.TestCase):
+    def _add(self, writer, names):
+        ids = []
+        for name in names:
+            image_hash = hashlib.blake2b(str(name).encode(), digest_size=8).hexdigest()
+            ids += writer.add(f"/photos/{name}.jpg", image_hash, b'thumbnail', None)
+        return ids
+
+    def test_returned_ids_are_the_rows_ids(self):
+        with database.SourceFileBatchWriter(batch_size=4) as writer:
+            ids = self._add(writer, range(10))
+            self.assertEqual(len(ids), 8)
+            ids += writer.flush()
+        self.assertEqual(ids, _all_ids())
+        self.assertEqual(writer.written_count, 10)
+
+    def test_ids_after_the_largest_rowid(self):
+        # Once the largest rowid is taken, SQLite picks unused rowids at random
+        with database._get_db_connection() as conn:
+            conn.execute("INSERT INTO sourcefiles (id, filename, image_hash) VALUES (?, '/photos/last.jpg', 'f')",
+                         (2 ** 63 - 1,))
+        with database.SourceFileBatchWriter(batch_size=100) as writer:
+            self._add(writer, range(5))
+            ids = writer.flush()
+        self.assertEqual(sorted(ids + [2 ** 63 - 1]), _all_ids())
+        files = {row.id: row.filename for row in database.list_sourcefiles(fields=('id', 'filename'))}
+        self.assertEqual([files[i] for i in ids], [f"/photos/{i}.jpg" for i in range(5)])
+
+    def test_failed_batch_is_raised_with_its_rows(self):
+        with database._get_db_connection() as conn:
+            conn.execute('''
+                CREATE TEMP TRIGGER reject_bad BEFORE INSERT ON sourcefiles
+                WHEN NEW.filename = '/photos/bad.jpg'
+                BEGIN SELECT RAISE(ABORT, 'rejected'); END
+            ''')
+        writer = database.SourceFileBatchWriter(batch_size=3)
+        self._add(writer, ['a'])
+        with self.assertRaises(database.BatchWriteError) as raised:
+            self._add(writer, ['bad', 'b'])
+        error = raised.exception
+        self.assertEqual(error.filenames, ['/photos/a.jpg', '/photos/bad.jpg', '/photos/b.jpg'])
+        self.assertIn('rejected', str(error))
+        # Nothing of the batch was written, and it is not retried by the next flush
+        self.assertEqual(_all_ids(), [])
+        self.assertEqual(writer.pending_count, 0)
+        self.assertEqual(writer.flush(), [])
+
+        # The rows can be added again
+        ids = []
+        for row in error.rows:
+            if row[0] != '/photos/bad.jpg':
+                ids += writer.add(*row)
+        ids += writer.flush()
+        self.assertEqual(ids, _all_ids())
+        self.assertEqual(len(ids), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
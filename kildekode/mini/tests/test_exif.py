@@ -0,0 +1,182 @@
+import io
+import itertools
+import os
+import struct
+import sys
+import unittest
+
+import piexif
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+from services import exif as exif_service  # noqa: E402
+
+REMOVABLE = ("thumbnail", "MakerNote", "UserComment")
+# Bytes per value of each TIFF field type that has to be byte-swapped
+_SWAP_SIZES = {3: 2, 4: 4, 5: 4, 8: 2, 9: 4, 10: 4, 11: 4, 12: 8}
+_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8}
+_SUB_IFD_POINTERS = (0x8769, 0x8825, 0xA005)
+# Offsets, which change when data before them is cut out
+_OFFSET_TAGS = (*_SUB_IFD_POINTERS, piexif.ImageIFD.JPEGInterchangeFormat)
+
+
+def _thumbnail_jpeg() -> bytes:
+    out = io.BytesIO()
+    Image.new('RGB', (16, 12), (200, 30, 30)).save(out, 'JPEG')
+    return out.getvalue()
+
+
+def _sample_exif(extra_0th: dict = None) -> bytes:
+    """Big-endian EXIF (piexif writes "MM") with IFD0, Exif, Interop, GPS and a 1st-IFD thumbnail."""
+    return piexif.dump({
+        "0th": {piexif.ImageIFD.Make: "Canon", piexif.ImageIFD.Model: "Canon EOS 5D",
+                piexif.ImageIFD.XResolution: (72, 1), piexif.ImageIFD.YResolution: (72, 1),
+                piexif.ImageIFD.Software: "firmware 1.0.0", **(extra_0th or {})},
+        "Exif": {piexif.ExifIFD.DateTimeOriginal: "2021:06:01 12:00:00",
+                 piexif.ExifIFD.ExposureTime: (1, 250), piexif.ExifIFD.FNumber: (28, 10),
+                 piexif.ExifIFD.ISOSpeedRatings: 400,
+                 # Odd length, so the cut is not a whole number of words
+                 piexif.ExifIFD.MakerNote: bytes(range(256)) + b"maker note",
+                 piexif.ExifIFD.UserComment: b"ASCII\x00\x00\x00" + b"a comment that does not fit inline",
+                 piexif.ExifIFD.LensModel: "EF 24-70mm f/2.8L"},
+        "Interop": {piexif.InteropIFD.InteroperabilityIndex: "R98"},
+        "GPS": {piexif.GPSIFD.GPSLatitudeRef: "N", piexif.GPSIFD.GPSLatitude: ((59, 1), (54, 1), (3012, 100)),
+                piexif.GPSIFD.GPSLongitudeRef: "E", piexif.GPSIFD.GPSLongitude: ((10, 1), (45, 1), (0, 1)),
+                piexif.GPSIFD.GPSMapDatum: "WGS-84"},
+        "1st": {piexif.ImageIFD.XResolution: (72, 1), piexif.ImageIFD.YResolution: (72, 1)},
+        "thumbnail": _thumbnail_jpeg(),
+    })
+
+
+def _to_little_endian(exif_data: bytes) -> bytes:
+    """Rewrites big-endian EXIF data as little-endian, keeping the layout."""
+    header = exif_data[:6]
+    data = bytearray(exif_data[6:])
+    data[:2] = b"II"
+    struct.pack_into("<HI", data, 2, *struct.unpack_from(">HI", data, 2))
+
+    def swap_ifd(offset: int, chained: bool):
+        count, = struct.unpack_from(">H", data, offset)
+        struct.pack_into("<H", data, offset, count)
+        for i in range(count):
+            position = offset + 2 + 12 * i
+            tag, field_type, value_count = struct.unpack_from(">HHI", data, position)
+            struct.pack_into("<HHI", data, position, tag, field_type, value_count)
+            size = _TYPE_SIZES[field_type] * value_count
+            if size > 4:
+                value_offset, = struct.unpack_from(">I", data, position + 8)
+                struct.pack_into("<I", data, position + 8, value_offset)
+            else:
+                value_offset = position + 8
+            width = _SWAP_SIZES.get(field_type)
+            if width:
+                for start in range(value_offset, value_offset + size, width):
+                    data[start:start + width] = data[start:start + width][::-1]
+            if tag in _SUB_IFD_POINTERS:
+                swap_ifd(struct.unpack_from("<I", data, position + 8)[0], chained=False)
+        if chained:
+            next_position = offset + 2 + 12 * count
+            next_offset, = struct.unpack_from(">I", data, next_position)
+            struct.pack_into("<I", data, next_position, next_offset)
+            if next_offset:
+                swap_ifd(next_offset, chained=True)
+
+    swap_ifd(struct.unpack_from("<I", data, 4)[0], chained=True)
+    return header + bytes(data)
+
+
+def _load(exif_data: bytes) -> dict:
+    """piexif.load without the offset tags."""
+    loaded = piexif.load(exif_data)
+    for name in ("0th", "Exif", "1st"):
+        for tag in _OFFSET_TAGS:
+            loaded[name].pop(tag, None)
+    return loaded
+
+
+def _expected_after_removing(exif_data: bytes, tags_to_remove) -> dict:
+    expected = _load(exif_data)
+    if "thumbnail" in tags_to_remove:
+        expected["1st"] = {}
+        expected["thumbnail"] = None
+    if "MakerNote" in tags_to_remove:
+        del expected["Exif"][piexif.ExifIFD.MakerNote]
+    if "UserComment" in tags_to_remove:
+        del expected["Exif"][piexif.ExifIFD.UserComment]
+    return expected
+
+
+class StripTagsTest(unittest.TestCase):
+    def test_little_endian_helper_keeps_the_tags(self):
+        big = _sample_exif()
+        little = _to_little_endian(big)
+        self.assertEqual(little[6:8], b"II")
+        self.assertEqual(piexif.load(little), piexif.load(big))
+
+    def test_round_trip_matches_piexif(self):
+        big = _sample_exif()
+        for byte_order, exif_data in (("big", big), ("little", _to_little_endian(big))):
+            for count in range(1, len(REMOVABLE) + 1):
+                for tags_to_remove in itertools.combinations(REMOVABLE, count):
+                    with self.subTest(byte_order=byte_order, removed=tags_to_remove):
+                        stripped = exif_service._strip_tags(exif_data, list(tags_to_remove))
+                        self.assertEqual(stripped[:8], exif_data[:8])
+                        self.assertLess(len(stripped), len(exif_data))
+                        self.assertEqual(_load(stripped), _expected_after_removing(exif_data, tags_to_remove))
+                        # What the importer reads from the stripped data is unchanged
+                        self.assertEqual(exif_service.parse_indexed_metadata(stripped),
+                                         exif_service.parse_indexed_metadata(exif_data))
+
+    def test_without_the_tags_the_data_is_returned_unchanged(self):
+        exif_data = piexif.dump({"0th": {piexif.ImageIFD.Make: "Canon"},
+                                 "Exif": {piexif.ExifIFD.DateTimeOriginal: "2021:06:01 12:00:00"}})
+        self.assertIs(exif_service._strip_tags(exif_data, list(REMOVABLE)), exif_data)
+
+    def test_without_exif_header(self):
+        exif_data = _to_little_endian(_sample_exif())
+        stripped = exif_service._strip_tags(exif_data[6:], ["MakerNote"])
+        self.assertEqual(_load(b"Exif\x00\x00" + stripped), _expected_after_removing(exif_data, ["MakerNote"]))
+
+
+class ExtractExifTest(unittest.TestCase):
+    def test_copies_the_ifds_without_the_thumbnail(self):
+        big = _sample_exif()
+        for byte_order, exif_data in (("big", big), ("little", _to_little_endian(big))):
+            with self.subTest(byte_order=byte_order):
+                extracted = exif_service.extract_exif(exif_service.TiffReader(exif_data))
+                self.assertEqual(extracted[6:8], exif_data[6:8])
+                self.assertEqual(_load(extracted), _expected_after_removing(exif_data, ["thumbnail"]))
+
+    def test_keeps_only_the_given_ifd0_tags(self):
+        extracted = exif_service.extract_exif(exif_service.TiffReader(_sample_exif()), {piexif.ImageIFD.Model})
+        expected = _expected_after_removing(_sample_exif(), ["thumbnail"])
+        expected["0th"] = {piexif.ImageIFD.Model: b"Canon EOS 5D"}
+        self.assertEqual(_load(extracted), expected)
+
+
+class CleanExifDataTest(unittest.TestCase):
+    def test_usual_layout_is_edited_in_place(self):
+        exif_data = _sample_exif()
+        with self.assertNoLogs(level='DEBUG'):
+            cleaned = exif_service.clean_exif_data(exif_data, list(REMOVABLE))
+        self.assertEqual(_load(cleaned), _expected_after_removing(exif_data, REMOVABLE))
+
+    def test_falls_back_to_piexif_for_sub_ifds(self):
+        # A SubIFDs pointer (as in RAW files) points at data the in-place editor does not move
+        big = _sample_exif({piexif.ImageIFD.SubIFDs: 0})
+        for byte_order, exif_data in (("big", big), ("little", _to_little_endian(big))):
+            with self.subTest(byte_order=byte_order):
+                with self.assertLogs(level='DEBUG') as logs:
+                    cleaned = exif_service.clean_exif_data(exif_data, ["MakerNote", "UserComment"])
+                self.assertIn("Falling back to piexif", logs.output[0])
+                self.assertEqual(_load(cleaned), _expected_after_removing(exif_data, ["MakerNote", "UserComment"]))
+
+    def test_invalid_data_is_returned_unchanged(self):
+        with self.assertLogs(level='WARNING'):
+            self.assertEqual(exif_service.clean_exif_data(b"not exif data", ["MakerNote"]), b"not exif data")
+        self.assertEqual(exif_service.clean_exif_data(b"", ["MakerNote"]), b"")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import os
+import random
+import sys
+import tempfile
+import unittest
+
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+import database  # noqa: E402
+from services import similarity  # noqa: E402
+from services.filescanning import import_photos  # noqa: E402
+
+
+def _write_photos(directory: str, count: int):
+    rng = random.Random(3)
+    for i in range(count):
+        img = Image.new('RGB', (64, 48))
+        img.putdata([(rng.randrange(256), rng.randrange(256), rng.randrange(256)) for _ in range(64 * 48)])
+        img.save(os.path.join(directory, f"{i}.jpg"), quality=90)
+
+
+@pytest.mark.usefixtures('temp_database')
+class NearDuplicateIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.photos = tempfile.TemporaryDirectory()
+        _write_photos(self.photos.name, 4)
+        self.saved_index = similarity._index
+        similarity._index = None
+
+    def tearDown(self):
+        if similarity._index is not None:
+            database.remove_change_listener(similarity._index.on_database_change)
+        similarity._index = self.saved_index
+        self.photos.cleanup()
+
+    def _import(self, **kwargs) -> int:
+        import_photos(self.photos.name, create_previews=False, **kwargs)
+        return database.count_sourcefiles()
+
+    def test_bloom_filter_import_does_not_build_the_index(self):
+        self.assertEqual(self._import(bloom_filter=True), 4)
+        self.assertIsNone(similarity._index)
+
+    def test_exact_import_checks_near_duplicates(self):
+        self.assertEqual(self._import(bloom_filter=False), 4)
+        self.assertIsNotNone(similarity._index)
+
+    def test_near_duplicates_can_be_turned_on_with_the_bloom_filter(self):
+        self.assertEqual(self._import(bloom_filter=True, near_duplicates=True), 4)
+        self.assertIsNotNone(similarity._index)
+
+
+if __name__ == '__main__':
+    unittest.main()
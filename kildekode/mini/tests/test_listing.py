@@ -0,0 +1,58 @@
+import os
+import sys
+import unittest
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+import database  # noqa: E402
+
+
+@pytest.mark.usefixtures('temp_database')
+class ListSourcefilesPageTest(unittest.TestCase):
+    def test_pages_cover_every_row_newest_first(self):
+        ids = database.add_sourcefiles((f"/photos/{i}.jpg", f"{i:016x}", None, None) for i in range(25))
+        seen = []
+        cursor = None
+        while True:
+            rows, cursor = database.list_sourcefiles_page(fields=('id',), limit=7, cursor=cursor)
+            seen += [row.id for row in rows]
+            if cursor is None:
+                break
+        self.assertEqual(seen, sorted(ids, reverse=True))
+
+    def test_invalid_cursors(self):
+        cursors = {
+            'not base64 JSON': 'not a cursor',
+            'not a list': 'e30',  # {}
+            'text key': database._encode_cursor(('5',)),
+            'two keys': database._encode_cursor((5, 6)),
+            'above 64 bits': database._encode_cursor((10 ** 30,)),
+            'below 64 bits': database._encode_cursor((-2 ** 63 - 1,)),
+            'boolean': database._encode_cursor((True,)),
+        }
+        for name, cursor in cursors.items():
+            with self.subTest(name):
+                with self.assertRaises(ValueError):
+                    database.list_sourcefiles_page(cursor=cursor)
+        # The largest SQLite integer is still a valid cursor
+        rows, _ = database.list_sourcefiles_page(cursor=database._encode_cursor((2 ** 63 - 1,)))
+        self.assertEqual(rows, [])
+
+    def test_query_rejects_cursors_sqlite_cannot_bind(self):
+        for key in ((10 ** 30,), ({'id': 5},)):
+            with self.subTest(key=key):
+                with self.assertRaises(ValueError):
+                    database.query(cursor=database._encode_cursor(key))
+
+    def test_images_api_answers_bad_cursors_with_400(self):
+        import gallery_app
+
+        client = gallery_app.app.test_client()
+        self.assertEqual(client.get(f'/api/images?cursor={database._encode_cursor((10 ** 30,))}').status_code, 400)
+        self.assertEqual(client.get(f'/api/images?cursor={database._encode_cursor((5,))}').status_code, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
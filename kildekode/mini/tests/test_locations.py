@@ -0,0 +1,84 @@
+import os
+import random
+import sys
+import unittest
+from collections import Counter
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+import database  # noqa: E402
+from services.exif import ImageMetadata  # noqa: E402
+
+
+def _indexed_ids():
+    with database._get_db_connection() as conn:
+        return {row[0] for row in conn.execute('SELECT id FROM sourcefiles_rtree')}
+
+
+@pytest.mark.usefixtures('temp_database')
+class LocationIndexTest(unittest.TestCase):
+    def _add_points(self, points):
+        ids = database.add_sourcefiles((f"/photos/{i}.jpg", f"{i:016x}", None, None) for i in range(len(points)))
+        database.set_indexed_metadata(
+            (sourcefile_id, ImageMetadata(None, lat, lon, None)) for sourcefile_id, (lat, lon) in zip(ids, points))
+        return ids
+
+    def test_index_follows_the_position_columns(self):
+        ids = database.add_sourcefiles((f"/photos/{i}.jpg", f"{i:016x}", None, None) for i in range(3))
+        self.assertEqual(_indexed_ids(), set())
+        # The metadata backfill fills the position columns of existing rows
+        database.set_indexed_metadata((sourcefile_id, ImageMetadata(None, 59.9, 10.7, None)) for sourcefile_id in ids)
+        self.assertEqual(_indexed_ids(), set(ids))
+        database.set_indexed_metadata([(ids[0], ImageMetadata())])
+        database.delete_sourcefile(ids[1])
+        self.assertEqual(_indexed_ids(), {ids[2]})
+        database.set_indexed_metadata([(ids[2], ImageMetadata(None, -33.9, 151.2, None))])
+        cluster, = database.cluster_locations((-90, -180, 90, 180), 10.0)
+        self.assertAlmostEqual(cluster.lat, -33.9, places=4)
+        self.assertAlmostEqual(cluster.lon, 151.2, places=4)
+
+    def test_clusters_match_a_python_grid(self):
+        rng = random.Random(1)
+        points = [(rng.uniform(58.0, 62.0), rng.uniform(5.0, 12.0)) for _ in range(500)]
+        ids = self._add_points(points)
+        bbox, cell_size = (59.0, 6.0, 61.0, 11.0), 0.5
+        expected = Counter(
+            (int((lat + 90) / cell_size), int((lon + 180) / cell_size)) for lat, lon in points
+            if bbox[0] <= lat <= bbox[2] and bbox[1] <= lon <= bbox[3])
+        clusters = database.cluster_locations(bbox, cell_size)
+        self.assertEqual(sorted(cluster.count for cluster in clusters), sorted(expected.values()))
+        for cluster in clusters:
+            self.assertIn(cluster.sourcefile_id, ids)
+            self.assertTrue(cluster.min_lat <= cluster.lat <= cluster.max_lat)
+            self.assertTrue(bbox[1] <= cluster.min_lon and cluster.max_lon <= bbox[3])
+
+    def test_bbox_across_the_antimeridian(self):
+        self._add_points([(0.0, 179.5), (0.0, -179.5), (0.0, 0.0)])
+        clusters = database.cluster_locations((-1.0, 179.0, 1.0, -179.0), 0.25)
+        self.assertEqual(sorted(round(cluster.lon, 1) for cluster in clusters), [-179.5, 179.5])
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            database.cluster_locations((61.0, 10.0, 59.0, 11.0), 1.0)
+        with self.assertRaises(ValueError):
+            database.cluster_locations((59.0, 10.0, 61.0, 11.0), 0)
+
+    def test_map_endpoint_bounds_the_markers_of_a_wide_view(self):
+        import gallery_app
+
+        rng = random.Random(2)
+        self._add_points([(rng.uniform(-80, 80), rng.uniform(-180, 180)) for _ in range(3000)])
+        client = gallery_app.app.test_client()
+        response = client.get('/api/map/clusters?bbox=-90,-180,90,180&zoom=22')
+        self.assertEqual(response.status_code, 200)
+        clusters = response.get_json()['clusters']
+        self.assertLessEqual(len(clusters), (gallery_app.MAX_MAP_CELLS_ACROSS + 1) ** 2)
+        self.assertLess(len(clusters), 3000)
+        self.assertEqual(sum(cluster['count'] for cluster in clusters), 3000)
+        self.assertEqual(client.get('/api/map/clusters?bbox=1,2,3&zoom=2').status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import itertools
+import os
+import sys
+import unittest
+
+import piexif
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+import database  # noqa: E402
+
+FILTERS = {
+    'date_range': ('2021-01-01', '2022-01-01'),
+    'bbox': (59.0, 10.0, 61.0, 11.0),
+    'camera': 'Canon EOS 5D',
+}
+ORDERS = ('-id', 'taken_at', '-taken_at')
+
+
+def _exif(make: str, model: str, taken_at: str, lat: float, lon: float) -> bytes:
+    def dms(value: float):
+        degrees = int(value)
+        minutes = int((value - degrees) * 60)
+        return (degrees, 1), (minutes, 1), (0, 1)
+
+    return piexif.dump({
+        "0th": {piexif.ImageIFD.Make: make, piexif.ImageIFD.Model: model},
+        "Exif": {piexif.ExifIFD.DateTimeOriginal: taken_at},
+        "GPS": {piexif.GPSIFD.GPSLatitudeRef: 'N', piexif.GPSIFD.GPSLatitude: dms(lat),
+                piexif.GPSIFD.GPSLongitudeRef: 'E', piexif.GPSIFD.GPSLongitude: dms(lon)},
+    })
+
+
+@pytest.fixture(scope='class')
+def photo_database(class_temp_database):
+    with database.SourceFileBatchWriter() as writer:
+        for i in range(60):
+            camera = ('Canon', 'Canon EOS 5D') if i % 3 else ('NIKON CORPORATION', 'NIKON D750')
+            taken_at = f"{2020 + i % 3}:{1 + i % 12:02d}:{1 + i % 28:02d} 12:00:00"
+            exif = _exif(*camera, taken_at, 58.5 + (i % 5) * 0.5, 10.5)
+            writer.add(f"/photos/{i}.jpg", f"{i:016x}", None, exif)
+        writer.add("/photos/no_exif.jpg", f"{999:016x}", None, None)
+
+
+@pytest.mark.usefixtures('photo_database')
+class QueryTest(unittest.TestCase):
+
+    def test_every_filter_combination_searches_an_index(self):
+        for order in ORDERS:
+            cursor = database._encode_cursor((30,) if order == '-id' else ('2021-06-01 12:00:00', 30))
+            for count in range(1, len(FILTERS) + 1):
+                for names in itertools.combinations(FILTERS, count):
+                    for page_cursor in (None, cursor):
+                        filters = {name: FILTERS[name] for name in names}
+                        with self.subTest(order=order, filters=names, cursor=bool(page_cursor)):
+                            plan = database.explain_query(order=order, cursor=page_cursor, **filters)
+                            self.assertTrue(plan[0].startswith('SEARCH sourcefiles USING'), plan)
+                            self.assertFalse(any(line.startswith('SCAN') for line in plan), plan)
+
+    def test_date_order_without_filters_uses_the_date_index(self):
+        for order in ('taken_at', '-taken_at'):
+            plan = database.explain_query(order=order)
+            self.assertIn('idx_taken_at', plan[0])
+            self.assertNotIn('TEMP B-TREE', ' '.join(plan))
+
+    def test_camera_is_parsed_from_make_and_model(self):
+        self.assertEqual(len(database.query(camera='Canon EOS 5D', limit=100)[0]), 40)
+        self.assertEqual(len(database.query(camera='NIKON D750', limit=100)[0]), 20)
+
+    def test_filters_match_a_python_filter_of_all_rows(self):
+        fields = ('id', 'taken_at', 'lat', 'lon', 'camera')
+        everything = database.list_sourcefiles(fields=fields)
+        rows, _ = database.query(fields=fields, limit=1000, **FILTERS)
+        expected = {
+            row.id for row in everything
+            if row.taken_at and '2021-01-01' <= row.taken_at < '2022-01-01'
+            and row.lat is not None and 59.0 <= row.lat <= 61.0 and 10.0 <= row.lon <= 11.0
+            and row.camera == 'Canon EOS 5D'
+        }
+        self.assertTrue(expected)
+        self.assertEqual({row.id for row in rows}, expected)
+
+    def test_pages_follow_the_order(self):
+        for order in ORDERS:
+            with self.subTest(order=order):
+                seen = []
+                cursor = None
+                while True:
+                    rows, cursor = database.query(order=order, cursor=cursor, limit=7, fields=('id', 'taken_at'))
+                    seen += rows
+                    if cursor is None:
+                        break
+                if order == '-id':
+                    self.assertEqual([row.id for row in seen], sorted((row.id for row in seen), reverse=True))
+                    self.assertEqual(len(seen), 61)
+                else:
+                    keys = [(row.taken_at, row.id) for row in seen]
+                    self.assertEqual(keys, sorted(keys, reverse=order.startswith('-')))
+                    # The row without a capture time is left out of the date orders
+                    self.assertEqual(len(seen), 60)
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            database.query(order='filename')
+        with self.assertRaises(ValueError):
+            database.query(order='taken_at', cursor=database._encode_cursor((5,)))
+        with self.assertRaises(ValueError):
+            database.query(bbox=(61.0, 10.0, 59.0, 11.0))
+        with self.assertRaises(ValueError):
+            database.query(limit=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
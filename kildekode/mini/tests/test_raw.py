@@ -0,0 +1,156 @@
+import io
+import os
+import random
+import struct
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import piexif
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+from services import exif as exif_service  # noqa: E402
+from services import filescanning, raw  # noqa: E402
+
+_ASCII, _SHORT, _LONG, _RATIONAL, _UNDEFINED = 2, 3, 4, 5, 7
+_FORMATS = {_ASCII: 's', _SHORT: 'H', _LONG: 'I', _UNDEFINED: 's'}
+# A lossless JPEG (SOF3) header, like the sensor data of a CR2 file
+_LOSSLESS_JPEG = b'\xff\xd8\xff\xc3\x00\x0b\x0c\x00\x10\x00\x10\x01\x01\x11\x00' + b'\x00' * 200_000
+
+
+def _jpeg(width: int, height: int) -> bytes:
+    rng = random.Random(width)
+    img = Image.new('RGB', (width, height))
+    img.putdata([(rng.randrange(256), rng.randrange(256), rng.randrange(256)) for _ in range(width * height)])
+    out = io.BytesIO()
+    img.save(out, 'JPEG', quality=90)
+    return out.getvalue()
+
+
+class _TiffBuilder:
+    """Writes a little-endian TIFF file. IFDs and data are appended, children before the IFDs that point at them."""
+
+    def __init__(self):
+        self.data = bytearray(b'II*\x00\x00\x00\x00\x00')
+
+    def blob(self, data: bytes) -> int:
+        offset = len(self.data)
+        self.data += data + b'\x00' * (len(data) % 2)
+        return offset
+
+    def ifd(self, entries, next_offset: int = 0) -> int:
+        encoded = []
+        for tag, field_type, value in sorted(entries):
+            if field_type == _RATIONAL:
+                raw_value, count = b''.join(struct.pack('<II', *pair) for pair in value), len(value)
+            elif field_type in (_ASCII, _UNDEFINED):
+                raw_value = value.encode() + b'\x00' if isinstance(value, str) else value
+                count = len(raw_value)
+            else:
+                values = value if isinstance(value, tuple) else (value,)
+                raw_value, count = struct.pack(f'<{len(values)}{_FORMATS[field_type]}', *values), len(values)
+            if len(raw_value) > 4:
+                raw_value = struct.pack('<I', self.blob(raw_value))
+            encoded.append(struct.pack('<HHI', tag, field_type, count) + raw_value.ljust(4, b'\x00'))
+        offset = len(self.data)
+        self.data += struct.pack('<H', len(encoded)) + b''.join(encoded) + struct.pack('<I', next_offset)
+        return offset
+
+    def finish(self, ifd0_offset: int) -> bytes:
+        struct.pack_into('<I', self.data, 4, ifd0_offset)
+        return bytes(self.data)
+
+
+def _cr2(strip_jpeg: bytes, sub_ifd_jpeg: bytes, thumbnail_jpeg: bytes) -> bytes:
+    """
+    A CR2-style file: a JPEG strip in IFD0, a JPEGInterchangeFormat preview in a SubIFD,
+    lossless sensor data in another SubIFD and a thumbnail in IFD1.
+    """
+    tiff = _TiffBuilder()
+    strip = tiff.blob(strip_jpeg)
+    sub_preview = tiff.blob(sub_ifd_jpeg)
+    sensor = tiff.blob(_LOSSLESS_JPEG)
+    thumbnail = tiff.blob(thumbnail_jpeg)
+    sub_ifds = (
+        tiff.ifd([(0x0103, _SHORT, 6), (0x0201, _LONG, sub_preview), (0x0202, _LONG, len(sub_ifd_jpeg))]),
+        tiff.ifd([(0x0103, _SHORT, 6), (0x0111, _LONG, sensor), (0x0117, _LONG, len(_LOSSLESS_JPEG))]),
+    )
+    exif = tiff.ifd([(0x9003, _ASCII, '2021:06:01 12:00:00'),
+                     (0x927C, _UNDEFINED, b'maker note with offsets into the file')])
+    gps = tiff.ifd([(1, _ASCII, 'N'), (2, _RATIONAL, ((59, 1), (54, 1), (0, 1))),
+                    (3, _ASCII, 'E'), (4, _RATIONAL, ((10, 1), (45, 1), (0, 1)))])
+    ifd1 = tiff.ifd([(0x0201, _LONG, thumbnail), (0x0202, _LONG, len(thumbnail_jpeg))])
+    ifd0 = tiff.ifd([
+        (0x0100, _LONG, 5472), (0x0101, _LONG, 3648), (0x0103, _SHORT, 6),
+        (0x010F, _ASCII, 'Canon'), (0x0110, _ASCII, 'Canon EOS 5D Mark IV'), (0x0112, _SHORT, 1),
+        (0x0111, _LONG, strip), (0x0117, _LONG, len(strip_jpeg)),
+        (0x014A, _LONG, sub_ifds), (0x8769, _LONG, exif), (0x8825, _LONG, gps),
+    ], next_offset=ifd1)
+    return tiff.finish(ifd0)
+
+
+class ExtractPreviewTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.small, self.medium, self.large = _jpeg(40, 30), _jpeg(120, 80), _jpeg(240, 160)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _write(self, data: bytes, name: str = 'photo.cr2') -> str:
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def _extract(self, data: bytes) -> raw.RawPreview:
+        with open(self._write(data), 'rb') as f:
+            return raw.extract_preview(f)
+
+    def test_largest_preview_is_chosen(self):
+        # The lossless sensor data is larger than both, but is not a preview
+        self.assertEqual(self._extract(_cr2(self.medium, self.large, self.small)).jpeg, self.large)
+        self.assertEqual(self._extract(_cr2(self.large, self.medium, self.small)).jpeg, self.large)
+        self.assertEqual(self._extract(_cr2(self.small, self.small, self.medium)).jpeg, self.medium)
+
+    def test_exif_keeps_descriptive_tags_only(self):
+        exif_data = self._extract(_cr2(self.large, self.medium, self.small)).exif_data
+        loaded = piexif.load(exif_data)
+        self.assertEqual(set(loaded['0th']), {piexif.ImageIFD.Make, piexif.ImageIFD.Model,
+                                              piexif.ImageIFD.Orientation, piexif.ImageIFD.ExifTag,
+                                              piexif.ImageIFD.GPSTag})
+        self.assertEqual(loaded['0th'][piexif.ImageIFD.Model], b'Canon EOS 5D Mark IV')
+        self.assertEqual(loaded['Exif'][piexif.ExifIFD.MakerNote], b'maker note with offsets into the file')
+        self.assertEqual(loaded['1st'], {})
+        self.assertIsNone(loaded['thumbnail'])
+        metadata = exif_service.parse_indexed_metadata(exif_data)
+        self.assertEqual(metadata.taken_at, '2021-06-01 12:00:00')
+        self.assertEqual(metadata.camera, 'Canon EOS 5D Mark IV')
+        self.assertAlmostEqual(metadata.lat, 59.9)
+        self.assertAlmostEqual(metadata.lon, 10.75)
+
+    def test_file_without_preview(self):
+        tiff = _TiffBuilder()
+        sensor = tiff.blob(_LOSSLESS_JPEG)
+        data = tiff.finish(tiff.ifd([(0x0103, _SHORT, 6), (0x0111, _LONG, sensor),
+                                     (0x0117, _LONG, len(_LOSSLESS_JPEG))]))
+        with self.assertRaises(ValueError):
+            self._extract(data)
+
+    def test_import_extracts_the_preview_once(self):
+        path = self._write(_cr2(self.medium, self.large, self.small))
+        jpeg_path = self._write(self.large, 'photo.jpg')
+        with mock.patch.object(raw, 'extract_preview', wraps=raw.extract_preview) as extract_preview:
+            processed = filescanning.process_image(path)
+        self.assertEqual(extract_preview.call_count, 1)
+        self.assertIsNotNone(processed.preview)
+        self.assertEqual(processed.metadata.camera, 'Canon EOS 5D Mark IV')
+        # The RAW file is imported as its embedded preview
+        self.assertEqual(processed.image_hash, filescanning.process_image(jpeg_path).image_hash)
+
+
+if __name__ == '__main__':
+    unittest.main()
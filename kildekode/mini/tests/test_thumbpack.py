@@ -0,0 +1,86 @@
+import os
+import sys
+import tempfile
+import tracemalloc
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+from services.thumbpack import ThumbnailPack, _RECORD_HEADER  # noqa: E402
+
+
+def _thumbnail(i: int, size: int = 1000) -> bytes:
+    return bytes([i % 256]) * size
+
+
+class ThumbnailPackTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'thumbnails.pack')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _fill(self, count: int, size: int = 1000) -> ThumbnailPack:
+        pack = ThumbnailPack(self.path)
+        pack.put_many((f"{i:016x}", _thumbnail(i, size)) for i in range(count))
+        pack.remove(f"{0:016x}")
+        return pack
+
+    def test_reopen_without_index(self):
+        self._fill(100)
+        self.assertFalse(os.path.exists(self.path + '.idx'))
+        pack = ThumbnailPack(self.path)
+        self.assertEqual(len(pack), 99)
+        self.assertIsNone(pack.get(f"{0:016x}"))
+        for i in range(1, 100):
+            self.assertEqual(bytes(pack.get(f"{i:016x}")), _thumbnail(i))
+
+    def test_reopen_with_index_and_later_appends(self):
+        pack = self._fill(50)
+        pack.save_index()
+        pack.put(f"{500:016x}", _thumbnail(500))
+        reopened = ThumbnailPack(self.path)
+        self.assertEqual(len(reopened), 50)
+        self.assertEqual(bytes(reopened.get(f"{500:016x}")), _thumbnail(500))
+
+    def test_scan_does_not_load_the_pack(self):
+        self._fill(200, size=50_000)
+        tracemalloc.start()
+        try:
+            pack = ThumbnailPack(self.path)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(len(pack), 199)
+        # The pack is 10 MB; the scan keeps only the offsets
+        self.assertLess(peak, 1_000_000)
+
+    def test_recovers_from_torn_tail(self):
+        self._fill(10)
+        intact_size = os.path.getsize(self.path)
+        with open(self.path, 'ab') as f:
+            # A record whose data was cut short by a crash
+            f.write(_RECORD_HEADER.pack(0xABCD, 1000) + b'x' * 10)
+        pack = ThumbnailPack(self.path)
+        self.assertEqual(len(pack), 9)
+        self.assertIsNone(pack.get(f"{0xABCD:016x}"))
+
+        pack.put(f"{20:016x}", _thumbnail(20))
+        self.assertEqual(os.path.getsize(self.path), intact_size + _RECORD_HEADER.size + 1000)
+        reopened = ThumbnailPack(self.path)
+        self.assertEqual(len(reopened), 10)
+        self.assertEqual(bytes(reopened.get(f"{20:016x}")), _thumbnail(20))
+        self.assertEqual(bytes(reopened.get(f"{9:016x}")), _thumbnail(9))
+
+    def test_compact_keeps_live_records(self):
+        pack = self._fill(20)
+        pack.put(f"{1:016x}", _thumbnail(99))
+        self.assertGreater(pack.compact(), 0)
+        reopened = ThumbnailPack(self.path)
+        self.assertEqual(len(reopened), 19)
+        self.assertEqual(bytes(reopened.get(f"{1:016x}")), _thumbnail(99))
+
+
+if __name__ == '__main__':
+    unittest.main()
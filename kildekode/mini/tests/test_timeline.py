@@ -0,0 +1,88 @@
+import os
+import random
+import sys
+import unittest
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+import database  # noqa: E402
+from services.exif import ImageMetadata  # noqa: E402
+
+GRANULARITIES = {'year': 4, 'month': 7, 'day': 10}
+
+
+def _random_time(rng: random.Random):
+    if rng.random() < 0.1:
+        return None
+    return f"{rng.randrange(2018, 2023)}-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d} 12:00:00"
+
+
+def _counted(length: int):
+    """The timeline counted from the sourcefiles table."""
+    with database._get_db_connection() as conn:
+        return [tuple(row) for row in conn.execute('''
+            SELECT substr(taken_at, 1, ?) AS bucket, COUNT(*) FROM sourcefiles
+            WHERE taken_at IS NOT NULL GROUP BY bucket ORDER BY bucket
+        ''', (length,))]
+
+
+@pytest.mark.usefixtures('temp_database')
+class TimelineTest(unittest.TestCase):
+    def assertTimelineMatchesTable(self):
+        for granularity, length in GRANULARITIES.items():
+            with self.subTest(granularity=granularity):
+                self.assertEqual(database.timeline(granularity), _counted(length))
+
+    def test_triggers_follow_inserts_updates_and_deletes(self):
+        rng = random.Random(4)
+        with database.SourceFileBatchWriter(batch_size=50) as writer:
+            for i in range(300):
+                writer.add(f"/photos/{i}.jpg", f"{i:016x}", None, None, metadata=ImageMetadata(_random_time(rng)))
+        ids = [row.id for row in database.list_sourcefiles(fields=('id',))]
+        self.assertTimelineMatchesTable()
+
+        # Moved capture times, including to and from no capture time
+        moved = rng.sample(ids, 120)
+        database.set_indexed_metadata((sourcefile_id, ImageMetadata(_random_time(rng))) for sourcefile_id in moved)
+        self.assertTimelineMatchesTable()
+
+        # Updates of other columns leave the timeline as it is
+        with database._get_db_connection() as conn:
+            conn.execute("UPDATE sourcefiles SET camera = 'Canon EOS 5D' WHERE id % 2 = 0")
+        self.assertTimelineMatchesTable()
+
+        for sourcefile_id in rng.sample(ids, 150):
+            database.delete_sourcefile(sourcefile_id)
+        self.assertTimelineMatchesTable()
+
+        # Buckets whose last photo is gone are removed
+        for sourcefile_id in [row.id for row in database.list_sourcefiles(fields=('id',))]:
+            database.delete_sourcefile(sourcefile_id)
+        self.assertEqual(database.timeline('day'), [])
+
+    def test_existing_database_is_counted_when_the_table_is_created(self):
+        rng = random.Random(5)
+        database.add_sourcefiles((f"/photos/{i}.jpg", f"{i:016x}", None, None) for i in range(100))
+        with database._get_db_connection() as conn:
+            conn.execute('DROP TABLE timeline')
+            for trigger in ('timeline_insert', 'timeline_delete', 'timeline_update'):
+                conn.execute(f'DROP TRIGGER {trigger}')
+            # Rows written while there was no timeline
+            conn.executemany('UPDATE sourcefiles SET taken_at = ? WHERE id = ?',
+                             ((_random_time(rng), i) for i in range(1, 101)))
+        database.init_db()
+        self.assertTimelineMatchesTable()
+
+    def test_date_range_selects_the_overlapping_buckets(self):
+        rng = random.Random(6)
+        database.set_indexed_metadata(
+            (sourcefile_id, ImageMetadata(_random_time(rng))) for sourcefile_id in
+            database.add_sourcefiles((f"/photos/{i}.jpg", f"{i:016x}", None, None) for i in range(200)))
+        expected = [(bucket, count) for bucket, count in _counted(7) if '2020-03' <= bucket <= '2021-06']
+        self.assertEqual(database.timeline('month', ('2020-03-15', '2021-07-01')), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()